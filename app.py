@@ -2,26 +2,35 @@
 
 import streamlit as st
 from pathlib import Path
+import functools
 import json
-import base64
-import fitz  # PyMuPDF
-import random
-import genanki
-import tempfile
-import os
+import hashlib
 
 import streamlit.components.v1 as components
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 from backend.fach_manager import get_all_faecher, create_fach, delete_fach
-from backend.pdf_parser import extract_text_from_pdf, extract_content_from_pdf
-try:
-    from backend import gpt_interface
-except Exception:
-    gpt_interface = None
-from backend.flashcard_manager import save_flashcard, get_flashcards, update_flashcards, delete_document
-from backend.storage_utils import get_image_as_data_url
-from supabase import create_client
-import urllib.parse
+from backend.flashcard_manager import update_flashcards, delete_document
+from backend.storage_utils import get_image_url
+from backend.image_derivatives import smallest_image_file
+from backend.document_store import add_document, document_path, list_documents
+from backend.generation import generate_document_cards, generate_mindmap_card, save_document_cards
+from backend.anki_export import export_anki_package, generate_anki_package
+from backend.export_jobs import start_bulk_export, get_job
+from backend.fach_backup import read_backup_info, restore_fach, upload_backup
+from backend.ingest_jobs import start_ingest, get_ingest_job
+from backend.search_index import ensure_indexed, search
+from backend.learning import select_next_card, upload_names, sidebar_entries, find_card_index
+from backend.study_mode import study_component, apply_ratings
+from backend import card_replica
+from backend.storage_backend import create_storage_client
+from backend.telemetry import document_run, span, document_costs, last_run_breakdown
+from backend.storage_metrics import begin_rerun, current_rerun, debug_enabled
+from backend.profiler import (
+    profiling_enabled, rerun_trigger, start_rerun_profile, get_profiles, merge_stacks, hotspots, folded_stacks,
+    flamegraph_html
+)
 import time
 import re
 import unicodedata
@@ -35,15 +44,9 @@ def _to_storage_safe_component(value: str) -> str:
     return value.strip("._") or "file"
 
 
-generate_mindmap_from_text = getattr(gpt_interface, "generate_mindmap_from_text", None) if gpt_interface else None
-analyze_image_for_flashcard_base64 = getattr(gpt_interface, "analyze_image_for_flashcard_base64", None) if gpt_interface else None
-
-
 # --- Setup Supabase client using secrets ---
-url = st.secrets["supabase"]["url"]
-key = st.secrets["supabase"]["key"]
 bucket_name = st.secrets["supabase"]["bucket"]
-supabase = create_client(url, key)
+supabase = create_storage_client()
 
 
 st.set_page_config(page_title="Merkwerk", layout="wide")
@@ -116,125 +119,777 @@ with col2:
         st.session_state.view_mode = 'Learning Studio'
         st.rerun()
 
+# Profiler page, only in profiler mode (?profile=1)
+if profiling_enabled() and st.sidebar.button("Profiler", icon=":material/speed:", type="tertiary"):
+    st.session_state.view_mode = 'Profiler'
+    st.rerun()
+
 # Use the view_mode from session state for the main content
 view_mode = st.session_state.view_mode
+begin_rerun(view_mode)
+if profiling_enabled() and view_mode != 'Profiler':
+    start_rerun_profile(view_mode, rerun_trigger())
+
+
+def measured_fragment(func=None, *, run_every=None):
+    """
+    st.fragment whose reruns of its own get their own storage metrics and, in
+    profiler mode, their own profile, like a full run. As part of a full run
+    the fragment is measured with the page.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            ctx = get_script_run_ctx()
+            if ctx is not None and ctx.fragment_ids_this_run:
+                view_mode = st.session_state.view_mode
+                begin_rerun(f"{view_mode}: {func.__name__}")
+                if profiling_enabled():
+                    start_rerun_profile(view_mode, f"Fragment {func.__name__}")
+            return func(*args, **kwargs)
+
+        return st.fragment(run, run_every=run_every)
+
+    return decorate(func) if func is not None else decorate
+
+def card_image_src(selected_fach, img_info):
+    """Image source for a card: a cacheable storage URL, or a data URL for legacy inline images."""
+    image_file = smallest_image_file(img_info, "display")
+    if image_file:
+        return get_image_url(selected_fach, image_file)
+    if img_info.get("base64"):
+        return f"data:image/png;base64,{img_info['base64']}"
+    return None
+
+
+def prefetch_card_images_html(selected_fach, cards, indices):
+    """
+    Hidden <img> tags for the upcoming cards, so the browser already has their
+    images in its HTTP cache when the card is flipped. Inline images are skipped.
+    """
+    tags = []
+    for idx in indices:
+        if idx < len(cards):
+            for img in cards[idx].get("images", [])[:1]:
+                image_file = smallest_image_file(img, "display")
+                if image_file:
+                    try:
+                        url = get_image_url(selected_fach, image_file)
+                    except Exception:
+                        continue
+                    tags.append(f'<img src="{url}" style="display: none;" alt="">')
+    return "".join(tags)
+
+
+def show_export_result(export):
+    """Download link and stats for a result of export_anki_package."""
+    if not export["url"]:
+        st.info("Keine neuen oder geänderten Karten seit dem letzten Export.")
+        return
+    st.link_button("Download Anki Deck (.apkg)", export["url"])
+    for warning in export["warnings"]:
+        st.warning(warning)
+    if export["cached"]:
+        st.caption(f"Export: {export['cards']} Karten, unverändert seit dem letzten Export ({export['seconds']:.1f} s)")
+    else:
+        st.caption(
+            f"Export: {export['cards']} Karten, {export['media']} Medien, "
+            f"{export['size'] / 1024 / 1024:.1f} MB in {export['seconds']:.1f} s"
+        )
+
 
-# ---------- Helper Function for Card Selection ----------
-def select_next_card(cards):
-    """Selects the next card index based on priority using weighted random selection."""
-    if not cards:
-        return 0  # Or handle appropriately
-
-    indices = list(range(len(cards)))
-    weights = []
-    for card in cards:
-        priority = card.get("priority", 2)  # Default to medium priority if missing
-        if priority == 1:  # Schwer
-            weights.append(5)
-        elif priority == 2:  # Mittel
-            weights.append(3)
-        else:  # Leicht (Priority 1 or other)
-            weights.append(1)
-
-    # Avoid showing the same card twice in a row if possible
-    last_index = st.session_state.get('last_shown_index', -1)
-    chosen_index = -1
-
-    # Try up to 10 times to get a different card than the last one
-    for _ in range(10):
-        if sum(weights) == 0:  # Handle case where all weights might be zero
-            chosen_index = random.choice(indices) if indices else 0
-            break
-        chosen_index = random.choices(indices, weights=weights, k=1)[0]
-        if len(cards) <= 1 or chosen_index != last_index:
-            break
+def show_generation_costs(selected_fach, file_name):
+    """Time, tokens and cost of the latest run of a document and of all documents in the fach."""
+    breakdown = last_run_breakdown(selected_fach, file_name)
+    if breakdown:
+        st.markdown(f"**Letzter Durchlauf für {file_name}**")
+        st.dataframe(breakdown, hide_index=True, use_container_width=True)
     else:
-        # Fallback if it keeps picking the same one
-        if indices:
-            chosen_index = random.choice(indices)
+        st.caption("Für dieses Dokument gibt es noch keine Messungen.")
+    costs = document_costs(selected_fach)
+    if costs:
+        st.markdown("**Alle Dokumente im Fach**")
+        st.dataframe(costs, hide_index=True, use_container_width=True)
+
+
+def show_storage_overlay():
+    """Storage calls of this rerun by caller, the slowest calls and the totals of earlier reruns."""
+    rerun = current_rerun()
+    if rerun is None:
+        return
+    with st.sidebar.expander("Speicherzugriffe (Debug)", expanded=True):
+        totals = rerun.totals()
+        st.caption(
+            f"Dieser Lauf: {totals['Aufrufe']} Aufrufe, {totals['Zeit (ms)']} ms, "
+            f"{totals['KB gelesen']} KB gelesen, {totals['KB geschrieben']} KB geschrieben"
+        )
+        st.dataframe(rerun.summary(), hide_index=True, use_container_width=True)
+        st.markdown("**Langsamste Aufrufe**")
+        st.dataframe(
+            [{"Aufrufer": op["caller"], "Operation": op["op"], "Pfad": op["path"], "ms": round(op["ms"], 1)}
+             for op in rerun.slowest()],
+            hide_index=True, use_container_width=True
+        )
+        history = list(st.session_state.get("storage_rerun_history", []))
+        if history:
+            st.markdown("**Vorherige Läufe**")
+            st.dataframe(history[::-1], hide_index=True, use_container_width=True)
+
+
+def show_profiler_page():
+    """Recorded rerun profiles by view and trigger, with hotspots and a flamegraph."""
+    st.markdown("#### Profile der letzten Läufe")
+    profiles = get_profiles()
+    if not profiles:
+        st.info("Noch keine Profile. Wechsle mit aktivem Profiler (?profile=1) in ein Studio und klicke dich durch.")
+        return
+
+    col1, col2 = st.columns(2)
+    view_options = sorted(set(p["view_mode"] for p in profiles))
+    profile_view = col1.selectbox("Ansicht", options=["Alle"] + view_options, key="profiler_view")
+    profiles = get_profiles(None if profile_view == "Alle" else profile_view)
+    trigger_options = sorted(set(p["trigger"] for p in profiles))
+    profile_trigger = col2.selectbox("Auslöser", options=["Alle"] + trigger_options, key="profiler_trigger")
+    profiles = get_profiles(None if profile_view == "Alle" else profile_view, None if profile_trigger == "Alle" else profile_trigger)
+
+    st.dataframe(
+        [{"Zeit": time.strftime("%H:%M:%S", time.localtime(p["started_at"])), "Ansicht": p["view_mode"],
+          "Auslöser": p["trigger"], "Dauer (s)": round(p["seconds"], 3), "Samples": p["samples"], "Profil": p["id"]}
+         for p in profiles],
+        hide_index=True, use_container_width=True
+    )
+    profile_ids = ["Alle zusammen"] + [p["id"] for p in profiles]
+    selected_profile = st.selectbox("Profil", options=profile_ids, key="profiler_selected")
+    selected = profiles if selected_profile == "Alle zusammen" else [p for p in profiles if p["id"] == selected_profile]
+    stacks = merge_stacks(selected)
+
+    self_rows, total_rows = hotspots(stacks, selected[0]["interval"])
+    col1, col2 = st.columns(2)
+    col1.markdown("**Eigenzeit**")
+    col1.dataframe(self_rows, hide_index=True, use_container_width=True)
+    col2.markdown("**Gesamtzeit (inkl. Aufrufe)**")
+    col2.dataframe(total_rows, hide_index=True, use_container_width=True)
+
+    st.markdown("**Flamegraph**")
+    components.html(flamegraph_html(stacks), height=420, scrolling=True)
+    st.download_button(
+        "Stacks herunterladen (folded, für speedscope/flamegraph.pl)",
+        data=folded_stacks(stacks), file_name=f"merkwerk-{selected_profile}.folded", mime="text/plain"
+    )
+
+
+def show_export_job(job):
+    """Per-fach status and download links of a bulk export job."""
+    for fach, entry in job["faecher"].items():
+        col1, col2 = st.columns([0.6, 0.4])
+        if entry["status"] == "fertig" and entry.get("url"):
+            col1.markdown(f"- {fach}: {entry['cards']} Karten")
+            col2.link_button("Download (.apkg)", entry["url"])
+            for warning in entry["warnings"]:
+                col1.caption(warning)
+        elif entry["status"] == "fertig":
+            col1.markdown(f"- {fach}: keine Karten")
+        elif entry["status"] == "fehler":
+            col1.markdown(f"- {fach}: Fehler – {entry.get('error')}")
+        else:
+            col1.markdown(f"- {fach}: {entry['status']} …")
+
+
+@measured_fragment(run_every=2)
+def poll_export_job(job_id):
+    """Refreshes only this part of the page until the job is done."""
+    job = get_job(job_id)
+    if job is None:
+        return
+    show_export_job(job)
+    if job["finished"]:
+        st.rerun()
+
+
+def backup_panel(selected_fach):
+    """Download a whole fach as one archive, or restore such an archive as a new fach."""
+    if selected_fach and st.button(f"Backup von {selected_fach} erstellen", key="create_backup",
+                                   type="tertiary", icon=":material/archive:"):
+        # The archive is built on disk and uploaded; the browser downloads it from storage
+        progress_bar = st.progress(0.0, text="Backup wird erstellt …")
+        try:
+            stats = upload_backup(selected_fach, progress=progress_bar.progress)
+        except Exception as e:
+            progress_bar.empty()
+            st.error(f"Backup fehlgeschlagen: {e}")
+        else:
+            progress_bar.empty()
+            st.link_button(
+                f"Backup herunterladen ({stats['cards']} Karten, {stats['objects']} Dateien)",
+                stats["url"], icon=":material/download:",
+            )
+
+    backup_upload = st.file_uploader("Backup wiederherstellen", type="zip", key="restore_backup_file")
+    if backup_upload is None:
+        return
+    info = read_backup_info(backup_upload)
+    if info is None:
+        st.error("Die Datei ist kein Merkwerk-Backup.")
+        return
+    st.caption(f"Backup von {info['fach']} mit {info['objects']} Dateien.")
+    target = st.text_input("Wiederherstellen als Fach", value=info["fach"], key="restore_backup_fach").strip()
+    if st.button("Wiederherstellen", key="restore_backup", type="tertiary", icon=":material/unarchive:",
+                 disabled=not target):
+        progress_bar = st.progress(0.0, text="Backup wird wiederhergestellt …")
+        try:
+            stats = restore_fach(backup_upload, target, progress=progress_bar.progress)
+        except Exception as e:
+            progress_bar.empty()
+            st.error(f"Wiederherstellung fehlgeschlagen: {e}")
+            return
+        progress_bar.empty()
+        cached_faecher.clear()
+        st.success(f"Fach '{target}' mit {stats['cards']} Karten wiederhergestellt.")
+
+
+def batch_upload_panel(selected_fach, uploaded_pdfs):
+    """Start the background processing of several uploaded PDFs (all pages, cards and mindmap)."""
+    st.caption(
+        f"{len(uploaded_pdfs)} PDFs ausgewählt. Alle Seiten werden verwendet; Seiten ausschließen "
+        "und Anki-Export gibt es danach für jedes Dokument einzeln."
+    )
+    if st.button(f"Alle {len(uploaded_pdfs)} PDFs verarbeiten", key="start_ingest", use_container_width=True,
+                 icon=":material/library_books:"):
+        st.session_state.ingest_job = start_ingest(
+            selected_fach, [(pdf.name, pdf.getvalue()) for pdf in uploaded_pdfs]
+        )
+
+
+INGEST_STATUS_LABELS = {
+    "wartend": "wartet",
+    "hochladen": "wird hochgeladen",
+    "rendern": "Seiten werden gerendert",
+    "karten": "Karten und Mindmap werden erstellt",
+    "speichern": "wird gespeichert",
+}
+
+
+def show_ingest_job(job):
+    """Per-document status and progress of a batch upload."""
+    st.markdown(f"**Batch-Upload in {job['fach']}**")
+    for file_name, entry in job["documents"].items():
+        if entry.get("duplicate_of"):
+            st.markdown(f"- {file_name}: identisch mit {entry['duplicate_of']}, {entry['cards']} Karten übernommen")
+        elif entry["status"] == "fertig":
+            st.markdown(f"- {file_name}: {entry['cards']} Karten")
+        elif entry["status"] == "fehler":
+            st.markdown(f"- {file_name}: Fehler – {entry.get('error')}")
+        elif entry["pages"]:
+            st.progress(
+                entry["pages_done"] / entry["pages"],
+                text=f"{file_name}: {INGEST_STATUS_LABELS[entry['status']]} ({entry['pages_done']}/{entry['pages']} Seiten)"
+            )
+        else:
+            st.markdown(f"- {file_name}: {INGEST_STATUS_LABELS[entry['status']]} …")
+        for error in entry["errors"]:
+            st.caption(f"  {error}")
+
+
+@measured_fragment(run_every=2)
+def poll_ingest_job(job_id):
+    """Refreshes only the batch progress until all documents are done."""
+    job = get_ingest_job(job_id)
+    if job is None:
+        return
+    show_ingest_job(job)
+    if job["finished"]:
+        cached_mindmap_files.clear()
+        st.rerun()
+
+
+def rerun_fragment():
+    """Rerun only the calling fragment; the whole page if it ran as part of a full run."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+# ---------- PDF cache for the Creator Studio ----------
+THUMBNAILS_PER_BATCH = 24
+
+
+def open_cached_pdf(storage_path):
+    """
+    Download and open a PDF once per session instead of on every rerun.
+    Only the most recently used file is kept. Returns (doc, content_hash).
+    """
+    import fitz  # PyMuPDF
+
+    cached = st.session_state.get("pdf_cache")
+    if not cached or cached["path"] != storage_path:
+        download_response = supabase.storage.from_(bucket_name).download(storage_path)
+        pdf_bytes = download_response if isinstance(download_response, bytes) else download_response.content
+        cached = {
+            "path": storage_path,
+            "hash": hashlib.sha256(pdf_bytes).hexdigest(),
+            "doc": fitz.open(stream=pdf_bytes, filetype="pdf"),
+        }
+        st.session_state.pdf_cache = cached
+    return cached["doc"], cached["hash"]
+
+
+@st.cache_data(max_entries=2000, show_spinner=False)
+def render_page_thumbnail(content_hash, page_number, _doc, width=180):
+    """Small PNG preview of a page; cached per PDF content hash, so it is rendered only once."""
+    import fitz  # PyMuPDF
+
+    page = _doc[page_number - 1]
+    zoom = width / page.rect.width
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes()
+
+
+def toggle_excluded_page(file_name, page_number):
+    excluded = st.session_state.excluded_pages.setdefault(file_name, [])
+    if page_number in excluded:
+        excluded.remove(page_number)
+    else:
+        excluded.append(page_number)
+        excluded.sort()
+
+
+def excluded_pages_grid(doc, content_hash, file_name):
+    """Thumbnail grid for picking excluded pages, rendered in batches as the user scrolls on."""
+    excluded = st.session_state.excluded_pages.setdefault(file_name, [])
+    shown_key = f"thumbnails_shown_{content_hash}"
+    shown = st.session_state.get(shown_key, THUMBNAILS_PER_BATCH)
+
+    columns_per_row = 6
+    page_numbers = list(range(1, min(shown, doc.page_count) + 1))
+    for i in range(0, len(page_numbers), columns_per_row):
+        cols = st.columns(columns_per_row)
+        for col, page_number in zip(cols, page_numbers[i:i + columns_per_row]):
+            col.image(render_page_thumbnail(content_hash, page_number, doc), use_container_width=True)
+            col.checkbox(
+                f"Seite {page_number} ausschließen",
+                value=page_number in excluded,
+                key=f"exclude_{content_hash}_{page_number}",
+                on_change=toggle_excluded_page,
+                args=(file_name, page_number),
+            )
 
-    st.session_state.last_shown_index = chosen_index
-    return chosen_index
+    if shown < doc.page_count:
+        if st.button(f"Weitere Seiten anzeigen ({shown} von {doc.page_count})", type="tertiary"):
+            st.session_state[shown_key] = shown + THUMBNAILS_PER_BATCH
+            rerun_fragment()
 
 
-def save_image_from_base64(base64_str, filename):
-    """Decode the base64 string and write it as a file."""
-    image_data = base64.b64decode(base64_str)
-    with open(filename, "wb") as f:
-        f.write(image_data)
-    return filename
+# Seconds between two redraws of a card that is still being written
+FEED_REDRAW_SECONDS = 0.2
 
 
-def save_mindmap_html(html_content, filename):
-    """Write the HTML content for the mindmap to disk."""
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html_content)
-    return filename
+def feed_card_markdown(page_number, card, writing=False):
+    """Question and bullets of a (possibly unfinished) card for the results feed."""
+    answer = card.get("answer") or []
+    if isinstance(answer, str):
+        answer = [answer]
+    lines = [f"**Seite {page_number}: {card.get('question') or '…'}**"] + [str(line) for line in answer]
+    if writing:
+        lines[-1] += " ▍"
+    return "  \n".join(lines)
 
 
-def generate_anki_package(deck_name, flashcards):
+@measured_fragment
+def generation_panel(selected_fach, file_name, doc, pdf_content_hash):
     """
-    Generate an Anki package (.apkg) from flashcards.
-    For flashcards with an 'image_base64', the image is saved and embedded.
-    For flashcards with 'mindmap': True, the mindmap HTML is embedded directly as a
-    data URL using an <iframe>.
+    Excluded pages, deck settings, card generation and its costs for one PDF.
+    A fragment, so picking pages or typing the deck name only reruns this panel.
     """
-    # Define a minimal Anki model.
-    my_model = genanki.Model(
-        1607392319,  # Unique model ID – change if necessary.
-        'Minimal Model',
-        fields=[{'name': 'Question'}, {'name': 'Answer'}],
-        templates=[{
-            'name': 'Card 1',
-            'qfmt': '{{Question}}',
-            'afmt': '{{FrontSide}}<hr>{{Answer}}',
-        }],
-        css="""
-/* Minimal styling */
-body { font-family: sans-serif; }
-"""
+    if 'excluded_pages' not in st.session_state:
+        st.session_state.excluded_pages = {}
+
+    with st.expander("Seiten komplett ausschließen (werden nicht in Lernkarten oder Mindmap verwendet)"):
+        excluded_pages_grid(doc, pdf_content_hash, file_name)
+    excluded_for_file = st.session_state.excluded_pages.get(file_name, [])
+    if excluded_for_file:
+        st.caption(f"Ausgeschlossene Seiten: {', '.join(str(p) for p in excluded_for_file)}")
+
+    if "deck_name" not in st.session_state:
+        st.session_state.deck_name = ""
+    st.session_state.deck_name = st.text_input(
+        "Bitte geben Sie den Namen des Anki-Decks ein:",
+        value=st.session_state.deck_name,
+        key="anki_deck_name"
     )
+    only_changed_export = st.checkbox(
+        "Nur neue und geänderte Karten seit dem letzten Export dieses Decks exportieren",
+        key="anki_only_changed"
+    )
+
+    if st.button("Lernkarten und Mindmap erstellen", key="create_all", use_container_width=True, icon=":material/article:"):
+        try:
+            # openai and the schemas are only loaded once cards are generated
+            from backend import gpt_interface  # noqa: F401
+        except Exception:
+            st.error("GPT-Funktionen konnten nicht geladen werden. Bitte prüfe backend/gpt_interface.py und den letzten Deploy.")
+            return
+        with st.spinner("Erstelle Lernkarten und Mindmap..."), document_run(selected_fach, file_name):
+            # ---------- Step 1: Generate New Flashcards (each page analyzed with BOTH text + image) ----------
+            new_flashcards = []
+            progress_bar = st.progress(0)
+            st.caption("Die Karten erscheinen hier, während sie geschrieben werden. Abbrechen lässt sich die Erstellung oben rechts mit „Stop“.")
+            feed = st.container(height=400)
+            feed_entries = {}
+            feed_redrawn = {}
+
+            def show_in_feed(page_number, markdown):
+                if page_number not in feed_entries:
+                    feed_entries[page_number] = feed.empty()
+                feed_entries[page_number].markdown(markdown)
+
+            def show_partial(page_number, card):
+                now = time.monotonic()
+                if now - feed_redrawn.get(page_number, 0) >= FEED_REDRAW_SECONDS:
+                    feed_redrawn[page_number] = now
+                    show_in_feed(page_number, feed_card_markdown(page_number, card, writing=True))
+
+            excluded_pages = st.session_state.excluded_pages.get(file_name, [])
+            pages = [
+                (page_num + 1, doc[page_num]) for page_num in range(doc.page_count)
+                if page_num + 1 not in excluded_pages
+            ]
+            # Analyze with BOTH inputs (text + image); text-heavy pages may share a request
+            for page_num_human, result in generate_document_cards(
+                selected_fach, file_name, pages, on_partial=show_partial
+            ):
+                if isinstance(result, json.JSONDecodeError):
+                    st.error(f"Fehler beim Parsen der JSON-Antwort für Seite {page_num_human}: {str(result)}")
+                    st.code(result.doc, language="json")
+                    show_in_feed(page_num_human, f":red[Seite {page_num_human}: keine Karte]")
+                elif isinstance(result, Exception):
+                    st.error(f"Fehler bei Seite {page_num_human}: {str(result)}")
+                    show_in_feed(page_num_human, f":red[Seite {page_num_human}: keine Karte]")
+                else:
+                    new_flashcards.append(result)
+                    show_in_feed(page_num_human, feed_card_markdown(page_num_human, result))
+
+                progress_bar.progress((page_num_human / doc.page_count) * 0.5)
+
+            export_flashcards = new_flashcards.copy()
+            progress_bar.progress(0.5)
+
+            # ---------- Step 2: Generate the Mindmap ----------
+            try:
+                mindmap_flashcard = generate_mindmap_card(doc, file_name, st.session_state.excluded_pages.get(file_name, []))
+                st.success("✅ Mindmap wurde erstellt!")
+
+                # ---------- Step 3: Add the Mindmap Flashcard and save ----------
+                export_flashcards.append(mindmap_flashcard)
+                save_document_cards(selected_fach, file_name, export_flashcards)
+
+                progress_bar.progress(1.0)
+
+            except Exception as e:
+                st.error(f"❌ Fehler beim Erstellen der Mindmap: {str(e)}")
+                progress_bar.progress(0.5)
+
+            # ---------- Step 4: Generate the APKG File ----------
+            if st.session_state.deck_name:
+                try:
+                    with span("export"):
+                        export = export_anki_package(
+                            selected_fach, st.session_state.deck_name, export_flashcards, only_changed=only_changed_export
+                        )
+                    show_export_result(export)
+                except Exception as e:
+                    # Storage not reachable: hand the package to the browser directly
+                    st.warning(f"Export in den Speicher fehlgeschlagen: {e}")
+                    st.download_button(
+                        label="Download Anki Deck (.apkg)",
+                        data=generate_anki_package(st.session_state.deck_name, export_flashcards, selected_fach),
+                        file_name=f"{st.session_state.deck_name}_flashcards.apkg",
+                        mime="application/octet-stream"
+                    )
+            else:
+                st.warning("Bitte geben Sie einen Namen für das Anki-Deck ein!")
+
+    with st.expander("Kosten & Laufzeiten"):
+        show_generation_costs(selected_fach, file_name)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_faecher():
+    """All fächer; cached briefly, cleared when a fach is created or deleted here."""
+    return get_all_faecher()
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_mindmap_files(safe_fach):
+    """Stored mindmap files of a fach (<fach>/mindmaps/)."""
+    try:
+        return supabase.storage.from_(bucket_name).list(f"{safe_fach}/mindmaps/") or []
+    except Exception:
+        return []
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cached_mindmap_html(mindmap_file_path):
+    """HTML of a stored mindmap, or None if there is none."""
+    try:
+        download_response = supabase.storage.from_(bucket_name).download(mindmap_file_path)
+    except Exception:
+        return None
+    if isinstance(download_response, bytes):
+        return download_response.decode("utf-8")
+    return download_response.content.decode("utf-8")
+
+
+def learning_generation(selected_fach, check_generation=False):
+    """
+    Generation of the local card replica the Learning Studio reads from. With
+    check_generation the replica is synced first: one listing, and a download
+    only if another write has moved the fach to a newer generation.
+    """
+    if check_generation or card_replica.replica_generation(selected_fach) is None:
+        return card_replica.sync_fach(selected_fach)
+    return card_replica.replica_generation(selected_fach)
+
+
+def open_search_hit(hit):
+    """Button callback: show the fach, upload and card of a search hit."""
+    st.session_state.learn_selected_fach = hit["fach"]
+    st.session_state.learn_selected_upload = hit["upload"]
+    st.session_state.learn_upload_select = hit["upload"]
+    st.session_state.jump_to_card = hit["card_id"]
+    st.session_state.revealed = False
+    st.session_state.editing_flashcard = False
+
+
+@measured_fragment
+def card_search(selected_fach, faecher):
+    """Search box over the cards of this fach or all fächer. Typing only reruns this box."""
+    col1, col2 = st.columns([0.8, 0.2])
+    query = col1.text_input(
+        "Karten suchen", key="card_search_query", placeholder="Karten suchen …", label_visibility="collapsed"
+    )
+    all_faecher = col2.toggle("Alle Fächer", key="card_search_all")
+    if not query.strip():
+        return
+    if all_faecher and not st.session_state.get("search_index_checked"):
+        # Other processes may have written fächer this one hasn't indexed yet
+        for fach in faecher:
+            ensure_indexed(fach)
+        st.session_state.search_index_checked = True
+
+    hits = search(query, None if all_faecher else selected_fach)
+    if not hits:
+        st.caption("Keine Treffer.")
+    for idx, hit in enumerate(hits):
+        page = f", S. {hit['page']}" if hit["page"] else ""
+        place = f"{hit['fach']}, {hit['upload']}" if all_faecher else hit["upload"]
+        if st.button(f"{hit['question']} ({place}{page})", key=f"search_hit_{idx}", type="tertiary",
+                     on_click=open_search_hit, args=(hit,)):
+            st.rerun()
 
-    deck = genanki.Deck(random.randint(1000000, 9999999), deck_name)
-    media_files = []  # This list will hold media filenames for images.
 
-    for idx, card in enumerate(flashcards):
-        question = card.get("question", "")
-        answer_raw = card.get("answer", "")
-        if isinstance(answer_raw, list):
-            answer_text = "<br>".join(answer_raw)
+@measured_fragment
+def learning_sidebar(cards_to_learn):
+    """Card navigator; call it inside `with st.sidebar:`. Picking a card reruns the page."""
+    st.markdown("##  Alle Karten")
+
+    for idx, (question_text, priority_help) in enumerate(sidebar_entries(cards_to_learn)):
+        if st.button(
+            question_text,
+            key=f"card_btn_{idx}",
+            use_container_width=True,
+            help=priority_help,
+            type="tertiary"
+        ):
+            st.session_state.current_card_index = idx
+            st.session_state.revealed = False
+            st.rerun()
+
+
+@measured_fragment
+def study_session(selected_fach, selected_upload):
+    """
+    Quick mode of the Learning Studio: the study component flips and rates the
+    cards in the browser and sends the ratings in batches, which are written
+    here with one update each.
+    """
+    learning_generation(selected_fach)
+    acknowledged = st.session_state.get("study_acknowledged", 0)
+    result = study_component(
+        selected_fach, selected_upload, acknowledged, key=f"study_{selected_fach}_{selected_upload}"
+    )
+    if not result or result["seq"] <= acknowledged:
+        return
+    if apply_ratings(selected_fach, result["ratings"]) is None:
+        st.error("Die Bewertungen konnten nicht gespeichert werden. Sie bleiben im Browser und werden erneut gesendet.")
+        return
+    st.session_state.study_acknowledged = result["seq"]
+    rerun_fragment()
+
+
+@measured_fragment
+def learning_card(selected_fach, selected_upload):
+    """
+    Controls, rating and the current card of the Learning Studio. A fragment:
+    flipping, rating and editing rerun only this part and read the cards from
+    the local replica instead of storage. Changes to the card list rerun the
+    whole page.
+    """
+    flashcards_generation = learning_generation(selected_fach)
+    cards_to_learn = card_replica.upload_cards(selected_fach, selected_upload)
+    if not cards_to_learn:
+        st.warning("Alle Karten für diesen Upload wurden gelöscht oder es gibt keine Karten mehr.")
+        return
+    if st.session_state.current_card_index >= len(cards_to_learn):
+        st.session_state.current_card_index = select_next_card(cards_to_learn)
+
+    current_card = cards_to_learn[st.session_state.current_card_index]
+
+    control_col, card_col = st.columns([1, 4])
+
+    with control_col:
+        st.markdown("### Steuerung")
+
+        if st.button("Umdrehen", key="flip_button", icon=":material/autorenew:", type="tertiary"):
+            st.session_state.revealed = not st.session_state.revealed
+            rerun_fragment()
+
+        if st.button("Bearbeiten", key="edit_flashcard", icon=":material/draw:", type="tertiary"):
+            st.session_state.editing_flashcard = True
+            rerun_fragment()
+
+        if st.button("Löschen", key="delete_flashcard", icon=":material/delete:", type="tertiary"):
+            flashcards_all = card_replica.all_cards(selected_fach)
+            original_index_to_delete = find_card_index(flashcards_all, current_card.get("id"))
+
+            if original_index_to_delete != -1:
+                del flashcards_all[original_index_to_delete]
+                update_flashcards(selected_fach, flashcards_all, base_generation=flashcards_generation)
+                st.success("Flashcard gelöscht!")
+
+                updated_cards_to_learn = card_replica.upload_cards(selected_fach, selected_upload)
+
+                st.session_state.revealed = False
+                st.session_state.editing_flashcard = False
+                st.session_state.current_card_index = select_next_card(updated_cards_to_learn)
+                st.rerun()
+            else:
+                st.error("Karte zum Löschen nicht gefunden.")
+
+        if st.session_state.revealed and not st.session_state.editing_flashcard:
+            st.markdown("### Bewertung")
+
+            rating_changed = False
+
+            if st.button("Schwer", key="p1", icon=":material/looks_one:", type="tertiary"):
+                current_card["priority"] = 1
+                rating_changed = True
+
+            if st.button("Mittel", key="p2", icon=":material/looks_two:", type="tertiary"):
+                current_card["priority"] = 2
+                rating_changed = True
+
+            if st.button("Leicht", key="p3", icon=":material/looks_3:", type="tertiary"):
+                current_card["priority"] = 3
+                rating_changed = True
+
+            if rating_changed:
+                flashcards_all = card_replica.all_cards(selected_fach)
+                rated_index = find_card_index(flashcards_all, current_card.get("id"))
+                if rated_index != -1:
+                    flashcards_all[rated_index] = current_card
+
+                update_flashcards(selected_fach, flashcards_all, base_generation=flashcards_generation)
+                st.session_state.revealed = False
+                st.session_state.current_card_index = select_next_card(cards_to_learn)
+                rerun_fragment()
+
+        st.markdown("### Info")
+        st.markdown(f"Datei: *{current_card.get('upload', 'Unbekannt')}*")
+        images_info = current_card.get('images', [])
+        if images_info:
+            st.markdown(f"Seite: {images_info[0].get('page', 'N/A')}")
         else:
-            answer_text = answer_raw
-
-        # Handle image flashcards: save image from base64 and embed it.
-        if "image_base64" in card:
-            image_filename = f"flashcard_{idx}_image.png"
-            save_image_from_base64(card["image_base64"], image_filename)
-            media_files.append(image_filename)
-            answer_text += f"<br><img src='{image_filename}' />"
-
-        # For mindmap flashcards, embed the HTML directly as a data URL.
-        if card.get("mindmap", False):
-            # Convert the entire mindmap HTML content into a base64-encoded data URL.
-            encoded_html = base64.b64encode(answer_text.encode("utf-8")).decode("utf-8")
-            answer_text = (
-                f"<iframe src='data:text/html;base64,{encoded_html}' "
-                f"width='100%' height='600px' frameborder='0'></iframe>"
+            if current_card.get('page'):
+                st.markdown(f"Seite: {current_card.get('page')}")
+        st.markdown(f"Priorität: {current_card.get('priority', 'N/A')}")
+        st.markdown(f"Karten: {st.session_state.current_card_index + 1} / {len(cards_to_learn)}")
+
+    with card_col:
+        if not st.session_state.editing_flashcard:
+            images = current_card.get('images', [])
+            img_info = images[0] if images else None
+
+            # Upcoming cards (and this card's own image before it is revealed)
+            # are loaded by the browser in the background
+            image_html = prefetch_card_images_html(
+                selected_fach,
+                cards_to_learn,
+                ([] if st.session_state.revealed else [st.session_state.current_card_index])
+                + st.session_state.get('upcoming_card_indices', [])
             )
+            if st.session_state.revealed and img_info:
+                try:
+                    image_src = card_image_src(selected_fach, img_info)
+                    if image_src:
+                        image_html += (
+                            f'<div class="flashcard-image" style="margin-top: 20px;">'
+                            f'<img src="{image_src}" style="max-width: 100%;">'
+                            f'<p style="text-align: center; font-style: italic;">Kontext (Seite {img_info.get("page", "N/A")})</p>'
+                            f'</div>'
+                        )
+                    else:
+                        image_html += "<div class='flashcard-image' style='margin-top: 20px;'>Kein Bild vorhanden.</div>"
+                except Exception as e:
+                    st.error(f"Error displaying image: {e}")
+
+            answer_list = current_card.get("answer", [])
+            if not isinstance(answer_list, list):
+                answer_list = [str(answer_list)]
+
+            st.markdown(f"""
+            <div class="flashcard" style="background-color: white; color: black; padding: 20px; border-radius: 8px;">
+                <div class="flashcard-question">
+                    <h3>Frage:</h3>
+                    <p>{current_card.get('question','')}</p>
+                </div>
+                {"<div class='flashcard-answer'><h3>Antwort:</h3>" + "".join(f"<li>{ans}</li>" for ans in answer_list) + "</div>" if st.session_state.revealed else ""}
+                {image_html}
+            </div>
+            """, unsafe_allow_html=True)
 
-        note = genanki.Note(
-            model=my_model,
-            fields=[question, answer_text]
-        )
-        deck.add_note(note)
+        else:
+            st.markdown("### Flashcard bearbeiten")
+            edit_key_suffix = f"_{st.session_state.current_card_index}"
+            new_question = st.text_input("Frage", value=current_card.get("question",""), key=f"edit_q{edit_key_suffix}")
+            new_answer_str = "\n".join(current_card.get("answer", [])) if isinstance(current_card.get("answer", []), list) else str(current_card.get("answer",""))
+            new_answer = st.text_area("Antwort (jede Zeile ein Punkt)", value=new_answer_str, height=150, key=f"edit_a{edit_key_suffix}")
+
+            col_save, col_cancel = st.columns(2)
+
+            if col_save.button("Speichern", key=f"save_edit{edit_key_suffix}", type="tertiary"):
+                updated_flashcard = current_card.copy()
+                updated_flashcard["question"] = new_question
+                updated_flashcard["answer"] = [line.strip() for line in new_answer.split("\n") if line.strip()]
+
+                flashcards_all = card_replica.all_cards(selected_fach)
+                original_index_to_update = find_card_index(flashcards_all, current_card.get("id"))
+
+                if original_index_to_update != -1:
+                    flashcards_all[original_index_to_update] = updated_flashcard
+                    update_flashcards(selected_fach, flashcards_all, base_generation=flashcards_generation)
+                    st.success("Flashcard aktualisiert!")
+                    st.session_state.editing_flashcard = False
+                    st.session_state.revealed = False
+                    st.rerun()
+                else:
+                    st.error("Originalkarte zum Aktualisieren nicht gefunden.")
 
-    package = genanki.Package(deck, media_files=media_files)
-    with tempfile.NamedTemporaryFile(suffix=".apkg", delete=False) as tmp:
-        package.write_to_file(tmp.name)
-        tmp.seek(0)
-        apkg_bytes = tmp.read()
-    os.unlink(tmp.name)
-    return apkg_bytes
+            if col_cancel.button("Abbrechen", key=f"cancel_edit{edit_key_suffix}", type="tertiary"):
+                st.session_state.editing_flashcard = False
+                try:
+                    rerun_fragment()
+                except AttributeError:
+                    st.warning("st.rerun() nicht verfügbar. Bitte aktualisieren Sie Streamlit.")
 
 
 if view_mode == "Creator Studio":
@@ -270,6 +925,7 @@ if view_mode == "Creator Studio":
                 if st.session_state.modal_fach_input.strip():
                     name = st.session_state.modal_fach_input.strip()
                     if create_fach(name):
+                        cached_faecher.clear()
                         st.session_state.last_created_fach = name
                         st.session_state.show_fach_modal = False
                         st.session_state.modal_fach_input = ""
@@ -282,7 +938,7 @@ if view_mode == "Creator Studio":
             )
 
     # Select existing Fach
-    faecher = get_all_faecher()
+    faecher = cached_faecher()
     if faecher:
         st.markdown("#### Fachauswahl")
 
@@ -317,17 +973,32 @@ if view_mode == "Creator Studio":
     if faecher and 'selected_fach' in locals():
         if st.button("Fach löschen", type="tertiary", icon=":material/delete:"):
             delete_fach(selected_fach)
-            faecher = get_all_faecher()
+            cached_faecher.clear()
             st.rerun()
 
+    # Export stored cards of existing fächer without regenerating them
+    if faecher:
+        with st.expander("Anki-Export bestehender Fächer"):
+            export_selection = st.multiselect("Fächer", options=faecher, default=faecher, key="bulk_export_faecher")
+            if st.button("Export starten", type="tertiary", icon=":material/download:", disabled=not export_selection):
+                st.session_state.bulk_export_job = start_bulk_export(export_selection)
+            job = get_job(st.session_state.bulk_export_job) if st.session_state.get("bulk_export_job") else None
+            if job and job["finished"]:
+                show_export_job(job)
+            elif job:
+                poll_export_job(job["id"])
+
+    # A whole fach as one archive, for backups and moving between storages
+    with st.expander("Backup und Wiederherstellung"):
+        backup_panel(selected_fach if faecher and 'selected_fach' in locals() else None)
+
     # Now continue with the rest of the content, but only if we have fächer
     if faecher and 'selected_fach' in locals():
         st.markdown("<br>", unsafe_allow_html=True)
         st.markdown("#### Hochgeladene PDFs")
 
         safe_fach = _to_storage_safe_component(selected_fach)
-        uploaded_files_resp = supabase.storage.from_(bucket_name).list(f"{safe_fach}/uploads/")
-        uploaded_files = [file["name"] for file in uploaded_files_resp if file["name"] != "placeholder.txt"]
+        uploaded_files = list_documents(selected_fach)
 
         if uploaded_files:
             col1, col2 = st.columns([0.8, 0.2])
@@ -341,9 +1012,7 @@ if view_mode == "Creator Studio":
 
             if selected_existing_file and st.session_state.get("uploaded_pdf") != selected_existing_file:
                 st.session_state.uploaded_pdf = selected_existing_file
-                safe_fach = _to_storage_safe_component(selected_fach)
-                st.session_state.selected_file_path = f"supabase://{bucket_name}/{safe_fach}/uploads/{selected_existing_file}"
-                st.session_state.uploaded_pdf_storage_name = selected_existing_file
+                st.session_state.selected_file_path = f"supabase://{bucket_name}/{document_path(selected_fach, selected_existing_file)}"
                 st.rerun()
 
             for f in uploaded_files:
@@ -351,6 +1020,9 @@ if view_mode == "Creator Studio":
                 col1.markdown(f"- {f}")
                 if col2.button("Dokument löschen", key=f"del_{f}", type="tertiary"):
                     delete_document(selected_fach, f)
+                    cached_mindmap_files.clear()
+                    cached_mindmap_html.clear()
+                    st.session_state.pop("pdf_cache", None)
                     st.rerun()
         else:
             st.info("Noch keine PDFs hochgeladen.")
@@ -358,7 +1030,16 @@ if view_mode == "Creator Studio":
         if "uploaded_files_tracker" not in st.session_state:
             st.session_state.uploaded_files_tracker = []
 
-        uploaded_pdf = st.file_uploader("PDF Upload", type="pdf")
+        uploaded_pdfs = st.file_uploader("PDF Upload", type="pdf", accept_multiple_files=True)
+        # A single PDF goes through page selection and generation below, several as a batch
+        uploaded_pdf = uploaded_pdfs[0] if len(uploaded_pdfs) == 1 else None
+        if len(uploaded_pdfs) > 1:
+            batch_upload_panel(selected_fach, uploaded_pdfs)
+        job = get_ingest_job(st.session_state.ingest_job) if st.session_state.get("ingest_job") else None
+        if job and job["finished"]:
+            show_ingest_job(job)
+        elif job:
+            poll_ingest_job(job["id"])
 
         st.markdown("---")
 
@@ -371,17 +1052,24 @@ if view_mode == "Creator Studio":
 
                 if st.session_state.get('uploaded_pdf') != uploaded_pdf.name:
                     file_name = uploaded_pdf.name
-                    safe_fach = _to_storage_safe_component(selected_fach)
-                    safe_file_name = _to_storage_safe_component(file_name)
-                    storage_file_path = f"{safe_fach}/uploads/{safe_file_name}"
-                    supabase.storage.from_(bucket_name).upload(
-                        storage_file_path,
-                        bytes(uploaded_pdf.getbuffer())
-                    )
-                    st.success(f"Datei '{file_name}' wurde in Supabase gespeichert im Fach '{selected_fach}'")
+                    upload_progress = st.progress(0.0, text=f"{file_name} wird hochgeladen …")
+                    try:
+                        stored = add_document(
+                            selected_fach, file_name, uploaded_pdf.getvalue(),
+                            progress=lambda fraction: upload_progress.progress(fraction, text=f"{file_name} wird hochgeladen …")
+                        )
+                    except Exception as e:
+                        # A resumable upload continues where it broke off on the next attempt
+                        st.error(f"Upload von '{file_name}' fehlgeschlagen: {e}")
+                        if st.button("Upload fortsetzen", key="retry_upload"):
+                            st.rerun()
+                        st.stop()
+                    if stored["duplicate_of"] and stored["duplicate_of"] != file_name:
+                        st.toast(f"'{file_name}' ist identisch mit '{stored['duplicate_of']}': {stored['cards']} Karten übernommen")
+                    else:
+                        st.success(f"Datei '{file_name}' wurde in Supabase gespeichert im Fach '{selected_fach}'")
                     st.session_state.uploaded_pdf = file_name
-                    st.session_state.uploaded_pdf_storage_name = safe_file_name
-                    st.session_state.selected_file_path = f"supabase://{bucket_name}/{storage_file_path}"
+                    st.session_state.selected_file_path = f"supabase://{bucket_name}/{stored['path']}"
                     st.rerun()
             else:
                 file_name = st.session_state.uploaded_pdf
@@ -402,174 +1090,13 @@ if view_mode == "Creator Studio":
                     st.error("No PDF available for processing.")
                     st.stop()
 
-            safe_fach = _to_storage_safe_component(selected_fach)
-            storage_file_name = st.session_state.get("uploaded_pdf_storage_name", file_name)
-            download_response = supabase.storage.from_(bucket_name).download(f"{safe_fach}/uploads/{storage_file_name}")
-            pdf_bytes = download_response if isinstance(download_response, bytes) else download_response.content
-
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            page_count = doc.page_count
-
-            if 'excluded_pages' not in st.session_state:
-                st.session_state.excluded_pages = {}
-
-            temp_excluded_pages = st.multiselect(
-                "Seiten komplett ausschließen (werden nicht in Lernkarten oder Mindmap verwendet):",
-                options=list(range(1, page_count + 1)),
-                default=st.session_state.excluded_pages.get(file_name, []),
-                key=f"excluded_pages_{file_name}"
-            )
-
-            st.session_state.excluded_pages[file_name] = temp_excluded_pages
-
-            if "deck_name" not in st.session_state:
-                st.session_state.deck_name = ""
-            st.session_state.deck_name = st.text_input(
-                "Bitte geben Sie den Namen des Anki-Decks ein:",
-                value=st.session_state.deck_name,
-                key="anki_deck_name"
-            )
-
-            if st.button("Lernkarten und Mindmap erstellen", key="create_all", use_container_width=True, icon=":material/article:"):
-                if analyze_image_for_flashcard_base64 is None or generate_mindmap_from_text is None:
-                    st.error("GPT-Funktionen konnten nicht geladen werden. Bitte prüfe backend/gpt_interface.py und den letzten Deploy.")
-                    st.stop()
-                with st.spinner("Erstelle Lernkarten und Mindmap..."):
-                    # ---------- Step 1: Generate New Flashcards (each page analyzed with BOTH text + image) ----------
-                    new_flashcards = []
-                    progress_bar = st.progress(0)
-
-                    for page_num in range(doc.page_count):
-                        page = doc[page_num]
-                        page_num_human = page_num + 1
-                        current_progress = ((page_num + 1) / doc.page_count) * 0.5
-
-                        if page_num_human in st.session_state.excluded_pages.get(file_name, []):
-                            progress_bar.progress(current_progress)
-                            continue
-
-                        try:
-                            # Render page image
-                            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-                            base64_image = base64.b64encode(pix.tobytes()).decode('utf-8')
-
-                            # Extract page text (same page)
-                            page_text = page.get_text("text") or ""
-
-                            # Analyze with BOTH inputs (text + image)
-                            gpt_output = analyze_image_for_flashcard_base64(
-                                base64_image=base64_image,
-                                upload_name=file_name,
-                                page_number=page_num_human,
-                                page_text=page_text
-                            )
-
-                            try:
-                                flashcard = json.loads(gpt_output)
-
-                                if "priority" not in flashcard:
-                                    flashcard["priority"] = 2
-
-                                # Keep current "image_base64" field for Anki export compatibility
-                                flashcard["image_base64"] = base64_image
-
-                                # ALSO store images[] structure for Learning Studio image rendering
-                                # (Learning Studio expects: current_card.get('images')[0].get('base64'))
-                                flashcard["images"] = [{"page": page_num_human, "base64": base64_image}]
-
-                                # Ensure page key exists for Learning Studio sidebar (your code uses card['page'])
-                                flashcard["page"] = page_num_human
-
-                                new_flashcards.append(flashcard)
-
-                            except json.JSONDecodeError as e:
-                                st.error(f"Fehler beim Parsen der JSON-Antwort für Seite {page_num_human}: {str(e)}")
-                                st.code(gpt_output, language="json")
-                            finally:
-                                # Pause to prevent rate limiting (your original behavior)
-                                time.sleep(20)
-
-                            progress_bar.progress(current_progress)
+            doc, pdf_content_hash = open_cached_pdf(document_path(selected_fach, file_name))
 
-                        except Exception as e:
-                            st.error(f"Fehler bei Seite {page_num_human}: {str(e)}")
-
-                    export_flashcards = new_flashcards.copy()
-                    progress_bar.progress(0.5)
-
-                    # ---------- Step 2: Generate the Mindmap ----------
-                    try:
-                        # Build full text from ALL non-excluded pages (robust; no dependency on pdf_parser)
-                        full_text_parts = []
-                        for page_num in range(doc.page_count):
-                            page_num_human = page_num + 1
-                            if page_num_human in st.session_state.excluded_pages.get(file_name, []):
-                                continue
-                            full_text_parts.append(doc[page_num].get_text("text") or "")
-                        full_text = "\n\n".join(full_text_parts)
-
-                        mindmap_json = generate_mindmap_from_text(full_text, file_name)
-                        mindmap_data = json.loads(mindmap_json)
-
-                        from pyvis.network import Network
-                        net = Network(height="600px", width="100%", directed=True, notebook=False)
-                        for node in mindmap_data["nodes"]:
-                            net.add_node(node, label=node)
-                        for edge in mindmap_data["edges"]:
-                            net.add_edge(edge[0], edge[1])
-
-                        mindmap_html = net.generate_html()
-
-                        custom_style = """
-<style>
-body {
-    background-color: #f0f0f0;
-    margin: 0;
-    padding: 10px;
-}
-* {
-    font-family: 'Calibri', sans-serif;
-}
-</style>
-"""
-                        mindmap_html = mindmap_html.replace("</head>", custom_style + "</head>")
-
-                        st.success("✅ Mindmap wurde erstellt!")
-
-                        # ---------- Step 3: Create a Mindmap Flashcard ----------
-                        mindmap_flashcard = {
-                            "upload": file_name,
-                            "question": f"Mindmap für {file_name}",
-                            "answer": mindmap_html,
-                            "mindmap": True,
-                            "page": None,
-                            "priority": 2
-                        }
-                        export_flashcards.append(mindmap_flashcard)
-
-                        update_flashcards(selected_fach, export_flashcards)
-
-                        progress_bar.progress(1.0)
-
-                    except Exception as e:
-                        st.error(f"❌ Fehler beim Erstellen der Mindmap: {str(e)}")
-                        progress_bar.progress(0.5)
-
-                    # ---------- Step 4: Generate the APKG File ----------
-                    if st.session_state.deck_name:
-                        apkg_bytes = generate_anki_package(st.session_state.deck_name, export_flashcards)
-                        st.download_button(
-                            label="Download Anki Deck (.apkg)",
-                            data=apkg_bytes,
-                            file_name=f"{st.session_state.deck_name}_flashcards.apkg",
-                            mime="application/octet-stream"
-                        )
-                    else:
-                        st.warning("Bitte geben Sie einen Namen für das Anki-Deck ein!")
+            generation_panel(selected_fach, file_name, doc, pdf_content_hash)
 
 
 elif view_mode == "Learning Studio":
-    faecher = get_all_faecher()
+    faecher = cached_faecher()
     if not faecher:
         st.warning("Bitte erstelle zuerst ein Fach im Creator Studio.")
     else:
@@ -599,7 +1126,8 @@ elif view_mode == "Learning Studio":
         selected_fach = st.session_state.learn_selected_fach
 
         if selected_fach:
-            flashcards_all = get_flashcards(selected_fach)
+            flashcards_generation = learning_generation(selected_fach, check_generation=True)
+            ensure_indexed(selected_fach, flashcards_generation)
 
             if "current_card_index" not in st.session_state:
                 st.session_state.current_card_index = 0
@@ -615,49 +1143,34 @@ elif view_mode == "Learning Studio":
                 st.session_state.learn_selected_upload = None
 
             st.markdown("<br>", unsafe_allow_html=True)
+            card_search(selected_fach, faecher)
 
-            upload_files = sorted(list(set(card.get("upload", "Unbekannt") for card in flashcards_all)))
-
-            try:
-                safe_fach = _to_storage_safe_component(selected_fach)
-                mindmap_files_resp = supabase.storage.from_(bucket_name).list(f"{safe_fach}/mindmaps/")
-            except Exception:
-                mindmap_files_resp = []
-
-            if mindmap_files_resp:
-                mindmap_basenames = []
-                for file in mindmap_files_resp:
-                    if file.get("name") == "placeholder.txt":
-                        continue
-                    base_name = file["name"].replace("_mindmap.html", ".pdf")
-                    mindmap_basenames.append(base_name)
-
-                for basename in mindmap_basenames:
-                    if basename not in upload_files:
-                        upload_files.append(basename)
-
-                upload_files = sorted(upload_files)
+            upload_files = sorted(
+                set(card_replica.uploads(selected_fach))
+                | set(upload_names([], cached_mindmap_files(_to_storage_safe_component(selected_fach))))
+            )
 
             if not upload_files:
                 st.warning("Keine Lernkarten oder Mindmaps in diesem Fach gefunden.")
             else:
                 selected_upload = st.selectbox("Wähle einen Upload zum Lernen:", upload_files, key="learn_upload_select")
+                priority_counts = card_replica.priority_counts(selected_fach, selected_upload)
+                if priority_counts:
+                    st.caption(" · ".join(
+                        f"{label}: {priority_counts.get(priority, 0)}"
+                        for priority, label in ((1, "Schwer"), (2, "Mittel"), (3, "Leicht"))
+                    ))
 
                 if selected_upload:
                     mindmap_filename = f"{selected_upload.split('.')[0]}_mindmap.html"
                     safe_fach = _to_storage_safe_component(selected_fach)
                     mindmap_file_path = f"{safe_fach}/mindmaps/{mindmap_filename}"
 
-                    try:
-                        download_response = supabase.storage.from_(bucket_name).download(mindmap_file_path)
-                        if isinstance(download_response, bytes):
-                            mindmap_html = download_response.decode("utf-8")
-                        else:
-                            mindmap_html = download_response.content.decode("utf-8")
-
+                    mindmap_html = cached_mindmap_html(mindmap_file_path)
+                    if mindmap_html is not None:
                         st.subheader("Mindmap")
                         components.html(mindmap_html, height=600)
-                    except Exception:
+                    else:
                         st.info("Keine Mindmap für dieses Dokument vorhanden. Erstelle eine im Creator Studio.")
 
                 fach_changed = st.session_state.learn_selected_fach != selected_fach
@@ -667,196 +1180,35 @@ elif view_mode == "Learning Studio":
                     st.session_state.revealed = False
                     st.session_state.editing_flashcard = False
                     st.session_state.last_shown_index = -1
+                    st.session_state.upcoming_card_indices = []
                     st.session_state.learn_selected_fach = selected_fach
                     st.session_state.learn_selected_upload = selected_upload
-                    cards_for_selection = [card for card in flashcards_all if card.get("upload", "Unbekannt") == selected_upload]
-                    st.session_state.current_card_index = select_next_card(cards_for_selection)
+                    st.session_state.current_card_index = select_next_card(card_replica.upload_cards(selected_fach, selected_upload))
                     st.rerun()
 
-                cards_for_selected_upload = [card for card in flashcards_all if card.get("upload", "Unbekannt") == selected_upload]
-
-                def get_page_number(card):
-                    images = card.get('images', [])
-                    if images and len(images) > 0:
-                        return images[0].get('page', float('inf'))
-                    return float('inf')
-
-                cards_to_learn = sorted(cards_for_selected_upload, key=get_page_number)
+                cards_to_learn = card_replica.upload_cards(selected_fach, selected_upload)
 
                 if not cards_to_learn:
                     st.warning(f"Keine Lernkarten für den Upload '{selected_upload}' gefunden.")
                     st.stop()
 
-                if st.session_state.current_card_index >= len(cards_to_learn):
-                    st.session_state.current_card_index = select_next_card(cards_to_learn)
-                    if not cards_to_learn:
-                        st.warning("Alle Karten für diesen Upload wurden gelöscht oder es gibt keine Karten mehr.")
-                        st.stop()
-
-                st.sidebar.markdown("##  Alle Karten")
-
-                for idx, card in enumerate(cards_to_learn):
-                    page_info = card.get('page')
-                    page_num = f"{page_info}  " if page_info else ""
-                    question_text = f"{page_num}{card.get('question','')}"
-                    priority = card.get('priority', 1)
-
-                    if st.sidebar.button(
-                        question_text,
-                        key=f"card_btn_{idx}",
-                        use_container_width=True,
-                        help=f"Priority: {priority}",
-                        type="tertiary"
-                    ):
-                        st.session_state.current_card_index = idx
-                        st.session_state.revealed = False
-                        st.rerun()
-
-                current_card = cards_to_learn[st.session_state.current_card_index]
-
-                control_col, card_col = st.columns([1, 4])
-
-                with control_col:
-                    st.markdown("### Steuerung")
-
-                    if st.button("Umdrehen", key="flip_button", icon=":material/autorenew:", type="tertiary"):
-                        st.session_state.revealed = not st.session_state.revealed
-                        st.rerun()
-
-                    if st.button("Bearbeiten", key="edit_flashcard", icon=":material/draw:", type="tertiary"):
-                        st.session_state.editing_flashcard = True
-                        st.rerun()
-
-                    if st.button("Löschen", key="delete_flashcard", icon=":material/delete:", type="tertiary"):
-                        original_index_to_delete = -1
-                        for idx, card in enumerate(flashcards_all):
-                            if card.get("upload", "Unbekannt") == selected_upload and card.get("question") == current_card.get("question") and card.get("answer") == current_card.get("answer"):
-                                original_index_to_delete = idx
-                                break
+                jump_to_card = st.session_state.pop("jump_to_card", None)
+                if jump_to_card is not None and find_card_index(cards_to_learn, jump_to_card) >= 0:
+                    st.session_state.current_card_index = find_card_index(cards_to_learn, jump_to_card)
 
-                        if original_index_to_delete != -1:
-                            del flashcards_all[original_index_to_delete]
-                            update_flashcards(selected_fach, flashcards_all)
-                            st.success("Flashcard gelöscht!")
-
-                            updated_cards_to_learn = [card for card in flashcards_all if card.get("upload", "Unbekannt") == selected_upload]
-
-                            st.session_state.revealed = False
-                            st.session_state.editing_flashcard = False
-                            st.session_state.current_card_index = select_next_card(updated_cards_to_learn)
-                            st.rerun()
-                        else:
-                            st.error("Karte zum Löschen nicht gefunden.")
-
-                    if st.session_state.revealed and not st.session_state.editing_flashcard:
-                        st.markdown("### Bewertung")
-
-                        rating_changed = False
-
-                        if st.button("Schwer", key="p1", icon=":material/looks_one:", type="tertiary"):
-                            current_card["priority"] = 1
-                            rating_changed = True
-
-                        if st.button("Mittel", key="p2", icon=":material/looks_two:", type="tertiary"):
-                            current_card["priority"] = 2
-                            rating_changed = True
-
-                        if st.button("Leicht", key="p3", icon=":material/looks_3:", type="tertiary"):
-                            current_card["priority"] = 3
-                            rating_changed = True
+                if st.toggle("Schnellmodus (offline im Browser)", key="study_mode",
+                             help="Umdrehen und Bewerten ohne Wartezeit; Bewertungen werden gesammelt gespeichert."):
+                    study_session(selected_fach, selected_upload)
+                else:
+                    with st.sidebar:
+                        learning_sidebar(cards_to_learn)
 
-                        if rating_changed:
-                            for idx, card in enumerate(flashcards_all):
-                                if card.get("upload", "Unbekannt") == selected_upload and card.get("question") == current_card.get("question") and card.get("answer") == current_card.get("answer"):
-                                    flashcards_all[idx] = current_card
-                                    break
+                    learning_card(selected_fach, selected_upload)
 
-                            update_flashcards(selected_fach, flashcards_all)
-                            st.session_state.revealed = False
-                            st.session_state.current_card_index = select_next_card(cards_to_learn)
-                            st.rerun()
+elif view_mode == "Profiler":
+    show_profiler_page()
 
-                    st.markdown("### Info")
-                    st.markdown(f"Datei: *{current_card.get('upload', 'Unbekannt')}*")
-                    images_info = current_card.get('images', [])
-                    if images_info:
-                        st.markdown(f"Seite: {images_info[0].get('page', 'N/A')}")
-                    else:
-                        if current_card.get('page'):
-                            st.markdown(f"Seite: {current_card.get('page')}")
-                    st.markdown(f"Priorität: {current_card.get('priority', 'N/A')}")
-                    st.markdown(f"Karten: {st.session_state.current_card_index + 1} / {len(cards_to_learn)}")
-
-                with card_col:
-                    if not st.session_state.editing_flashcard:
-                        images = current_card.get('images', [])
-                        img_info = images[0] if images else None
-
-                        image_html = ""
-                        if st.session_state.revealed and img_info:
-                            try:
-                                base64_img = img_info.get("base64")
-                                if base64_img:
-                                    data_url = f"data:image/png;base64,{base64_img}"
-                                    image_html = (
-                                        f'<div class="flashcard-image" style="margin-top: 20px;">'
-                                        f'<img src="{data_url}" style="max-width: 100%;">'
-                                        f'<p style="text-align: center; font-style: italic;">Kontext (Seite {img_info.get("page", "N/A")})</p>'
-                                        f'</div>'
-                                    )
-                                else:
-                                    image_html = "<div class='flashcard-image' style='margin-top: 20px;'>Kein Bild vorhanden.</div>"
-                            except Exception as e:
-                                st.error(f"Error displaying image: {e}")
-
-                        answer_list = current_card.get("answer", [])
-                        if not isinstance(answer_list, list):
-                            answer_list = [str(answer_list)]
-
-                        st.markdown(f"""
-                        <div class="flashcard" style="background-color: white; color: black; padding: 20px; border-radius: 8px;">
-                            <div class="flashcard-question">
-                                <h3>Frage:</h3>
-                                <p>{current_card.get('question','')}</p>
-                            </div>
-                            {"<div class='flashcard-answer'><h3>Antwort:</h3>" + "".join(f"<li>{ans}</li>" for ans in answer_list) + "</div>" if st.session_state.revealed else ""}
-                            {image_html}
-                        </div>
-                        """, unsafe_allow_html=True)
 
-                    else:
-                        st.markdown("### Flashcard bearbeiten")
-                        edit_key_suffix = f"_{st.session_state.current_card_index}"
-                        new_question = st.text_input("Frage", value=current_card.get("question",""), key=f"edit_q{edit_key_suffix}")
-                        new_answer_str = "\n".join(current_card.get("answer", [])) if isinstance(current_card.get("answer", []), list) else str(current_card.get("answer",""))
-                        new_answer = st.text_area("Antwort (jede Zeile ein Punkt)", value=new_answer_str, height=150, key=f"edit_a{edit_key_suffix}")
-
-                        col_save, col_cancel = st.columns(2)
-
-                        if col_save.button("Speichern", key=f"save_edit{edit_key_suffix}", type="tertiary"):
-                            updated_flashcard = current_card.copy()
-                            updated_flashcard["question"] = new_question
-                            updated_flashcard["answer"] = [line.strip() for line in new_answer.split("\n") if line.strip()]
-
-                            original_index_to_update = None
-                            for idx, card in enumerate(flashcards_all):
-                                if card is current_card:
-                                    original_index_to_update = idx
-                                    break
-
-                            if original_index_to_update is not None:
-                                flashcards_all[original_index_to_update] = updated_flashcard
-                                update_flashcards(selected_fach, flashcards_all)
-                                st.success("Flashcard aktualisiert!")
-                                st.session_state.editing_flashcard = False
-                                st.session_state.revealed = False
-                                st.rerun()
-                            else:
-                                st.error("Originalkarte zum Aktualisieren nicht gefunden.")
-
-                        if col_cancel.button("Abbrechen", key=f"cancel_edit{edit_key_suffix}", type="tertiary"):
-                            st.session_state.editing_flashcard = False
-                            try:
-                                st.rerun()
-                            except AttributeError:
-                                st.warning("st.rerun() nicht verfügbar. Bitte aktualisieren Sie Streamlit.")
+# ---------- Storage debug overlay (?debug=storage) ----------
+if debug_enabled():
+    show_storage_overlay()
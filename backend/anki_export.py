@@ -0,0 +1,262 @@
+# backend/anki_export.py
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import streamlit as st
+
+from backend.storage_utils import _get_supabase, _to_storage_safe_component, get_image_bytes
+
+# Download links to exported packages stay valid for a day
+EXPORT_URL_TTL = 24 * 3600
+# Part of every package's content hash; bump when the package layout changes
+EXPORT_FORMAT = 2
+# Card fields that are learning state only and don't end up in the package
+_NOT_EXPORTED_FIELDS = {"priority"}
+
+_anki_model = None
+
+
+def _get_anki_model():
+    """The note model of all exported decks; genanki is only imported once something is exported."""
+    global _anki_model
+    if _anki_model is None:
+        import genanki
+
+        _anki_model = genanki.Model(
+            1607392319,  # Unique model ID – change if necessary.
+            'Minimal Model',
+            fields=[{'name': 'Question'}, {'name': 'Answer'}],
+            templates=[{
+                'name': 'Card 1',
+                'qfmt': '{{Question}}',
+                'afmt': '{{FrontSide}}<hr>{{Answer}}',
+            }],
+            css="""
+/* Minimal styling */
+body { font-family: sans-serif; }
+"""
+        )
+    return _anki_model
+
+
+class _MediaDir:
+    """Writes media files into the export directory, named by content hash so duplicates are stored once."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.files = {}
+
+    def add(self, data, suffix):
+        filename = f"{hashlib.sha256(data).hexdigest()[:24]}{suffix}"
+        if filename not in self.files:
+            path = self.directory / filename
+            path.write_bytes(data)
+            self.files[filename] = str(path)
+        return filename
+
+
+def deck_id_for(selected_fach, deck_name):
+    """Stable Anki deck id, so re-importing a deck updates it instead of creating a copy."""
+    digest = hashlib.sha256(f"{_to_storage_safe_component(selected_fach or '')}|{deck_name}".encode("utf-8")).digest()
+    return (1 << 30) + int.from_bytes(digest[:4], "big") % (1 << 30)
+
+
+def note_guid_for(selected_fach, card):
+    """Stable Anki note GUID derived from fach, upload and card id."""
+    import genanki
+
+    return genanki.guid_for(
+        _to_storage_safe_component(selected_fach or ''),
+        card.get("upload", "Unbekannt"),
+        card.get("id") or card.get("question", ""),
+    )
+
+
+def _card_export_hash(card):
+    exported = {k: v for k, v in card.items() if k not in _NOT_EXPORTED_FIELDS}
+    return hashlib.sha256(json.dumps(exported, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _package_hash(deck_name, card_hashes):
+    content = json.dumps([EXPORT_FORMAT, deck_name, sorted(card_hashes.items())], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _card_image_bytes(card, selected_fach):
+    if card.get("image_base64"):
+        return base64.b64decode(card["image_base64"])
+    images = card.get("images") or []
+    if images:
+        if images[0].get("base64"):
+            return base64.b64decode(images[0]["base64"])
+        if images[0].get("file") and selected_fach:
+            # Full-resolution original, served from the image cache where possible
+            return get_image_bytes(selected_fach, images[0]["file"])
+    return None
+
+
+@contextmanager
+def anki_package_file(deck_name, flashcards, selected_fach=None):
+    """
+    Build an Anki package (.apkg) in a private temporary directory and yield
+    a dict with its "path", "size" (bytes), "seconds", "cards" and "media" count,
+    and "warnings" for images that couldn't be added. The directory, including
+    the package, is removed when the block exits.
+
+    Images are taken from 'image_base64', an inline images[] entry or, with
+    selected_fach, the stored page image. They and mindmap HTML pages are
+    added as media files, each distinct file only once.
+    """
+    import genanki
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="merkwerk-export-") as export_dir:
+        media = _MediaDir(export_dir)
+        warnings = []
+        deck = genanki.Deck(deck_id_for(selected_fach, deck_name), deck_name)
+
+        for card in flashcards:
+            question = card.get("question", "")
+            answer_raw = card.get("answer", "")
+            if isinstance(answer_raw, list):
+                answer_text = "<br>".join(answer_raw)
+            else:
+                answer_text = answer_raw
+
+            # For mindmap flashcards, ship the HTML as a media file and show it in an <iframe>.
+            if card.get("mindmap", False):
+                mindmap_file = media.add(answer_text.encode("utf-8"), ".html")
+                answer_text = (
+                    f"<iframe src='{mindmap_file}' "
+                    f"width='100%' height='600px' frameborder='0'></iframe>"
+                )
+            else:
+                try:
+                    image_bytes = _card_image_bytes(card, selected_fach)
+                except Exception as e:
+                    warnings.append(f"Bild für '{question}' konnte nicht exportiert werden: {e}")
+                    image_bytes = None
+                if image_bytes:
+                    answer_text += f"<br><img src='{media.add(image_bytes, '.png')}' />"
+
+            deck.add_note(genanki.Note(
+                model=_get_anki_model(),
+                fields=[question, answer_text],
+                guid=note_guid_for(selected_fach, card),
+            ))
+
+        package_path = os.path.join(export_dir, "deck.apkg")
+        genanki.Package(deck, media_files=list(media.files.values())).write_to_file(package_path)
+
+        yield {
+            "path": package_path,
+            "size": os.path.getsize(package_path),
+            "seconds": time.perf_counter() - started,
+            "cards": len(flashcards),
+            "media": len(media.files),
+            "warnings": warnings,
+        }
+
+
+def generate_anki_package(deck_name, flashcards, selected_fach=None, warn=st.warning):
+    """
+    Generate an Anki package (.apkg) from flashcards and return its bytes.
+    Prefer export_anki_package, which does not hold the package in memory.
+    """
+    with anki_package_file(deck_name, flashcards, selected_fach) as package:
+        for warning in package["warnings"]:
+            warn(warning)
+        return Path(package["path"]).read_bytes()
+
+
+def _load_manifest(bucket, manifest_path):
+    try:
+        return json.loads(bucket.download(manifest_path).decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def _remove_stale_packages(bucket, safe_fach, prefix, keep_name):
+    try:
+        files = bucket.list(f"{safe_fach}/exports", {"search": prefix})
+        stale = [
+            f"{safe_fach}/exports/{file['name']}" for file in files
+            if file["name"].startswith(prefix) and file["name"].endswith(".apkg") and file["name"] != keep_name
+        ]
+        if stale:
+            bucket.remove(stale)
+    except Exception:
+        pass  # Old packages only cost storage space
+
+
+def export_anki_package(selected_fach, deck_name, flashcards, only_changed=False):
+    """
+    Build an Anki package and upload it to <fach>/exports/ in storage.
+    The file is streamed from disk to storage; the client downloads it from
+    there through a signed URL. Returns the package stats plus "url",
+    "cached" and "warnings", or "url" None if only_changed found nothing to
+    export. Warnings are returned rather than shown, since bulk exports run
+    in worker threads.
+
+    Packages are named by the hash of their content, so exporting an unchanged
+    card set reuses the stored package without building it again. A manifest
+    per deck remembers which card versions were exported last; with
+    only_changed, only new and changed cards are packaged. Stable deck ids and
+    note GUIDs let Anki apply such a delta package as an update.
+    """
+    bucket_name = st.secrets["supabase"]["bucket"]
+    safe_fach = _to_storage_safe_component(selected_fach)
+    safe_deck = _to_storage_safe_component(deck_name)
+    manifest_path = f"{safe_fach}/exports/{safe_deck}.manifest.json"
+
+    started = time.perf_counter()
+    bucket = _get_supabase().storage.from_(bucket_name)
+    guids = [note_guid_for(selected_fach, card) for card in flashcards]
+    card_hashes = {guid: _card_export_hash(card) for guid, card in zip(guids, flashcards)}
+    manifest = _load_manifest(bucket, manifest_path)
+
+    if only_changed:
+        changed = [(guid, card) for guid, card in zip(guids, flashcards) if manifest.get(guid) != card_hashes[guid]]
+        if not changed:
+            return {"cards": 0, "media": 0, "size": 0, "seconds": time.perf_counter() - started, "url": None,
+                    "cached": True, "warnings": []}
+        flashcards = [card for _, card in changed]
+        card_hashes = {guid: card_hashes[guid] for guid, _ in changed}
+
+    prefix = f"{safe_deck}-delta-" if only_changed else f"{safe_deck}-full-"
+    file_name = f"{prefix}{_package_hash(deck_name, card_hashes)[:16]}.apkg"
+    storage_path = f"{safe_fach}/exports/{file_name}"
+    download_name = f"{safe_deck}_flashcards{'_delta' if only_changed else ''}.apkg"
+
+    try:
+        response = bucket.create_signed_url(storage_path, EXPORT_URL_TTL, {"download": download_name})
+        result = {"cards": len(flashcards), "media": None, "size": None, "cached": True, "warnings": []}
+    except Exception:
+        # Not built yet
+        with anki_package_file(deck_name, flashcards, selected_fach) as package:
+            bucket.upload(
+                storage_path,
+                Path(package["path"]),
+                {"content-type": "application/octet-stream", "upsert": "true"},
+            )
+            result = {key: value for key, value in package.items() if key != "path"}
+            result["cached"] = False
+        _remove_stale_packages(bucket, safe_fach, prefix, file_name)
+        response = bucket.create_signed_url(storage_path, EXPORT_URL_TTL, {"download": download_name})
+
+    manifest.update(card_hashes)
+    try:
+        bucket.upload(manifest_path, json.dumps(manifest).encode("utf-8"),
+                      {"content-type": "application/json", "upsert": "true"})
+    except Exception as e:
+        result["warnings"].append(f"Export-Manifest konnte nicht gespeichert werden: {e}")
+
+    result["url"] = response.get("signedURL") or response.get("signedUrl")
+    result["seconds"] = time.perf_counter() - started
+    return result
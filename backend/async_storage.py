@@ -0,0 +1,121 @@
+# backend/async_storage.py
+import asyncio
+import contextvars
+import threading
+
+import streamlit as st
+
+from backend.storage_backend import create_storage_client, is_local_storage
+from backend.storage_metrics import _caller_name, _size, operation
+
+# One event loop in a background thread serves every session of this process,
+# so the async HTTP client and its connection pool are reused between calls.
+_loop = None
+_loop_lock = threading.Lock()
+_buckets = {}
+
+
+def _get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-storage", daemon=True).start()
+        return _loop
+
+
+class _ThreadedBucket:
+    """Async calls of a synchronous bucket (local storage), each run in a worker thread."""
+
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    async def list(self, path=None, options=None):
+        return await asyncio.to_thread(self._bucket.list, path, options)
+
+    async def download(self, path):
+        return await asyncio.to_thread(self._bucket.download, path)
+
+    async def upload(self, path, file, file_options=None):
+        return await asyncio.to_thread(self._bucket.upload, path, file, file_options)
+
+    async def remove(self, paths):
+        return await asyncio.to_thread(self._bucket.remove, paths)
+
+
+class AsyncBucket:
+    """
+    list/download/upload/remove of the app's bucket as coroutines, for run() and
+    submit(). Every call is recorded like the synchronous InstrumentedBucket, with
+    the module that created the coroutine as caller.
+    """
+
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    async def _call(self, op, path, caller, *args):
+        with operation(op, path, caller) as record:
+            if op == "upload":
+                record["bytes_out"] = _size(args[1])
+            result = await getattr(self._bucket, op)(*args)
+            if op == "download":
+                record["bytes_in"] = len(result)
+            return result
+
+    def list(self, path=None, options=None):
+        return self._call("list", path, _caller_name(), path, options)
+
+    def download(self, path):
+        return self._call("download", path, _caller_name(), path)
+
+    def upload(self, path, file, file_options=None):
+        return self._call("upload", path, _caller_name(), path, file, file_options)
+
+    def remove(self, paths):
+        return self._call("remove", ", ".join(paths), _caller_name(), paths)
+
+
+def get_bucket(bucket_name=None):
+    """
+    Async counterpart of create_storage_client().storage.from_(bucket). Supabase
+    is called through the async storage client over HTTP; the local backend
+    through worker threads.
+    """
+    bucket_name = bucket_name or st.secrets["supabase"]["bucket"]
+    with _loop_lock:
+        bucket = _buckets.get(bucket_name)
+    if bucket is not None:
+        return bucket
+
+    if is_local_storage():
+        bucket = AsyncBucket(_ThreadedBucket(create_storage_client().wrapped.storage.from_(bucket_name)))
+    else:
+        from storage3 import AsyncStorageClient
+
+        url, key = st.secrets["supabase"]["url"], st.secrets["supabase"]["key"]
+        client = AsyncStorageClient(
+            f"{url.rstrip('/')}/storage/v1/", {"apiKey": key, "Authorization": f"Bearer {key}"}
+        )
+        bucket = AsyncBucket(client.from_(bucket_name))
+    with _loop_lock:
+        return _buckets.setdefault(bucket_name, bucket)
+
+
+async def _gather(context, coroutines):
+    # The tasks run in the caller's context, so their operations count towards its rerun
+    tasks = [context.run(asyncio.ensure_future, coroutine) for coroutine in coroutines]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def submit(*coroutines):
+    """
+    Start storage coroutines concurrently on the shared loop and return at once.
+    The returned future's result() is the list of their results in order; a
+    failed operation yields its exception instead of raising.
+    """
+    return asyncio.run_coroutine_threadsafe(_gather(contextvars.copy_context(), coroutines), _get_loop())
+
+
+def run(*coroutines):
+    """Like submit(), but wait for all of them: the time of the slowest call instead of the sum."""
+    return submit(*coroutines).result()
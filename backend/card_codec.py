@@ -0,0 +1,117 @@
+# backend/card_codec.py
+import gzip
+import json
+import zlib
+
+import streamlit as st
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Card documents are compact UTF-8 JSON, compressed with gzip or zstd for the
+# generation objects. The codec is not part of the object name: compressed
+# objects are recognized by their magic bytes and anything else is read as
+# JSON, so the pretty-printed files of earlier versions stay readable.
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "gzip": "application/gzip",
+    "zstd": "application/zstd",
+}
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes (non-ASCII characters are kept as they are)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """Parse JSON bytes, with orjson where available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+def default_codec():
+    """
+    [storage] card_codec from the secrets ("gzip", "zstd" or "json"), else gzip.
+    zstd needs the zstandard package wherever the cards are read, so it is opt-in.
+    """
+    try:
+        codec = st.secrets.get("storage", {}).get("card_codec", "gzip")
+    except Exception:
+        codec = "gzip"
+    if codec == "zstd" and zstandard is None:
+        codec = "gzip"
+    return codec
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return data
+
+
+def sniff(data):
+    """Codec of a stored card document: "zstd", "gzip" or "json"."""
+    if data[:4] == ZSTD_MAGIC:
+        return "zstd"
+    if data[:2] == GZIP_MAGIC:
+        return "gzip"
+    return "json"
+
+
+def decompress(data):
+    codec = sniff(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Card data is zstd-compressed, but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if codec == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+def worth_compressing(data, sample_size=64 * 1024, max_ratio=0.5):
+    """
+    Whether compressing pays off, judged from three quick samples. Documents
+    that are mostly inline base64 images barely shrink but take seconds to
+    compress on every write; those are stored as plain JSON.
+    """
+    if len(data) <= 3 * sample_size:
+        return True
+    middle = len(data) // 2
+    samples = [data[:sample_size], data[middle:middle + sample_size], data[-sample_size:]]
+    compressed = sum(len(zlib.compress(sample, 1)) for sample in samples)
+    return compressed <= max_ratio * 3 * sample_size
+
+
+def encode(data, codec=None):
+    """Compress card JSON bytes for storage. Returns (bytes, content type)."""
+    codec = codec or default_codec()
+    if codec != "json" and not worth_compressing(data):
+        codec = "json"
+    return compress(data, codec), CONTENT_TYPES[codec]
+
+
+def encode_cards(flashcards, codec=None):
+    """Serialize and compress a card list. Returns (bytes, content type)."""
+    return encode(dumps(flashcards), codec)
+
+
+def decode_cards(data):
+    """Parse a stored card document in any of the formats, including legacy pretty JSON."""
+    return loads(decompress(data))
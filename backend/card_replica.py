@@ -0,0 +1,178 @@
+# backend/card_replica.py
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import streamlit as st
+
+from backend import search_index
+from backend.learning import get_page_number
+
+DEFAULT_PATH = "card_replica.sqlite"
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _to_storage_safe_component(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = re.sub(r"\s+", "_", value)
+    value = re.sub(r"[^A-Za-z0-9._-]", "_", value)
+    return value.strip("._") or "file"
+
+
+def _settings():
+    try:
+        return st.secrets.get("replica", {})
+    except Exception:
+        return {}
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(_settings().get("path", DEFAULT_PATH), check_same_thread=False)
+        _connection.executescript("""
+            CREATE TABLE IF NOT EXISTS cards (
+                fach TEXT, card_id TEXT, position INTEGER, upload TEXT, page REAL, priority INTEGER,
+                digest TEXT, data TEXT,
+                PRIMARY KEY (fach, card_id)
+            );
+            CREATE INDEX IF NOT EXISTS cards_upload ON cards (fach, upload, page);
+            CREATE INDEX IF NOT EXISTS cards_priority ON cards (fach, priority);
+            CREATE TABLE IF NOT EXISTS faecher (fach TEXT PRIMARY KEY, generation INTEGER, synced_at REAL);
+        """)
+    return _connection
+
+
+def _query(sql, params):
+    with _lock:
+        return _get_connection().execute(sql, params).fetchall()
+
+
+def replica_generation(fach_name):
+    """Generation the local copy of a fach is at, or None if there is none."""
+    rows = _query("SELECT generation FROM faecher WHERE fach = ?", (_to_storage_safe_component(fach_name),))
+    return rows[0][0] if rows else None
+
+
+def apply(fach_name, flashcards, generation):
+    """
+    Make the local copy of a fach match `flashcards` at `generation`, writing
+    only the cards that were added, changed, removed or moved. Older
+    generations than the local one are ignored.
+    """
+    fach = _to_storage_safe_component(fach_name)
+    rows = {}
+    for position, card in enumerate(flashcards):
+        data = json.dumps(card, ensure_ascii=False, sort_keys=True)
+        page = get_page_number(card)
+        rows[card["id"]] = (
+            position, card.get("upload", "Unbekannt"), None if page == float("inf") else page,
+            card.get("priority", 2), hashlib.sha1(data.encode("utf-8")).hexdigest(), data,
+        )
+
+    with _lock:
+        connection = _get_connection()
+        with connection:
+            current = connection.execute("SELECT generation FROM faecher WHERE fach = ?", (fach,)).fetchone()
+            if current and current[0] > generation:
+                return
+            stored = {
+                card_id: (position, digest) for card_id, position, digest in connection.execute(
+                    "SELECT card_id, position, digest FROM cards WHERE fach = ?", (fach,)
+                )
+            }
+            connection.executemany(
+                "DELETE FROM cards WHERE fach = ? AND card_id = ?",
+                [(fach, card_id) for card_id in stored if card_id not in rows],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(fach, card_id, *row) for card_id, row in rows.items()
+                 if stored.get(card_id, (None, None))[1] != row[4]],
+            )
+            connection.executemany(
+                "UPDATE cards SET position = ? WHERE fach = ? AND card_id = ?",
+                [(row[0], fach, card_id) for card_id, row in rows.items()
+                 if card_id in stored and stored[card_id][1] == row[4] and stored[card_id][0] != row[0]],
+            )
+            connection.execute("INSERT OR REPLACE INTO faecher VALUES (?, ?, ?)", (fach, generation, time.time()))
+
+
+def sync_fach(fach_name, generation=None):
+    """
+    Bring the local copy of a fach up to the stored generation. Costs one
+    listing when it is current; otherwise the latest generation is downloaded
+    once and applied as a delta (also to the search index). A local copy
+    ahead of storage is dropped and rebuilt. Pass the generation if it is
+    already known. Returns the local generation.
+    """
+    from backend.flashcard_manager import current_generation, load_flashcards
+
+    if generation is None:
+        generation = current_generation(fach_name)
+    local_generation = replica_generation(fach_name)
+    if generation is None or local_generation == generation:
+        # Storage unreachable: keep working from the local copy
+        return local_generation
+    if local_generation is not None and generation < local_generation:
+        # Storage went back: the fach was deleted (and maybe recreated) elsewhere,
+        # so the local copy belongs to a fach that no longer exists
+        remove_fach(fach_name)
+    flashcards, generation = load_flashcards(fach_name)
+    apply(fach_name, flashcards, generation)
+    try:
+        search_index.ensure_indexed(fach_name, generation, flashcards)
+    except Exception:
+        pass
+    return generation
+
+
+def all_cards(fach_name):
+    """All cards of a fach in stored order, e.g. to change them with update_flashcards."""
+    rows = _query(
+        "SELECT data FROM cards WHERE fach = ? ORDER BY position", (_to_storage_safe_component(fach_name),)
+    )
+    return [json.loads(data) for data, in rows]
+
+
+def upload_cards(fach_name, upload):
+    """The cards of one upload in page order (cards without a page last)."""
+    rows = _query(
+        "SELECT data FROM cards WHERE fach = ? AND upload = ? ORDER BY page IS NULL, page, position",
+        (_to_storage_safe_component(fach_name), upload),
+    )
+    return [json.loads(data) for data, in rows]
+
+
+def uploads(fach_name):
+    """Names of the uploads that have cards in a fach."""
+    rows = _query(
+        "SELECT DISTINCT upload FROM cards WHERE fach = ? ORDER BY upload", (_to_storage_safe_component(fach_name),)
+    )
+    return [upload for upload, in rows]
+
+
+def priority_counts(fach_name, upload=None):
+    """{priority: number of cards} of a fach, or of one upload in it."""
+    sql = "SELECT priority, COUNT(*) FROM cards WHERE fach = ?"
+    params = [_to_storage_safe_component(fach_name)]
+    if upload is not None:
+        sql += " AND upload = ?"
+        params.append(upload)
+    return dict(_query(sql + " GROUP BY priority", params))
+
+
+def remove_fach(fach_name):
+    """Drop the local copy of a fach."""
+    fach = _to_storage_safe_component(fach_name)
+    with _lock:
+        connection = _get_connection()
+        with connection:
+            connection.execute("DELETE FROM cards WHERE fach = ?", (fach,))
+            connection.execute("DELETE FROM faecher WHERE fach = ?", (fach,))
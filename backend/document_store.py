@@ -0,0 +1,316 @@
+# backend/document_store.py
+import base64
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+import streamlit as st
+
+from backend.flashcard_manager import load_flashcards, new_card_id, update_flashcards
+from backend.storage_backend import is_local_storage
+from backend.storage_metrics import operation
+from backend.storage_utils import _get_bucket, _is_conflict
+
+# PDFs are stored once per content under <fach>/blobs/<sha256>.pdf. The
+# manifest maps the display name of every document to its blob, so the same
+# file under another name costs neither storage nor model calls. PDFs from
+# before the manifest stay in <fach>/uploads/ and are listed alongside.
+#
+# The manifest is versioned like the cards (see flashcard_manager): every
+# change is a new, create-only generation <fach>/manifests/documents-<n>.json,
+# so writers in different processes can't overwrite each other; the one that
+# loses re-reads the manifest and applies its change again. Generation 0 is
+# the empty manifest of a fach without documents.
+MANIFEST_FOLDER = "manifests"
+KEEP_MANIFESTS = 10
+MAX_MANIFEST_ATTEMPTS = 5
+
+# Files above this size go through the resumable (TUS) upload endpoint of
+# Supabase Storage in chunks; the protocol requires 6 MB chunks.
+RESUMABLE_MIN_BYTES = 6 * 1024 * 1024
+RESUMABLE_CHUNK_BYTES = 6 * 1024 * 1024
+RESUMABLE_ATTEMPTS = 5
+
+# Upload URLs of unfinished resumable uploads by object path, so a retry continues where it broke off
+_resumable_uploads = {}
+
+
+def _to_storage_safe_component(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = re.sub(r"\s+", "_", value)
+    value = re.sub(r"[^A-Za-z0-9._-]", "_", value)
+    return value.strip("._") or "file"
+
+
+def content_hash(pdf_bytes):
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _blob_path(safe_fach, digest):
+    return f"{safe_fach}/blobs/{digest}.pdf"
+
+
+def _manifest_path(safe_fach, generation):
+    return f"{safe_fach}/{MANIFEST_FOLDER}/documents-{generation:08d}.json"
+
+
+def _latest_manifest_generation(safe_fach):
+    files = _get_bucket().list(
+        f"{safe_fach}/{MANIFEST_FOLDER}",
+        {"limit": 1, "sortBy": {"column": "name", "order": "desc"}},
+    )
+    for file in files:
+        match = re.match(r"documents-(\d+)\.json$", file.get("name", ""))
+        if match:
+            return int(match.group(1))
+    return 0
+
+
+def _read_manifest(safe_fach):
+    """(documents, generation) of the latest manifest generation."""
+    generation = _latest_manifest_generation(safe_fach)
+    if generation == 0:
+        return {}, 0
+    data = _get_bucket().download(_manifest_path(safe_fach, generation))
+    data = data if isinstance(data, bytes) else data.content
+    return json.loads(data.decode("utf-8")).get("documents", {}), generation
+
+
+def load_manifest(fach_name):
+    """{display name: {"blob", "size", "added_at"}} of the documents of a fach."""
+    try:
+        return _read_manifest(_to_storage_safe_component(fach_name))[0]
+    except Exception:
+        return {}
+
+
+def _update_manifest(safe_fach, change):
+    """
+    Apply change(documents) to the latest manifest and write it as the next
+    generation, re-reading and retrying if another writer got there first.
+    change edits the dict in place and returns False if there is nothing to
+    write. Returns the documents as written (or as read, without a change).
+    """
+    for _ in range(MAX_MANIFEST_ATTEMPTS):
+        documents, generation = _read_manifest(safe_fach)
+        if change(documents) is False:
+            return documents
+        try:
+            _get_bucket().upload(
+                _manifest_path(safe_fach, generation + 1),
+                json.dumps({"documents": documents}, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                {"content-type": "application/json", "upsert": "false"},
+            )
+        except Exception as e:
+            if _is_conflict(e):
+                continue
+            raise
+        stale = generation + 1 - KEEP_MANIFESTS
+        if stale > 0:
+            try:
+                _get_bucket().remove([_manifest_path(safe_fach, stale)])
+            except Exception:
+                pass
+        return documents
+    raise RuntimeError("Too many concurrent changes to the documents of this fach, please retry.")
+
+
+def list_documents(fach_name):
+    """Sorted display names of all PDFs of a fach, from the manifest and the legacy uploads folder."""
+    safe_fach = _to_storage_safe_component(fach_name)
+    names = set(load_manifest(fach_name))
+    for file in _get_bucket().list(f"{safe_fach}/uploads/"):
+        if file["name"] != "placeholder.txt":
+            names.add(file["name"])
+    return sorted(names)
+
+
+def document_path(fach_name, document_name):
+    """Storage path of a document's PDF: its blob, or the legacy path in the uploads folder."""
+    safe_fach = _to_storage_safe_component(fach_name)
+    entry = load_manifest(fach_name).get(document_name)
+    if entry:
+        return _blob_path(safe_fach, entry["blob"])
+    return f"{safe_fach}/uploads/{_to_storage_safe_component(document_name)}"
+
+
+def _resumable_endpoint():
+    return f"{st.secrets['supabase']['url'].rstrip('/')}/storage/v1/upload/resumable"
+
+
+def _tus_metadata(**values):
+    return ",".join(f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in values.items())
+
+
+def resumable_upload(storage_path, data, content_type="application/pdf", progress=None):
+    """
+    Upload a large object in chunks over the TUS protocol of Supabase Storage.
+    Failed chunks are retried from the offset the server confirms; if all
+    attempts fail, the next call for the same path resumes the upload instead
+    of starting over. progress(fraction) is called after every chunk.
+    Existing objects are left as they are (create-only).
+    """
+    import httpx
+
+    key = st.secrets["supabase"]["key"]
+    headers = {"authorization": f"Bearer {key}", "apikey": key, "tus-resumable": "1.0.0"}
+    with operation("upload", storage_path) as record, httpx.Client(timeout=60) as client:
+        upload_url = _resumable_uploads.get(storage_path)
+        offset = None
+        for attempt in range(RESUMABLE_ATTEMPTS):
+            try:
+                if upload_url is not None and offset is None:
+                    response = client.head(upload_url, headers=headers)
+                    if response.status_code in (404, 410):
+                        upload_url = None
+                    else:
+                        response.raise_for_status()
+                        offset = int(response.headers["upload-offset"])
+                if upload_url is None:
+                    response = client.post(_resumable_endpoint(), headers={
+                        **headers,
+                        "upload-length": str(len(data)),
+                        "upload-metadata": _tus_metadata(
+                            bucketName=st.secrets["supabase"]["bucket"], objectName=storage_path,
+                            contentType=content_type, cacheControl="3600",
+                        ),
+                        "x-upsert": "false",
+                    })
+                    if response.status_code == 409:
+                        break
+                    response.raise_for_status()
+                    upload_url = response.headers["location"]
+                    _resumable_uploads[storage_path] = upload_url
+                    offset = 0
+                while offset < len(data):
+                    response = client.patch(
+                        upload_url,
+                        content=data[offset:offset + RESUMABLE_CHUNK_BYTES],
+                        headers={
+                            **headers,
+                            "upload-offset": str(offset),
+                            "content-type": "application/offset+octet-stream",
+                        },
+                    )
+                    response.raise_for_status()
+                    offset = int(response.headers["upload-offset"])
+                    if progress:
+                        progress(offset / len(data))
+                break
+            except (httpx.HTTPError, KeyError, ValueError):
+                if attempt == RESUMABLE_ATTEMPTS - 1:
+                    raise
+                # Ask the server how far it got before continuing
+                offset = None
+                time.sleep(2 ** attempt)
+        _resumable_uploads.pop(storage_path, None)
+        record["bytes_out"] = len(data)
+
+
+def _blob_exists(safe_fach, digest):
+    return any(file["name"] == f"{digest}.pdf" for file in _get_bucket().list(f"{safe_fach}/blobs", {"search": digest}))
+
+
+def _store_blob(safe_fach, digest, pdf_bytes, progress=None):
+    storage_path = _blob_path(safe_fach, digest)
+    if len(pdf_bytes) >= RESUMABLE_MIN_BYTES and not is_local_storage():
+        resumable_upload(storage_path, pdf_bytes, progress=progress)
+        return storage_path
+    try:
+        _get_bucket().upload(storage_path, pdf_bytes, {"content-type": "application/pdf", "upsert": "false"})
+    except Exception as e:
+        # Same content, stored before
+        if not _is_conflict(e):
+            raise
+    if progress:
+        progress(1.0)
+    return storage_path
+
+
+def reuse_cards(fach_name, source_name, target_name):
+    """
+    Copy the cards of one document to another one with the same content, with
+    new ids. The page images are shared. Returns the number of copied cards.
+    """
+    flashcards, generation = load_flashcards(fach_name)
+    copies = []
+    for card in flashcards:
+        if card.get("upload", "Unbekannt") != source_name:
+            continue
+        copy = {**card, "upload": target_name, "id": new_card_id()}
+        if copy.get("mindmap"):
+            copy["question"] = f"Mindmap für {target_name}"
+        copies.append(copy)
+    if not copies:
+        return 0
+    kept = [card for card in flashcards if card.get("upload", "Unbekannt") != target_name]
+    if update_flashcards(fach_name, kept + copies, base_generation=generation) is None:
+        return 0
+    return len(copies)
+
+
+def add_document(fach_name, document_name, pdf_bytes, progress=None):
+    """
+    Store an uploaded PDF under its display name. Content that is already in
+    the fach is not uploaded again: under the same name nothing changes, under
+    another name the cards of that document are reused. Returns
+    {"path", "duplicate_of", "cards"} with the name of the identical document
+    and the number of cards it already has (reused under another name), or
+    None and 0 for new content. With 0 cards the document still needs them.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    digest = content_hash(pdf_bytes)
+    documents = load_manifest(fach_name)
+    if documents.get(document_name, {}).get("blob") == digest:
+        cards = sum(card.get("upload", "Unbekannt") == document_name for card in load_flashcards(fach_name)[0])
+        return {"path": _blob_path(safe_fach, digest), "duplicate_of": document_name, "cards": cards}
+    duplicate_of = next((name for name, entry in sorted(documents.items()) if entry["blob"] == digest), None)
+
+    if duplicate_of is None:
+        storage_path = _store_blob(safe_fach, digest, pdf_bytes, progress)
+    else:
+        storage_path = _blob_path(safe_fach, digest)
+
+    before = {}
+
+    def add(documents):
+        before["entry"] = documents.get(document_name)
+        documents[document_name] = {"blob": digest, "size": len(pdf_bytes), "added_at": time.time()}
+
+    documents = _update_manifest(safe_fach, add)
+    replaced = before["entry"]
+    if duplicate_of is not None and not _blob_exists(safe_fach, digest):
+        # The other document was deleted in the meantime, and its blob with it
+        _store_blob(safe_fach, digest, pdf_bytes, progress)
+    if replaced and replaced["blob"] != digest and not any(
+        entry["blob"] == replaced["blob"] for entry in documents.values()
+    ):
+        _get_bucket().remove([_blob_path(safe_fach, replaced["blob"])])
+
+    cards = reuse_cards(fach_name, duplicate_of, document_name) if duplicate_of else 0
+    return {"path": storage_path, "duplicate_of": duplicate_of, "cards": cards}
+
+
+def forget_document(fach_name, document_name):
+    """
+    Drop a document from the manifest. Returns the storage paths of its PDF
+    that may be removed now: the blob unless another document still uses it,
+    and the legacy upload path.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    paths = [f"{safe_fach}/uploads/{_to_storage_safe_component(document_name)}"]
+    removed = {}
+
+    def forget(documents):
+        removed["entry"] = documents.pop(document_name, None)
+        return removed["entry"] is not None
+
+    documents = _update_manifest(safe_fach, forget)
+    entry = removed["entry"]
+    if entry is None:
+        return paths
+    if not any(other["blob"] == entry["blob"] for other in documents.values()):
+        paths.append(_blob_path(safe_fach, entry["blob"]))
+    return paths
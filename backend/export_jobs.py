@@ -0,0 +1,44 @@
+# backend/export_jobs.py
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.anki_export import export_anki_package
+from backend.flashcard_manager import get_flashcards
+from backend.job_registry import JobRegistry
+
+# Fächer exported in parallel, shared by all jobs of this process
+MAX_EXPORT_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_EXPORT_WORKERS, thread_name_prefix="anki-export")
+_jobs = JobRegistry("faecher")
+
+
+def _export_fach(job_id, fach):
+    _jobs.update(job_id, fach, status="läuft")
+    try:
+        flashcards = get_flashcards(fach)
+        result = export_anki_package(fach, fach, flashcards) if flashcards else {"url": None, "cards": 0}
+        update = {"status": "fertig", **result}
+    except Exception as e:
+        update = {"status": "fehler", "error": str(e)}
+    _jobs.update(job_id, fach, **update)
+
+
+def start_bulk_export(faecher):
+    """
+    Export the stored cards of the given fächer as .apkg files in the background.
+    Each fach becomes a deck named after the fach in <fach>/exports/.
+    Returns a job id for get_job.
+    """
+    job_id = _jobs.create({fach: {"status": "wartend"} for fach in faecher})
+    for fach in faecher:
+        _executor.submit(_export_fach, job_id, fach)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Return a snapshot of a job: {"id", "started", "finished", "faecher": {fach: status dict}}
+    or None if the job is unknown. A fach's status dict has "status" and, once
+    done, the export_anki_package result or "error".
+    """
+    return _jobs.snapshot(job_id)
@@ -0,0 +1,223 @@
+# backend/fach_backup.py
+import json
+import mimetypes
+import re
+import tempfile
+import time
+import unicodedata
+import zipfile
+from pathlib import Path
+
+from backend import async_storage, card_codec
+from backend.flashcard_manager import load_flashcards, update_flashcards
+from backend.storage_utils import _get_bucket
+
+# A backup is one zip archive of a fach: backup.json, cards.json with the
+# current cards (priorities included), then every other object of the fach
+# under its path relative to the fach folder: PDFs, blobs and the documents
+# manifest, page images and mindmaps. The card history under versions/, the
+# pre-versioning flashcards.json and generated exports are left out; a restore writes
+# the cards as the first generation of the restored fach.
+BACKUP_FORMAT = 1
+BACKUP_INFO = "backup.json"
+BACKUP_CARDS = "cards.json"
+SKIPPED_FOLDERS = ("versions/", "exports/")
+SKIPPED_FILES = ("flashcards.json",)
+
+# Objects downloaded or uploaded at the same time. The next window is in flight
+# while the current one is written, so at most two windows are held in memory.
+TRANSFER_WINDOW = 8
+LIST_PAGE_SIZE = 1000
+# Download links to uploaded backups stay valid for a day, like the Anki exports
+BACKUP_URL_TTL = 24 * 3600
+# Already compressed formats go into the archive as they are
+STORED_SUFFIXES = (".pdf", ".png", ".jpg", ".jpeg", ".webp", ".gz", ".zip", ".apkg")
+
+def _to_storage_safe_component(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = re.sub(r"\s+", "_", value)
+    value = re.sub(r"[^A-Za-z0-9._-]", "_", value)
+    return value.strip("._") or "fach"
+
+
+def list_objects(fach_name, hidden=False):
+    """
+    All objects of a fach as sorted (path relative to the fach folder, size),
+    walking the subfolders page by page. Hidden objects (folder placeholders,
+    unfinished local uploads) are left out unless `hidden` is set.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    objects = []
+    folders = [""]
+    while folders:
+        folder = folders.pop()
+        offset = 0
+        while True:
+            entries = _get_bucket().list(f"{safe_fach}/{folder}".rstrip("/"), {"limit": LIST_PAGE_SIZE, "offset": offset})
+            for entry in entries:
+                if entry["name"].startswith(".") and not (hidden and entry.get("id") is not None):
+                    continue
+                if entry.get("id") is None:
+                    folders.append(f"{folder}{entry['name']}/")
+                else:
+                    objects.append((f"{folder}{entry['name']}", (entry.get("metadata") or {}).get("size", 0)))
+            if len(entries) < LIST_PAGE_SIZE:
+                break
+            offset += LIST_PAGE_SIZE
+    return sorted(objects)
+
+
+def _backed_up(path):
+    return not path.startswith(SKIPPED_FOLDERS) and path not in SKIPPED_FILES
+
+
+def _compression(path):
+    return zipfile.ZIP_STORED if path.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+
+
+def _windows(items):
+    return [items[start:start + TRANSFER_WINDOW] for start in range(0, len(items), TRANSFER_WINDOW)]
+
+
+def export_fach(fach_name, target, progress=None):
+    """
+    Write a backup archive of a fach to the binary file object `target`, which
+    needn't be seekable. Objects are downloaded TRANSFER_WINDOW at a time, the
+    next window while the current one is written, so memory stays bounded by
+    the window instead of the fach. progress(fraction) is called per window.
+    Returns {"objects", "bytes", "cards"}; a failed download raises.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    flashcards, generation = load_flashcards(fach_name)
+    paths = [path for path, _ in list_objects(fach_name) if _backed_up(path)]
+    windows = _windows(paths)
+    bucket = async_storage.get_bucket()
+
+    def fetch(window):
+        return async_storage.submit(*(bucket.download(f"{safe_fach}/{path}") for path in window))
+
+    written = 0
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(BACKUP_INFO, json.dumps({
+            "format": BACKUP_FORMAT,
+            "fach": fach_name,
+            "generation": generation,
+            "created_at": time.time(),
+            "objects": len(paths),
+        }, ensure_ascii=False))
+        archive.writestr(BACKUP_CARDS, card_codec.dumps(flashcards))
+
+        pending = fetch(windows[0]) if windows else None
+        for index, window in enumerate(windows):
+            results = pending.result()
+            if index + 1 < len(windows):
+                pending = fetch(windows[index + 1])
+            for path, data in zip(window, results):
+                if isinstance(data, Exception):
+                    raise RuntimeError(f"Error downloading {path}: {data}")
+                data = data if isinstance(data, bytes) else data.content
+                archive.writestr(path, data, compress_type=_compression(path))
+                written += len(data)
+            if progress:
+                progress((index + 1) / len(windows))
+    return {"objects": len(paths), "bytes": written, "cards": len(flashcards)}
+
+
+def upload_backup(fach_name, progress=None):
+    """
+    Export a fach into a temporary file on disk and upload the archive to
+    <fach>/exports/, replacing the previous backup. The client downloads it
+    from there through a signed URL, so the archive is never held in memory.
+    Returns the export_fach stats plus "url".
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    file_name = f"{safe_fach}-backup.zip"
+    storage_path = f"{safe_fach}/exports/{file_name}"
+    with tempfile.TemporaryDirectory(prefix="merkwerk-backup-") as backup_dir:
+        archive_path = Path(backup_dir) / file_name
+        with open(archive_path, "wb") as target:
+            stats = export_fach(fach_name, target, progress=progress)
+        _get_bucket().upload(storage_path, archive_path, {"content-type": "application/zip", "upsert": "true"})
+    response = _get_bucket().create_signed_url(storage_path, BACKUP_URL_TTL, {"download": file_name})
+    stats["url"] = response.get("signedURL") or response.get("signedUrl")
+    return stats
+
+
+def read_backup_info(source):
+    """The backup.json of an archive, or None if `source` is no fach backup of a known format."""
+    try:
+        with zipfile.ZipFile(source) as archive:
+            info = json.loads(archive.read(BACKUP_INFO).decode("utf-8"))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        return None
+    finally:
+        source.seek(0)
+    return info if info.get("format") == BACKUP_FORMAT else None
+
+
+def _object_path(entry_name):
+    # Entries come from an uploaded file: nothing may leave the fach folder
+    parts = entry_name.split("/")
+    if entry_name.startswith("/") or any(part in ("", ".", "..") for part in parts):
+        raise ValueError(f"Invalid path in backup: {entry_name}")
+    return entry_name
+
+
+def _check_uploads(results, window):
+    for entry, result in zip(window, results):
+        if isinstance(result, Exception):
+            raise RuntimeError(f"Error uploading {entry.filename}: {result}")
+
+
+def restore_fach(source, fach_name, progress=None):
+    """
+    Restore a backup archive from the seekable binary file object `source` as
+    the fach `fach_name`, which must not exist yet; the name may differ from
+    the one in the backup, and the storage may be another bucket or backend.
+    Objects are uploaded TRANSFER_WINDOW at a time, the next window being read
+    from the archive meanwhile. Returns {"objects", "bytes", "cards"}.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    if read_backup_info(source) is None:
+        raise ValueError("Die Datei ist kein Merkwerk-Backup.")
+    if list_objects(fach_name):
+        raise ValueError(f"Das Fach '{fach_name}' existiert bereits.")
+    bucket = async_storage.get_bucket()
+
+    def store(window):
+        return async_storage.submit(*(
+            bucket.upload(
+                f"{safe_fach}/{path}", data,
+                {"content-type": mimetypes.guess_type(path)[0] or "application/octet-stream", "upsert": "true"},
+            )
+            for path, data in window
+        ))
+
+    written = 0
+    with zipfile.ZipFile(source) as archive:
+        flashcards = card_codec.loads(archive.read(BACKUP_CARDS))
+        entries = [
+            entry for entry in archive.infolist()
+            if not entry.is_dir() and entry.filename not in (BACKUP_INFO, BACKUP_CARDS)
+        ]
+        for entry in entries:
+            _object_path(entry.filename)
+        windows = _windows(entries)
+        pending = None
+        for index, window in enumerate(windows):
+            contents = [(entry.filename, archive.read(entry)) for entry in window]
+            if pending is not None:
+                _check_uploads(pending.result(), windows[index - 1])
+                if progress:
+                    progress(index / len(windows))
+            pending = store(contents)
+            written += sum(len(data) for _, data in contents)
+        if pending is not None:
+            _check_uploads(pending.result(), windows[-1])
+
+    # Written last, so an interrupted restore leaves a fach without cards rather than cards without images
+    if update_flashcards(fach_name, flashcards) is None:
+        raise RuntimeError(f"Error writing the cards of {fach_name}")
+    if progress:
+        progress(1.0)
+    return {"objects": len(entries), "bytes": written, "cards": len(flashcards)}
@@ -1,19 +1,12 @@
 # backend/fach_manager.py
 
-import io
-import base64
 import streamlit as st
-from supabase import create_client
+from backend.storage_utils import _get_bucket, _is_conflict
+from backend import async_storage, card_replica, search_index
 import re
 import unicodedata
 
-# --- Setup Supabase client using secrets ---
-url = st.secrets["supabase"]["url"]
-key = st.secrets["supabase"]["key"]
-bucket_name = st.secrets["supabase"]["bucket"]
-supabase = create_client(url, key)
-
-
+# --- Setup the Supabase bucket from the secrets on first use ---
 def _to_storage_safe_component(value: str) -> str:
     value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
     value = re.sub(r"\s+", "_", value)
@@ -27,7 +20,7 @@ def get_all_faecher():
     excluding any folders that are just placeholders (like .emptyFolderPlaceholder).
     """
     try:
-        files = supabase.storage.from_(bucket_name).list()
+        files = _get_bucket().list()
     except Exception as e:
         st.error(f"Error listing files: {e}")
         return []
@@ -43,51 +36,53 @@ def get_all_faecher():
 def create_fach(name):
     """
     Creates a new fach folder with subfolders and a flashcard.js file.
+    Returns True once the fach exists (also if it existed before), else False.
     """
     safe_name = _to_storage_safe_component(name)
+    bucket = async_storage.get_bucket()
 
-    # Create subfolders: uploads, images, mindmaps by uploading a placeholder file
-    for subfolder in ["uploads", "mindmaps"]:
-        placeholder_path = f"{safe_name}/{subfolder}/placeholder.txt"
-        try:
-            supabase.storage.from_(bucket_name).upload(placeholder_path, "".encode("utf-8"))
-        except Exception:
-            pass  # Ignore if the placeholder already exists
-
-    # Create flashcards.json file if it doesn't exist
-    flashcard_path = f"{safe_name}/flashcards.json"
-    try:
-        supabase.storage.from_(bucket_name).download(flashcard_path)
-    except Exception:
-        try:
-            supabase.storage.from_(bucket_name).upload(flashcard_path, "[]".encode("utf-8"))
-        except Exception as e2:
-            st.error(f"Error creating flashcards.json: {e2}")
+    # Create subfolders (uploads, mindmaps) by uploading a placeholder file, and
+    # flashcards.json, all at once. Uploads are create-only, so existing
+    # placeholders and an existing flashcards.json are left as they are.
+    results = async_storage.run(
+        *(bucket.upload(f"{safe_name}/{subfolder}/placeholder.txt", "".encode("utf-8"))
+          for subfolder in ["uploads", "mindmaps"]),
+        bucket.upload(f"{safe_name}/flashcards.json", "[]".encode("utf-8")),
+    )
+    if isinstance(results[-1], Exception) and not _is_conflict(results[-1]):
+        st.error(f"Error creating flashcards.json: {results[-1]}")
+        return False
+    return True
 
 # --- Delete a fach folder (all files under the fach prefix) ---
 def delete_fach(fach_name):
     """
-    Deletes all files under the fach folder.
-    Note: This implementation assumes that list() returns all objects under the prefix.
+    Deletes all files under the fach folder, including the subfolders and the
+    card generations under versions/.
     """
+    # Imported here: fach_backup builds on flashcard_manager
+    from backend.fach_backup import list_objects
+
+    safe_fach = _to_storage_safe_component(fach_name)
     try:
-        # List files under the fach folder
-        safe_fach = _to_storage_safe_component(fach_name)
-        files = supabase.storage.from_(bucket_name).list(safe_fach, limit=1000)
+        to_delete = [f"{safe_fach}/{path}" for path, _ in list_objects(fach_name, hidden=True)]
     except Exception as e:
         st.error(f"Error listing files for deletion: {e}")
         return
 
-    # Build full paths for deletion (e.g. "fach/uploads/filename")
-    to_delete = [f"{safe_fach}/{file['name']}" for file in files]
-    
-    # Remove files if any
-    if to_delete:
+    # Removed in chunks, the storage API takes at most 1000 paths per call
+    for start in range(0, len(to_delete), 1000):
         try:
-            supabase.storage.from_(bucket_name).remove(to_delete)
+            _get_bucket().remove(to_delete[start:start + 1000])
         except Exception as e:
             st.error(f"Error deleting files: {e}")
 
+    for remove_local_copy in (card_replica.remove_fach, search_index.remove_fach):
+        try:
+            remove_local_copy(fach_name)
+        except Exception:
+            pass
+
 # --- Rename a fach folder ---
 def rename_fach(old_name, new_name):
     """
@@ -96,7 +91,7 @@ def rename_fach(old_name, new_name):
     try:
         safe_old_name = _to_storage_safe_component(old_name)
         safe_new_name = _to_storage_safe_component(new_name)
-        files = supabase.storage.from_(bucket_name).list(safe_old_name, limit=1000)
+        files = _get_bucket().list(safe_old_name, limit=1000)
     except Exception as e:
         st.error(f"Error listing files for renaming: {e}")
         return
@@ -107,7 +102,7 @@ def rename_fach(old_name, new_name):
         
         # Download file from the old path
         try:
-            data = supabase.storage.from_(bucket_name).download(old_path)
+            data = _get_bucket().download(old_path)
             file_bytes = data.read()  # data is a BytesIO object
         except Exception as e:
             st.error(f"Error downloading file {old_path}: {e}")
@@ -115,7 +110,7 @@ def rename_fach(old_name, new_name):
         
         # Upload file to the new path
         try:
-            supabase.storage.from_(bucket_name).upload(new_path, file_bytes)
+            _get_bucket().upload(new_path, file_bytes)
         except Exception as e:
             st.error(f"Error uploading file {new_path}: {e}")
             continue
@@ -124,6 +119,6 @@ def rename_fach(old_name, new_name):
     try:
         old_files = [f"{safe_old_name}/{file['name']}" for file in files]
         if old_files:
-            supabase.storage.from_(bucket_name).remove(old_files)
+            _get_bucket().remove(old_files)
     except Exception as e:
         st.error(f"Error deleting old files after renaming: {e}")
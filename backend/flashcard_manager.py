@@ -1,17 +1,13 @@
 # backend/flashcard_manager.py
-import json
+import hashlib
+import uuid
 import streamlit as st
-from supabase import create_client
+from backend.storage_utils import _get_bucket, _is_conflict
+from backend import async_storage, card_codec, card_replica, search_index
 import re
 import unicodedata
 
-# Initialize Supabase client using secrets
-url = st.secrets["supabase"]["url"]
-key = st.secrets["supabase"]["key"]
-bucket_name = st.secrets["supabase"]["bucket"]
-supabase = create_client(url, key)
-
-
+# Initialize the Supabase bucket from the secrets on first use
 def _to_storage_safe_component(value: str) -> str:
     value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
     value = re.sub(r"\s+", "_", value)
@@ -19,92 +15,300 @@ def _to_storage_safe_component(value: str) -> str:
     return value.strip("._") or "file"
 
 
-def get_flashcards(fach_name):
+# Every write creates a new, immutable generation object under versions/.
+# Uploads without upsert fail if the object already exists, which makes the
+# generation number a compare-and-swap token: the writer that claims
+# generation n+1 first wins, everyone else merges and retries.
+VERSIONS_FOLDER = "versions"
+KEEP_GENERATIONS = 10
+MAX_WRITE_ATTEMPTS = 5
+
+
+def _version_path(safe_fach, generation):
+    return f"{safe_fach}/{VERSIONS_FOLDER}/flashcards-{generation:08d}.json"
+
+
+def _decode(response):
+    # response may be bytes or have a content attribute; the format is sniffed (see card_codec)
+    if isinstance(response, bytes):
+        return card_codec.decode_cards(response)
+    return card_codec.decode_cards(response.content)
+
+
+def _legacy_card_id(card, occurrence):
+    key = f"{card.get('upload', 'Unbekannt')}|{card.get('page')}|{card.get('question', '')}|{occurrence}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _ensure_card_ids(flashcards):
     """
-    Download flashcards.json from Supabase storage and return the flashcards list.
-    If the file doesn't exist, return an empty list.
+    Give every card a stable "id". Cards written before ids existed get one
+    derived from upload, page and question, so that two sessions reading the
+    same legacy file agree on the ids.
     """
-    safe_fach = _to_storage_safe_component(fach_name)
-    file_path = f"{safe_fach}/flashcards.json"
+    seen = {}
+    for card in flashcards:
+        if not card.get("id"):
+            base = _legacy_card_id(card, 0)
+            seen[base] = seen.get(base, -1) + 1
+            card["id"] = _legacy_card_id(card, seen[base]) if seen[base] else base
+    return flashcards
+
+
+def new_card_id():
+    return uuid.uuid4().hex[:16]
+
+
+def _latest_generation(safe_fach):
+    files = _get_bucket().list(
+        f"{safe_fach}/{VERSIONS_FOLDER}",
+        {"limit": 1, "sortBy": {"column": "name", "order": "desc"}},
+    )
+    for file in files:
+        match = re.match(r"flashcards-(\d+)\.json$", file.get("name", ""))
+        if match:
+            return int(match.group(1))
+    return 0
+
+
+def _download_generation(safe_fach, generation, legacy=True):
     try:
-        response = supabase.storage.from_(bucket_name).download(file_path)
-        # response may be bytes or have a content attribute
-        if isinstance(response, bytes):
-            content = response.decode('utf-8')
-        else:
-            content = response.content.decode('utf-8')
-        return json.loads(content)
+        return _ensure_card_ids(_decode(_get_bucket().download(_version_path(safe_fach, generation))))
+    except Exception:
+        if generation != 0 or not legacy:
+            raise
+    # Generation 0 is the plain flashcards.json written before versioning
+    try:
+        return _ensure_card_ids(_decode(_get_bucket().download(f"{safe_fach}/flashcards.json")))
     except Exception:
-        # File doesn't exist or another error occurred: return empty list
         return []
 
-def update_flashcards(fach_name, flashcards):
+
+def load_flashcards(fach_name):
     """
-    Update flashcards.json in Supabase storage with the new flashcards content.
-    This removes any existing file and uploads the new content.
+    Return (flashcards, generation) for a fach. Pass the generation back to
+    update_flashcards as base_generation so concurrent writes can be merged.
     """
     safe_fach = _to_storage_safe_component(fach_name)
-    file_path = f"{safe_fach}/flashcards.json"
-    content = json.dumps(flashcards, indent=2, ensure_ascii=False)
     try:
-        # Remove the existing file if it exists (ignore error if not)
+        generation = _latest_generation(safe_fach)
+        return _download_generation(safe_fach, generation), generation
+    except Exception:
+        # File doesn't exist or another error occurred: return empty list
+        return [], 0
+
+
+def current_generation(fach_name):
+    """
+    Latest generation of a fach, or None if it can't be read. A single small
+    listing, to check whether cards loaded earlier are still current.
+    """
+    try:
+        return _latest_generation(_to_storage_safe_component(fach_name))
+    except Exception:
+        return None
+
+
+def get_flashcards(fach_name):
+    """
+    Download the current flashcards of a fach and return the flashcards list.
+    If the file doesn't exist, return an empty list.
+    """
+    return load_flashcards(fach_name)[0]
+
+
+def merge_flashcards(base, mine, theirs):
+    """
+    Three-way merge of card lists by card id. Field changes made in `mine`
+    relative to `base` win, everything else is taken from `theirs`. A card
+    deleted on one side stays deleted unless the other side modified it.
+    """
+    base_by_id = {card["id"]: card for card in base}
+    mine_by_id = {card["id"]: card for card in mine}
+    theirs_by_id = {card["id"]: card for card in theirs}
+
+    merged = []
+    for card_id, their_card in theirs_by_id.items():
+        base_card = base_by_id.get(card_id)
+        my_card = mine_by_id.get(card_id)
+        if base_card is None:
+            # Added by them (or by both): keep their version, overlay mine
+            merged.append({**their_card, **(my_card or {})})
+        elif my_card is None:
+            # Deleted by me: keep only if they changed it in the meantime
+            if their_card != base_card:
+                merged.append(their_card)
+        else:
+            card = dict(their_card)
+            for field in set(my_card) | set(base_card):
+                if my_card.get(field) != base_card.get(field):
+                    if field in my_card:
+                        card[field] = my_card[field]
+                    else:
+                        card.pop(field, None)
+            merged.append(card)
+
+    for card_id, my_card in mine_by_id.items():
+        if card_id in theirs_by_id:
+            continue
+        base_card = base_by_id.get(card_id)
+        # New cards of mine, or cards they deleted that I modified
+        if base_card is None or my_card != base_card:
+            merged.append(my_card)
+    return merged
+
+
+async def _prune_generations(safe_fach, generation):
+    stale = generation - KEEP_GENERATIONS
+    if stale >= 0:
+        await async_storage.get_bucket().remove([_version_path(safe_fach, stale)])
+
+
+def _claim_generation(safe_fach, generation, content):
+    """
+    Create the generation object from the card JSON in `content`, compressed
+    for storage. Returns False if another writer got there first.
+    """
+    data, content_type = card_codec.encode(content)
+    try:
+        _get_bucket().upload(_version_path(safe_fach, generation), data, {"content-type": content_type})
+        return True
+    except Exception as e:
+        if _is_conflict(e):
+            return False
+        raise
+
+
+def _update_local_copies(fach_name, flashcards, generation):
+    # The local replica and search index must never fail a write; they catch up on their next sync
+    for update in (card_replica.apply, search_index.index_fach):
         try:
-            supabase.storage.from_(bucket_name).remove([file_path])
+            update(fach_name, flashcards, generation)
         except Exception:
             pass
-        # Upload the new content (encoded as bytes)
-        supabase.storage.from_(bucket_name).upload(file_path, content.encode('utf-8'))
+
+
+def update_flashcards(fach_name, flashcards, base_generation=None):
+    """
+    Update the flashcards of a fach with the new flashcards content.
+
+    The content is written as a new generation. If another session wrote in
+    the meantime, the card-level changes are merged three-way against
+    base_generation and the write is retried; if base_generation has been
+    pruned since, or is newer than anything stored because the fach was
+    deleted in the meantime, the write fails and the caller has to reload. Without
+    base_generation the given list replaces whatever is current. The
+    pre-versioning flashcards.json is only read, as generation 0.
+    Returns the written generation, or None on failure.
+    """
+    safe_fach = _to_storage_safe_component(fach_name)
+    flashcards = _ensure_card_ids([dict(card) for card in flashcards])
+    try:
+        current = _latest_generation(safe_fach)
+        if current == 0:
+            # Freeze the pre-versioning file as generation 0, so later merges
+            # against base_generation 0 see what was actually read.
+            _claim_generation(safe_fach, 0, card_codec.dumps(_download_generation(safe_fach, 0)))
+        if base_generation is None:
+            base_generation = current
+        if base_generation > current:
+            # Read from a fach that has been deleted (and maybe recreated) since:
+            # merging against it would write the old cards over the new fach
+            st.error("Error updating flashcards: the fach was replaced in the meantime, please reload and retry.")
+            return None
+
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            if current > base_generation:
+                try:
+                    # Generation 0 is frozen by the first write, so flashcards.json no longer stands in for it
+                    base = _download_generation(safe_fach, base_generation, legacy=False)
+                except Exception:
+                    # Base generation already pruned: without it the writer's own
+                    # changes can't be told apart from what others changed since
+                    st.error("Error updating flashcards: the cards were changed elsewhere in the meantime, "
+                             "please reload and retry.")
+                    return None
+                theirs = _download_generation(safe_fach, current)
+                flashcards = merge_flashcards(base, flashcards, theirs)
+                base_generation = current
+
+            generation = current + 1
+            content = card_codec.dumps(flashcards)
+            if not _claim_generation(safe_fach, generation, content):
+                current = max(_latest_generation(safe_fach), generation)
+                continue
+
+            # A failed prune only leaves an old generation behind
+            async_storage.run(_prune_generations(safe_fach, generation))
+            _update_local_copies(fach_name, flashcards, generation)
+            return generation
+
+        st.error("Error updating flashcards: too many concurrent changes, please retry.")
     except Exception as e:
         st.error(f"Error updating flashcards: {e}")
+    return None
 
 def save_flashcard(fach_name, flashcard_dict):
     """
-    Append a new flashcard to the flashcards.json file stored in Supabase.
+    Append a new flashcard to the flashcards of a fach.
     """
-    flashcards = get_flashcards(fach_name)
+    flashcards, generation = load_flashcards(fach_name)
     flashcards.append(flashcard_dict)
-    update_flashcards(fach_name, flashcards)
+    update_flashcards(fach_name, flashcards, base_generation=generation)
 
 def delete_document(fach_name, document_name):
     """
-    Delete a PDF document from the uploads folder, remove its flashcards,
-    and delete the corresponding mindmap file and images from Supabase storage.
+    Delete a PDF document (its blob, unless another document has the same
+    content, or its legacy upload), remove its flashcards, and delete the
+    corresponding mindmap file and the page images no other card uses.
     """
-    # Delete the PDF document from uploads
+    # Imported here: document_store builds on this module
+    from backend import document_store
+
     safe_fach = _to_storage_safe_component(fach_name)
-    safe_document = _to_storage_safe_component(document_name)
-    pdf_path = f"{safe_fach}/uploads/{safe_document}"
-    try:
-        supabase.storage.from_(bucket_name).remove([pdf_path])
-    except Exception as e:
-        st.error(f"Error deleting PDF: {e}")
+    # Only the extension is cut off: "VL 1.1" and "VL 1.2" keep separate files
+    document_stem = _to_storage_safe_component(document_name).rsplit('.', 1)[0]
+    mindmap_path = f"{safe_fach}/mindmaps/{document_stem}_mindmap.html"
+    bucket = async_storage.get_bucket()
 
-    # Remove flashcards belonging to this document
-    flashcards = get_flashcards(fach_name)
-    original_count = len(flashcards)
-    flashcards = [card for card in flashcards if card.get("upload", "Unbekannt") != document_name]
-    if len(flashcards) < original_count:
-        update_flashcards(fach_name, flashcards)
+    flashcards, generation = load_flashcards(fach_name)
+    kept_flashcards = [card for card in flashcards if card.get("upload", "Unbekannt") != document_name]
+    # Documents with the same content share their page images: remove the
+    # document's images (by name or referenced by its cards) no other card uses
+    kept_images = _image_files(kept_flashcards)
+    document_images = _image_files(card for card in flashcards if card.get("upload", "Unbekannt") == document_name)
 
-    # Delete the corresponding mindmap file from the mindmaps folder
-    mindmap_path = f"{safe_fach}/mindmaps/{safe_document.split('.')[0]}_mindmap.html"
-    try:
-        supabase.storage.from_(bucket_name).remove([mindmap_path])
-    except Exception as e:
-        st.error(f"Error deleting mindmap: {e}")
+    # Delete the PDF, the mindmap file and the page images in the background
+    # while the document's flashcards are removed
+    pending = async_storage.submit(
+        bucket.remove(document_store.forget_document(fach_name, document_name)),
+        bucket.remove([mindmap_path]),
+        _remove_page_images(bucket, safe_fach, document_stem, document_images - kept_images, kept_images),
+    )
 
-    # Delete the corresponding images from the images folder
-    try:
-        images_folder = f"{safe_fach}/images/"
-        # List all files in the images folder
-        images_list = supabase.storage.from_(bucket_name).list(images_folder)
-        document_stem = safe_document.split('.')[0]
-        images_to_delete = []
-        # Filter files that start with the document stem (e.g. "DocumentName_page_")
-        for file in images_list:
-            if file["name"].startswith(f"{document_stem}_page_"):
-                images_to_delete.append(f"{safe_fach}/images/{file['name']}")
-        if images_to_delete:
-            supabase.storage.from_(bucket_name).remove(images_to_delete)
-    except Exception as e:
-        st.error(f"Error deleting images: {e}")
+    if len(kept_flashcards) < len(flashcards):
+        update_flashcards(fach_name, kept_flashcards, base_generation=generation)
+
+    for label, result in zip(("PDF", "mindmap", "images"), pending.result()):
+        if isinstance(result, Exception):
+            st.error(f"Error deleting {label}: {result}")
+
+
+def _image_files(flashcards):
+    return {
+        image[kind] for card in flashcards for image in card.get("images") or []
+        for kind in ("file", "display", "thumb") if image.get(kind)
+    }
+
+
+async def _remove_page_images(bucket, safe_fach, document_stem, extra=(), keep=()):
+    # Files in the images folder that start with the document stem (e.g. "DocumentName_page_"),
+    # plus `extra` files, except the ones in `keep`
+    images_list = await bucket.list(f"{safe_fach}/images/")
+    images_to_delete = [
+        f"{safe_fach}/images/{file['name']}" for file in images_list
+        if (file["name"].startswith(f"{document_stem}_page_") or file["name"] in extra)
+        and file["name"] not in keep
+    ]
+    if images_to_delete:
+        await bucket.remove(images_to_delete)
@@ -0,0 +1,339 @@
+# backend/generation.py
+import base64
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from backend.flashcard_manager import load_flashcards, new_card_id, update_flashcards
+from backend.image_derivatives import upload_page_images
+from backend.telemetry import span
+
+# Spacing between the starts of two model calls to prevent rate limiting
+PAGE_PAUSE_SECONDS = 20
+# Model calls running at the same time, across all sessions and batch uploads
+MAX_CONCURRENT_MODEL_CALLS = 4
+
+# Packing (opt-in with [generation] pack_pages = true): consecutive pages with
+# at least PACK_MIN_TEXT_CHARS of extracted text share one model request, up to
+# PACK_MAX_PAGES pages and an estimated PACK_TOKEN_BUDGET input tokens. Pages
+# with little text (figures, scans) keep their own request with the full image.
+PACK_MAX_PAGES = 8
+PACK_TOKEN_BUDGET = 6000
+PACK_MIN_TEXT_CHARS = 300
+# Input tokens of a page image sent in low detail
+LOW_DETAIL_IMAGE_TOKENS = 85
+
+MINDMAP_STYLE = """
+<style>
+body {
+    background-color: #f0f0f0;
+    margin: 0;
+    padding: 10px;
+}
+* {
+    font-family: 'Calibri', sans-serif;
+}
+</style>
+"""
+
+
+class ModelLimiter:
+    """
+    Caps the model calls of this process: at most max_concurrent at a time, and
+    their starts at least `interval` seconds apart. Shared by the generation of
+    single documents and batch uploads, so both together stay under the limits.
+    """
+
+    def __init__(self, max_concurrent, interval):
+        self.interval = interval
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, **attributes):
+        """Wait for a free call slot (recorded as a "pause" span), then hold it for the call."""
+        with span("pause", **attributes):
+            self._slots.acquire()
+            try:
+                self._wait_turn()
+            except BaseException:
+                self._slots.release()
+                raise
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        time.sleep(start - now)
+
+
+_model_limiter = None
+_model_limiter_lock = threading.Lock()
+
+
+def _settings():
+    try:
+        return st.secrets.get("generation", {})
+    except Exception:
+        return {}
+
+
+def model_limiter():
+    """
+    The process-wide ModelLimiter. [generation] max_concurrent_calls and
+    requests_per_minute in the secrets override the defaults.
+    """
+    global _model_limiter
+    with _model_limiter_lock:
+        if _model_limiter is None:
+            settings = _settings()
+            requests_per_minute = settings.get("requests_per_minute", 60 / PAGE_PAUSE_SECONDS)
+            _model_limiter = ModelLimiter(
+                settings.get("max_concurrent_calls", MAX_CONCURRENT_MODEL_CALLS), 60 / requests_per_minute
+            )
+        return _model_limiter
+
+
+def render_page(page):
+    """Render a PDF page at 2x as PNG and extract its text. Returns (png_bytes, page_text)."""
+    import fitz  # PyMuPDF
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+    return pix.tobytes(), page.get_text("text") or ""
+
+
+def request_page_card(image_bytes, page_text, file_name, page_number, on_partial=None):
+    """
+    Ask the model for a flashcard using BOTH the page text and the page image.
+    Returns the card dict; raises json.JSONDecodeError with the raw output in .doc.
+    on_partial(page_number, partial_card) streams the card while it is written.
+    """
+    from backend import gpt_interface
+
+    with model_limiter().slot(page=page_number):
+        gpt_output = gpt_interface.analyze_image_for_flashcard_base64(
+            base64_image=base64.b64encode(image_bytes).decode('utf-8'),
+            upload_name=file_name,
+            page_number=page_number,
+            page_text=page_text,
+            on_partial=on_partial,
+        )
+    flashcard = json.loads(gpt_output)
+
+    if "priority" not in flashcard:
+        flashcard["priority"] = 2
+    # Ensure page key exists for Learning Studio sidebar
+    flashcard["page"] = page_number
+    flashcard["id"] = new_card_id()
+    return flashcard
+
+
+def pack_limits():
+    """
+    (max pages, input token budget) of one packed request, from [generation]
+    pack_max_pages and pack_token_budget; (1, 0) while pack_pages is off.
+    """
+    settings = _settings()
+    if not settings.get("pack_pages", False):
+        return 1, 0
+    return settings.get("pack_max_pages", PACK_MAX_PAGES), settings.get("pack_token_budget", PACK_TOKEN_BUDGET)
+
+
+def _estimated_tokens(page_text):
+    # German text runs at roughly three characters per token
+    return len(page_text) // 3 + LOW_DETAIL_IMAGE_TOKENS
+
+
+def fits_pack(pack, limits):
+    """Whether these rendered pages (page_number, image_bytes, page_text) may share one request."""
+    max_pages, token_budget = limits
+    if len(pack) == 1:
+        return True
+    return (
+        len(pack) <= max_pages
+        and all(len(page_text.strip()) >= PACK_MIN_TEXT_CHARS for _, _, page_text in pack)
+        and sum(_estimated_tokens(page_text) for _, _, page_text in pack) <= token_budget
+    )
+
+
+def page_packs(pages, limits=None):
+    """
+    Group rendered pages into runs of consecutive pages for request_page_cards.
+    The pack size adapts to the text of the pages: a pack ends when the next
+    page would exceed the token budget or has too little text to go without
+    its full image.
+    """
+    limits = limits or pack_limits()
+    pack = []
+    for page in pages:
+        if pack and not fits_pack(pack + [page], limits):
+            yield pack
+            pack = []
+        pack.append(page)
+    if pack:
+        yield pack
+
+
+def request_page_cards(pack, file_name, on_partial=None):
+    """
+    Flashcards for a pack of rendered pages (page_number, image_bytes, page_text).
+    Several pages go out as one request; if that fails or its cards don't match
+    the pages one-to-one, each page is requested on its own. Returns
+    (page_number, flashcard or exception) pairs in page order. on_partial is
+    passed on to the model calls (see request_page_card).
+    """
+    from backend import gpt_interface
+
+    if len(pack) > 1:
+        with model_limiter().slot(page=pack[0][0]):
+            gpt_outputs = gpt_interface.analyze_pages_for_flashcards(
+                [
+                    {
+                        "page_number": page_number,
+                        "page_text": page_text,
+                        "base64_image": base64.b64encode(image_bytes).decode('utf-8'),
+                    }
+                    for page_number, image_bytes, page_text in pack
+                ],
+                upload_name=file_name,
+                on_partial=on_partial,
+            )
+        if gpt_outputs is not None:
+            results = []
+            for (page_number, _, _), gpt_output in zip(pack, gpt_outputs):
+                flashcard = json.loads(gpt_output)
+                flashcard.setdefault("priority", 2)
+                flashcard["page"] = page_number
+                flashcard["id"] = new_card_id()
+                results.append((page_number, flashcard))
+            return results
+
+    results = []
+    for page_number, image_bytes, page_text in pack:
+        try:
+            results.append(
+                (page_number, request_page_card(image_bytes, page_text, file_name, page_number, on_partial))
+            )
+        except Exception as e:
+            results.append((page_number, e))
+    return results
+
+
+def attach_page_images(flashcard, selected_fach, file_name, page_number, image_bytes, warn=st.warning):
+    """
+    Store the page in full, display and thumbnail size and reference it from the card.
+    Inline base64 is only kept if the upload fails, which is reported through `warn`.
+    """
+    try:
+        with span("images", page=page_number, image_bytes=len(image_bytes)):
+            flashcard["images"] = [upload_page_images(selected_fach, file_name, page_number, image_bytes)]
+    except Exception as e:
+        warn(f"Bild für Seite {page_number} konnte nicht gespeichert werden: {e}")
+        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        flashcard["images"] = [{"page": page_number, "base64": base64_image}]
+        # Keep "image_base64" for the Anki export when the image is not in storage
+        flashcard["image_base64"] = base64_image
+    return flashcard
+
+
+def pack_cards(selected_fach, file_name, pack, warn=st.warning, on_partial=None):
+    """request_page_cards for a pack, then store the images of each generated card."""
+    images = {page_number: image_bytes for page_number, image_bytes, _ in pack}
+    results = []
+    for page_number, result in request_page_cards(pack, file_name, on_partial):
+        if not isinstance(result, Exception):
+            result = attach_page_images(result, selected_fach, file_name, page_number, images[page_number], warn=warn)
+        results.append((page_number, result))
+    return results
+
+
+def generate_document_cards(selected_fach, file_name, pages, on_partial=None):
+    """
+    Render and generate the cards of (page_number, page) pairs, packing pages
+    into shared requests if enabled. Yields (page_number, flashcard or
+    exception) in page order as each request is done; with on_partial, the
+    cards are streamed while they are written (see request_page_card).
+    """
+    limits = pack_limits()
+    pack = []
+    for page_number, page in pages:
+        try:
+            with span("render", page=page_number):
+                image_bytes, page_text = render_page(page)
+        except Exception as e:
+            if pack:
+                yield from pack_cards(selected_fach, file_name, pack, on_partial=on_partial)
+                pack = []
+            yield page_number, e
+            continue
+        if pack and not fits_pack(pack + [(page_number, image_bytes, page_text)], limits):
+            yield from pack_cards(selected_fach, file_name, pack, on_partial=on_partial)
+            pack = []
+        pack.append((page_number, image_bytes, page_text))
+    if pack:
+        yield from pack_cards(selected_fach, file_name, pack, on_partial=on_partial)
+
+
+def document_text(doc, excluded_pages):
+    """Full text of all non-excluded pages."""
+    return "\n\n".join(
+        doc[page_num].get_text("text") or ""
+        for page_num in range(doc.page_count)
+        if page_num + 1 not in excluded_pages
+    )
+
+
+def mindmap_html_from_json(mindmap_json):
+    """Turn the model's mindmap JSON (nodes, edges) into a standalone pyvis HTML page."""
+    from pyvis.network import Network
+
+    mindmap_data = json.loads(mindmap_json)
+    net = Network(height="600px", width="100%", directed=True, notebook=False)
+    for node in mindmap_data["nodes"]:
+        net.add_node(node, label=node)
+    for edge in mindmap_data["edges"]:
+        net.add_edge(edge[0], edge[1])
+
+    return net.generate_html().replace("</head>", MINDMAP_STYLE + "</head>")
+
+
+def generate_mindmap_card(doc, file_name, excluded_pages):
+    """Generate the mindmap of a document and return it as a mindmap flashcard."""
+    return mindmap_card_from_text(document_text(doc, excluded_pages), file_name)
+
+
+def mindmap_card_from_text(text, file_name):
+    """Generate a mindmap flashcard from the already extracted text of a document."""
+    from backend import gpt_interface
+
+    with model_limiter().slot():
+        mindmap_json = gpt_interface.generate_mindmap_from_text(text, file_name)
+    return {
+        "upload": file_name,
+        "question": f"Mindmap für {file_name}",
+        "answer": mindmap_html_from_json(mindmap_json),
+        "mindmap": True,
+        "page": None,
+        "priority": 2,
+        "id": new_card_id()
+    }
+
+
+def save_document_cards(selected_fach, file_name, flashcards):
+    """
+    Replace the cards of one document; other documents in the fach stay untouched.
+    Returns the written generation.
+    """
+    with span("save"):
+        existing_flashcards, generation = load_flashcards(selected_fach)
+        kept_flashcards = [card for card in existing_flashcards if card.get("upload", "Unbekannt") != file_name]
+        return update_flashcards(selected_fach, kept_flashcards + flashcards, base_generation=generation)
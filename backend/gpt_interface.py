@@ -2,19 +2,64 @@
 
 import json
 import streamlit as st
+from jiter import from_json
 from openai import OpenAI
 from pydantic import BaseModel, Field
 
+from backend.telemetry import record_response, span
+
 
 # Single source of truth for the model to ensure it's used everywhere
 MODEL = "gpt-5.2-2025-12-11"
 
 
+_client = None
+
+
 def _get_client() -> OpenAI:
-    api_key = st.secrets.get("openai", {}).get("api_key")
-    if not api_key:
-        raise RuntimeError("Missing st.secrets['openai']['api_key']")
-    return OpenAI(api_key=api_key)
+    """Shared OpenAI client, created on the first model call."""
+    global _client
+    if _client is None:
+        api_key = st.secrets.get("openai", {}).get("api_key")
+        if not api_key:
+            raise RuntimeError("Missing st.secrets['openai']['api_key']")
+        _client = OpenAI(api_key=api_key)
+    return _client
+
+
+def _parse(call, on_text=None, **request):
+    """
+    responses.parse with the model usage recorded on the span. With `on_text`
+    the response is streamed instead, and on_text is called with the output
+    text received so far after every delta.
+    """
+    client = _get_client()
+    if on_text is None:
+        raw_response = client.responses.with_raw_response.parse(**request)
+        response = raw_response.parse()
+        record_response(call, raw_response, response)
+        return response
+
+    with client.responses.stream(**request) as stream:
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                on_text(event.snapshot)
+        response = stream.get_final_response()
+    record_response(call, stream, response)
+    return response
+
+
+def partial_output(text: str) -> dict:
+    """
+    The fields of an unfinished structured output that can be read so far, e.g.
+    {"upload": "...", "question": "Was ist", "answer": ["• Ein"]}. Strings cut
+    off mid-way are included as far as they go.
+    """
+    try:
+        value = from_json(text.encode("utf-8"), partial_mode="trailing-strings")
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
 
 
 # ----------------------------
@@ -27,6 +72,10 @@ class Flashcard(BaseModel):
     page: int
 
 
+class FlashcardBatch(BaseModel):
+    cards: list[Flashcard]
+
+
 class Mindmap(BaseModel):
     nodes: list[str] = Field(default_factory=list)
     edges: list[list[str]] = Field(default_factory=list)
@@ -35,15 +84,29 @@ class Mindmap(BaseModel):
 # ----------------------------
 # Flashcard generation (text + image)
 # ----------------------------
+FLASHCARD_GUIDELINES = """
+Vorgaben:
+- Formuliere eine präzise, aber umfassende Frage, die das Hauptthema der Seite abdeckt.
+- Die Antwort muss eine Liste von kurzen, prägnanten Stichpunkten sein.
+- Jeder Stichpunkt muss mit "•" beginnen und als Halbsatz formuliert sein.
+- Verwende einfache, leicht verständliche Sprache.
+- Erkläre alle Fachbegriffe und themenbezogenen Begriffe immer in einfachen Worten.
+- Inkludiere alle auf der Seite vorkommenden Fachbegriffe in der Karteikarte.
+""".strip()
+
+
 def analyze_image_for_flashcard_base64(
     base64_image: str,
     upload_name: str,
     page_number: int,
     page_text: str,
+    on_partial=None,
 ) -> str:
     """
     Analyze a PDF page using BOTH extracted text and rendered page image.
     Returns a JSON string that conforms to the Flashcard schema (Structured Outputs).
+    With on_partial(page_number, partial_card) the answer is streamed and the
+    card is passed on while it is being written.
     """
     prompt = f"""
 Analysiere diese PDF-Seite und erstelle eine Lernkarte.
@@ -52,13 +115,7 @@ WICHTIG: Nutze BEIDE Inputs:
 - Den extrahierten Text (unten)
 - Das Folienbild (Bildinput)
 
-Vorgaben:
-- Formuliere eine präzise, aber umfassende Frage, die das Hauptthema der Seite abdeckt.
-- Die Antwort muss eine Liste von kurzen, prägnanten Stichpunkten sein.
-- Jeder Stichpunkt muss mit "•" beginnen und als Halbsatz formuliert sein.
-- Verwende einfache, leicht verständliche Sprache.
-- Erkläre alle Fachbegriffe und themenbezogenen Begriffe immer in einfachen Worten.
-- Inkludiere alle auf der Seite vorkommenden Fachbegriffe in der Karteikarte.
+{FLASHCARD_GUIDELINES}
 
 Kontext:
 - Dokument: {upload_name}
@@ -68,47 +125,126 @@ Extrahierter Text der Seite (kann unvollständig sein, nutze zusätzlich das Bil
 {page_text}
 """.strip()
 
-    try:
-        client = _get_client()
-        response = client.responses.parse(
-            model=MODEL,
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": prompt},
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/png;base64,{base64_image}",
-                        },
-                    ],
-                }
-            ],
-            # Structured Outputs (strict) using Pydantic schema:
-            text_format=Flashcard,
-            temperature=0.3,
-            max_output_tokens=800,
-        )
-
-        card: Flashcard = response.output_parsed
-
-        # Enforce deterministic metadata (prevents accidental drift)
-        card.upload = upload_name
-        card.page = page_number
-
-        return json.dumps(card.model_dump(), ensure_ascii=False)
-
-    except Exception as e:
-        error_json = {
-            "upload": upload_name,
-            "question": f"Error processing page {page_number}",
-            "answer": [
-                f"An error occurred: {str(e)}",
-                "Please try regenerating this card or check the page.",
-            ],
-            "page": page_number,
-        }
-        return json.dumps(error_json, ensure_ascii=False)
+    with span("model.flashcard", page=page_number, model=MODEL, image_bytes=len(base64_image) * 3 // 4) as call:
+        try:
+            response = _parse(
+                call,
+                on_text=on_partial and (lambda text: on_partial(page_number, partial_output(text))),
+                model=MODEL,
+                input=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "input_text", "text": prompt},
+                            {
+                                "type": "input_image",
+                                "image_url": f"data:image/png;base64,{base64_image}",
+                            },
+                        ],
+                    }
+                ],
+                # Structured Outputs (strict) using Pydantic schema:
+                text_format=Flashcard,
+                temperature=0.3,
+                max_output_tokens=800,
+            )
+            card: Flashcard = response.output_parsed
+
+            # Enforce deterministic metadata (prevents accidental drift)
+            card.upload = upload_name
+            card.page = page_number
+
+            return json.dumps(card.model_dump(), ensure_ascii=False)
+
+        except Exception as e:
+            # The error is returned as a card, so record it on the span here
+            call["error"] = type(e).__name__
+            error_json = {
+                "upload": upload_name,
+                "question": f"Error processing page {page_number}",
+                "answer": [
+                    f"An error occurred: {str(e)}",
+                    "Please try regenerating this card or check the page.",
+                ],
+                "page": page_number,
+            }
+            return json.dumps(error_json, ensure_ascii=False)
+
+
+def analyze_pages_for_flashcards(pages: list[dict], upload_name: str, on_partial=None) -> list[str] | None:
+    """
+    One request for several consecutive pages, each given as a dict with
+    page_number, page_text and base64_image. The instruction prompt is sent
+    once; page images go along in low detail, so this suits pages whose
+    content is mostly in their text. Returns one Flashcard JSON string per
+    page in the given order, or None if the request failed or the returned
+    cards don't map one-to-one onto the requested pages (the caller then
+    falls back to single-page requests). on_partial streams the cards as with
+    analyze_image_for_flashcard_base64, attributed to the pages by position.
+    """
+    page_numbers = [page["page_number"] for page in pages]
+
+    def show_partial(text):
+        cards = partial_output(text).get("cards") or []
+        if 0 < len(cards) <= len(page_numbers) and isinstance(cards[-1], dict):
+            # Only the card currently being written changes
+            on_partial(page_numbers[len(cards) - 1], cards[-1])
+
+    prompt = f"""
+Analysiere die folgenden {len(pages)} PDF-Seiten und erstelle für JEDE Seite genau eine Lernkarte.
+
+WICHTIG: Nutze für jede Seite BEIDE Inputs:
+- Den extrahierten Text der Seite
+- Das Folienbild, das direkt auf den Text der Seite folgt
+
+{FLASHCARD_GUIDELINES}
+- Gib die Karten in der Reihenfolge der Seiten zurück und setze "page" auf die Seitenzahl der jeweiligen Seite.
+
+Kontext:
+- Dokument: {upload_name}
+- Seiten: {", ".join(str(number) for number in page_numbers)}
+""".strip()
+
+    content = [{"type": "input_text", "text": prompt}]
+    for page in pages:
+        content.append({
+            "type": "input_text",
+            "text": f"Seite {page['page_number']} – extrahierter Text (kann unvollständig sein):\n{page['page_text']}",
+        })
+        content.append({
+            "type": "input_image",
+            "image_url": f"data:image/png;base64,{page['base64_image']}",
+            "detail": "low",
+        })
+
+    image_bytes = sum(len(page["base64_image"]) * 3 // 4 for page in pages)
+    with span("model.flashcard_pack", page=page_numbers[0], model=MODEL, image_bytes=image_bytes) as call:
+        try:
+            response = _parse(
+                call,
+                on_text=on_partial and show_partial,
+                model=MODEL,
+                input=[{"role": "user", "content": content}],
+                text_format=FlashcardBatch,
+                temperature=0.3,
+                max_output_tokens=800 * len(pages),
+            )
+            cards = response.output_parsed.cards
+        except Exception as e:
+            call["error"] = type(e).__name__
+            return None
+
+        cards_by_page = {card.page: card for card in cards}
+        if len(cards) != len(pages) or sorted(cards_by_page) != sorted(page_numbers):
+            call["error"] = "PageMismatch"
+            return None
+
+        outputs = []
+        for page_number in page_numbers:
+            card = cards_by_page[page_number]
+            card.upload = upload_name
+            outputs.append(json.dumps(card.model_dump(), ensure_ascii=False))
+        return outputs
 
 
 # ----------------------------
@@ -137,18 +273,18 @@ Text des Dokuments:
 {full_text}
 """.strip()
 
-    try:
-        client = _get_client()
-        response = client.responses.parse(
-            model=MODEL,
-            input=prompt,
-            text_format=Mindmap,
-            temperature=0.3,
-            max_output_tokens=1200,
-        )
-
-        mindmap: Mindmap = response.output_parsed
-        return json.dumps(mindmap.model_dump(), ensure_ascii=False)
-
-    except Exception as e:
-        raise Exception(f"Error generating mindmap from text: {e}")
+    with span("model.mindmap", model=MODEL) as call:
+        try:
+            response = _parse(
+                call,
+                model=MODEL,
+                input=prompt,
+                text_format=Mindmap,
+                temperature=0.3,
+                max_output_tokens=1200,
+            )
+            mindmap: Mindmap = response.output_parsed
+            return json.dumps(mindmap.model_dump(), ensure_ascii=False)
+
+        except Exception as e:
+            raise Exception(f"Error generating mindmap from text: {e}")
@@ -0,0 +1,152 @@
+# backend/image_derivatives.py
+import base64
+import io
+import sys
+
+import streamlit as st
+from PIL import Image
+
+from backend.storage_utils import (
+    IMAGE_CACHE_CONTROL,
+    _get_supabase,
+    _to_storage_safe_component,
+    fetch_image,
+    image_cache,
+    page_image_filename,
+)
+
+# Longest edge in pixels; the full-resolution original is kept as PNG
+THUMB_SIZE = 240
+DISPLAY_SIZE = 1280
+WEBP_QUALITY = 80
+
+
+def derivative_filenames(document_name, page_number):
+    """
+    Filenames of all sizes of a page, stored next to each other under <fach>/images/.
+    All of them start with "<stem>_page_<n>", so delete_document removes them together.
+    """
+    full = page_image_filename(document_name, page_number)
+    stem = full.rsplit(".", 1)[0]
+    return {
+        "file": full,
+        "display": f"{stem}_display.webp",
+        "thumb": f"{stem}_thumb.webp",
+    }
+
+
+def _to_webp(image, max_size):
+    resized = image.copy()
+    resized.thumbnail((max_size, max_size))
+    out = io.BytesIO()
+    resized.save(out, format="WEBP", quality=WEBP_QUALITY, method=4)
+    return out.getvalue()
+
+
+def make_derivatives(png_bytes):
+    """Return {"display": webp_bytes, "thumb": webp_bytes} for a full-size page PNG."""
+    with Image.open(io.BytesIO(png_bytes)) as image:
+        image = image.convert("RGB")
+        return {
+            "display": _to_webp(image, DISPLAY_SIZE),
+            "thumb": _to_webp(image, THUMB_SIZE),
+        }
+
+
+def upload_page_images(selected_fach, document_name, page_number, png_bytes):
+    """
+    Store the full-resolution page and its display and thumbnail derivatives.
+    Returns the images[] entry for the card, e.g.
+    {"page": 3, "file": "..._page_3.png", "display": "..._display.webp", "thumb": "..._thumb.webp"}.
+    """
+    bucket_name = st.secrets["supabase"]["bucket"]
+    safe_fach = _to_storage_safe_component(selected_fach)
+    filenames = derivative_filenames(document_name, page_number)
+    contents = {"file": png_bytes, **make_derivatives(png_bytes)}
+
+    bucket = _get_supabase().storage.from_(bucket_name)
+    for kind, filename in filenames.items():
+        bucket.upload(
+            f"{safe_fach}/images/{filename}",
+            contents[kind],
+            {
+                "content-type": "image/png" if kind == "file" else "image/webp",
+                "cache-control": IMAGE_CACHE_CONTROL,
+                "upsert": "true",
+            },
+        )
+        image_cache.put((safe_fach, filename), contents[kind])
+    return {"page": page_number, **filenames}
+
+
+def smallest_image_file(img_info, size="display"):
+    """
+    Pick the smallest stored image that still fits the requested size
+    ("thumb" or "display"), falling back to larger ones for older cards.
+    """
+    order = ["thumb", "display", "file"] if size == "thumb" else ["display", "file"]
+    for kind in order:
+        if img_info.get(kind):
+            return img_info[kind]
+    return None
+
+
+def backfill_fach(fach_name):
+    """
+    Generate derivatives for all cards of a fach that don't have them yet.
+    Inline base64 page images (in images[] or the legacy "image_base64") are
+    moved to storage on the way and dropped from the cards.
+    Returns the number of updated cards.
+    """
+    # Imported here: flashcard_manager is only needed by the backfill command
+    from backend.flashcard_manager import load_flashcards, update_flashcards
+
+    flashcards, generation = load_flashcards(fach_name)
+    updated = 0
+    for card in flashcards:
+        images = card.get("images") or []
+        if images and images[0].get("thumb"):
+            # Backfilled by an earlier version that left the inline copy in place
+            if card.pop("image_base64", None) is not None:
+                updated += 1
+            continue
+        if not images and card.get("image_base64"):
+            images = [{"page": card.get("page"), "base64": card["image_base64"]}]
+        if not images:
+            continue
+        img_info = images[0]
+        page_number = img_info.get("page") or card.get("page")
+        try:
+            if img_info.get("base64"):
+                png_bytes = base64.b64decode(img_info["base64"])
+            elif img_info.get("file"):
+                png_bytes = fetch_image(fach_name, img_info["file"])
+            else:
+                continue
+            card["images"] = [upload_page_images(fach_name, card.get("upload", "Unbekannt"), page_number, png_bytes)] + images[1:]
+            # The image is in storage now, the Anki export reads it from there
+            card.pop("image_base64", None)
+            updated += 1
+        except Exception as e:
+            print(f"  {card.get('upload')} page {page_number}: {e}", file=sys.stderr)
+
+    if updated:
+        update_flashcards(fach_name, flashcards, base_generation=generation)
+    return updated
+
+
+def main(argv):
+    """
+    Backfill command for existing fächer:
+        python -m backend.image_derivatives            # all fächer
+        python -m backend.image_derivatives EAM Mathe  # selected fächer
+    """
+    from backend.fach_manager import get_all_faecher
+
+    faecher = argv or get_all_faecher()
+    for fach in faecher:
+        print(f"{fach}: {backfill_fach(fach)} cards updated")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
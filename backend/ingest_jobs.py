@@ -0,0 +1,131 @@
+# backend/ingest_jobs.py
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from backend.document_store import add_document
+from backend.generation import (
+    MAX_CONCURRENT_MODEL_CALLS, fits_pack, mindmap_card_from_text, pack_cards, pack_limits, render_page,
+    save_document_cards,
+)
+from backend.job_registry import JobRegistry
+from backend.telemetry import document_run, span
+
+# Documents uploaded and rendered at the same time, shared by all batch uploads of this process
+MAX_PARALLEL_DOCUMENTS = 3
+
+# Pages and mindmaps wait in the page pool for a model slot (see generation.model_limiter),
+# so one document's model calls overlap with the next document's upload and rendering.
+_document_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOCUMENTS, thread_name_prefix="ingest-document")
+_page_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_MODEL_CALLS * 2, thread_name_prefix="ingest-page")
+_jobs = JobRegistry("documents")
+
+
+def _update(job_id, file_name, **changes):
+    _jobs.update(job_id, file_name, **changes)
+
+
+def _add_error(job_id, file_name, message):
+    with _jobs.item(job_id, file_name) as entry:
+        entry["errors"].append(message)
+
+
+def _submit(function, *args):
+    # Each task runs in its own copy of the context, so its spans belong to the document's run
+    return _page_executor.submit(contextvars.copy_context().run, function, *args)
+
+
+def _pack_cards(job_id, selected_fach, file_name, pack):
+    flashcards = []
+    try:
+        results = pack_cards(
+            selected_fach, file_name, pack, warn=lambda message: _add_error(job_id, file_name, message)
+        )
+    except Exception as e:
+        results = [(page_number, e) for page_number, _, _ in pack]
+    for page_number, result in results:
+        if isinstance(result, json.JSONDecodeError):
+            _add_error(job_id, file_name, f"Seite {page_number}: ungültige JSON-Antwort ({result})")
+        elif isinstance(result, Exception):
+            _add_error(job_id, file_name, f"Seite {page_number}: {result}")
+        else:
+            flashcards.append(result)
+    with _jobs.item(job_id, file_name) as entry:
+        entry["pages_done"] += len(pack)
+    return flashcards
+
+
+def _ingest_document(job_id, selected_fach, file_name, pdf_bytes):
+    import fitz  # PyMuPDF
+
+    try:
+        with document_run(selected_fach, file_name):
+            _update(job_id, file_name, status="hochladen")
+            with span("upload"):
+                stored = add_document(selected_fach, file_name, pdf_bytes)
+            if stored["cards"]:
+                # Same content as a document of the fach that has cards: they were reused
+                _update(job_id, file_name, status="fertig", cards=stored["cards"], duplicate_of=stored["duplicate_of"])
+                return
+
+            _update(job_id, file_name, status="rendern")
+            page_futures = []
+            texts = []
+            limits = pack_limits()
+            pack = []
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                _update(job_id, file_name, pages=doc.page_count)
+                for page_num in range(doc.page_count):
+                    with span("render", page=page_num + 1):
+                        image_bytes, page_text = render_page(doc[page_num])
+                    texts.append(page_text)
+                    page = (page_num + 1, image_bytes, page_text)
+                    # Cards of the first pages are requested while the rest is still rendering
+                    if pack and not fits_pack(pack + [page], limits):
+                        page_futures.append(_submit(_pack_cards, job_id, selected_fach, file_name, pack))
+                        pack = []
+                    pack.append(page)
+                if pack:
+                    page_futures.append(_submit(_pack_cards, job_id, selected_fach, file_name, pack))
+            mindmap_future = _submit(mindmap_card_from_text, "\n\n".join(texts), file_name)
+
+            _update(job_id, file_name, status="karten")
+            wait(page_futures + [mindmap_future])
+            flashcards = [flashcard for future in page_futures for flashcard in future.result()]
+            try:
+                flashcards.append(mindmap_future.result())
+            except Exception as e:
+                _add_error(job_id, file_name, f"Mindmap: {e}")
+
+            _update(job_id, file_name, status="speichern")
+            if save_document_cards(selected_fach, file_name, flashcards) is None:
+                raise RuntimeError("Karten konnten nicht gespeichert werden")
+        _update(job_id, file_name, status="fertig", cards=len(flashcards))
+    except Exception as e:
+        _update(job_id, file_name, status="fehler", error=str(e))
+
+
+def start_ingest(selected_fach, files):
+    """
+    Upload, render and generate cards and mindmaps for several PDFs in the
+    background. `files` are (file_name, pdf_bytes) pairs. Stages of different
+    documents overlap; model calls share the process-wide model limiter.
+    Returns a job id for get_ingest_job.
+    """
+    job_id = _jobs.create(
+        {file_name: {"status": "wartend", "pages": None, "pages_done": 0, "errors": []} for file_name, _ in files},
+        fach=selected_fach,
+    )
+    for file_name, pdf_bytes in files:
+        _document_executor.submit(_ingest_document, job_id, selected_fach, file_name, pdf_bytes)
+    return job_id
+
+
+def get_ingest_job(job_id):
+    """
+    Return a snapshot of a job: {"id", "fach", "started", "finished", "documents": {file_name: status dict}}
+    or None if the job is unknown. A document's status dict has "status", "pages",
+    "pages_done" and "errors"; finished documents also "cards", failed ones "error".
+    Documents whose content was already in the fach have "duplicate_of".
+    """
+    return _jobs.snapshot(job_id)
@@ -0,0 +1,66 @@
+# backend/job_registry.py
+import copy
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION = 24 * 3600
+# Statuses of an item that is done; a job is finished once all its items are
+FINISHED_STATUSES = ("fertig", "fehler")
+
+
+class JobRegistry:
+    """
+    Background jobs of one kind in this process (batch uploads, bulk exports),
+    polled by the app while they run. A job is a dict with "id", "started",
+    "finished" and one status dict per item (document, fach) under `items_key`.
+    """
+
+    def __init__(self, items_key):
+        self.items_key = items_key
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, items, **fields):
+        """Register a job with the initial status dict of every item. Returns its id."""
+        self._forget_old_jobs()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                **fields,
+                "started": time.time(),
+                "finished": None if items else time.time(),
+                self.items_key: items,
+            }
+        return job_id
+
+    @contextmanager
+    def item(self, job_id, name):
+        """The status dict of one item, to be changed in place while the registry is locked."""
+        with self._lock:
+            job = self._jobs[job_id]
+            yield job[self.items_key][name]
+            if job["finished"] is None and all(
+                entry["status"] in FINISHED_STATUSES for entry in job[self.items_key].values()
+            ):
+                job["finished"] = time.time()
+
+    def update(self, job_id, name, **changes):
+        with self.item(job_id, name) as entry:
+            entry.update(changes)
+
+    def snapshot(self, job_id):
+        """A copy of a job that is safe to read while it runs, or None if the job is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return copy.deepcopy(job) if job is not None else None
+
+    def _forget_old_jobs(self):
+        now = time.time()
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job["finished"] and now - job["finished"] > JOB_RETENTION]:
+                del self._jobs[job_id]
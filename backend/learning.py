@@ -0,0 +1,106 @@
+# backend/learning.py
+import random
+
+import streamlit as st
+
+# How many upcoming cards are drawn ahead of time so their images can be prefetched
+PREFETCH_AHEAD = 2
+
+
+def _draw_card_index(cards, avoid_index):
+    """Draws a card index based on priority using weighted random selection."""
+    indices = list(range(len(cards)))
+    weights = []
+    for card in cards:
+        priority = card.get("priority", 2)  # Default to medium priority if missing
+        if priority == 1:  # Schwer
+            weights.append(5)
+        elif priority == 2:  # Mittel
+            weights.append(3)
+        else:  # Leicht (Priority 1 or other)
+            weights.append(1)
+
+    chosen_index = -1
+
+    # Try up to 10 times to get a different card than the last one
+    for _ in range(10):
+        if sum(weights) == 0:  # Handle case where all weights might be zero
+            chosen_index = random.choice(indices) if indices else 0
+            break
+        chosen_index = random.choices(indices, weights=weights, k=1)[0]
+        if len(cards) <= 1 or chosen_index != avoid_index:
+            break
+    else:
+        # Fallback if it keeps picking the same one
+        if indices:
+            chosen_index = random.choice(indices)
+
+    return chosen_index
+
+
+def select_next_card(cards, state=None):
+    """
+    Selects the next card index based on priority using weighted random selection.
+    The following picks are drawn ahead and kept in state["upcoming_card_indices"],
+    so their images can be prefetched while the current card is shown.
+    `state` defaults to st.session_state.
+    """
+    if state is None:
+        state = st.session_state
+    if not cards:
+        state["upcoming_card_indices"] = []
+        return 0  # Or handle appropriately
+
+    # Avoid showing the same card twice in a row if possible
+    last_index = state.get('last_shown_index', -1)
+    upcoming = [i for i in state.get('upcoming_card_indices', []) if i < len(cards)]
+
+    if upcoming and (len(cards) <= 1 or upcoming[0] != last_index):
+        chosen_index = upcoming.pop(0)
+    else:
+        upcoming = []
+        chosen_index = _draw_card_index(cards, last_index)
+
+    previous_index = upcoming[-1] if upcoming else chosen_index
+    while len(upcoming) < PREFETCH_AHEAD:
+        previous_index = _draw_card_index(cards, previous_index)
+        upcoming.append(previous_index)
+
+    state["upcoming_card_indices"] = upcoming
+    state["last_shown_index"] = chosen_index
+    return chosen_index
+
+
+def get_page_number(card):
+    images = card.get('images', [])
+    if images and len(images) > 0:
+        return images[0].get('page', float('inf'))
+    return float('inf')
+
+
+def upload_names(flashcards, mindmap_files=()):
+    """Sorted names of all uploads that have cards or a mindmap file in <fach>/mindmaps/."""
+    uploads = set(card.get("upload", "Unbekannt") for card in flashcards)
+    for file in mindmap_files:
+        if file.get("name") == "placeholder.txt":
+            continue
+        uploads.add(file["name"].replace("_mindmap.html", ".pdf"))
+    return sorted(uploads)
+
+
+def sidebar_entries(cards):
+    """(label, help text) of each card for the sidebar navigator."""
+    entries = []
+    for card in cards:
+        page_info = card.get('page')
+        page_num = f"{page_info}  " if page_info else ""
+        entries.append((f"{page_num}{card.get('question','')}", f"Priority: {card.get('priority', 1)}"))
+    return entries
+
+
+def find_card_index(flashcards, card_id):
+    """Position of the card with this id in the full card list, or -1."""
+    for idx, card in enumerate(flashcards):
+        if card.get("id") == card_id:
+            return idx
+    return -1
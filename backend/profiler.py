@@ -0,0 +1,198 @@
+# backend/profiler.py
+import html
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, deque
+from pathlib import Path
+
+import streamlit as st
+
+# Seconds between two stack samples of the script thread
+SAMPLE_INTERVAL = 0.005
+# Profiles kept in memory for the profiler page
+MAX_PROFILES = 100
+
+_profiles = deque(maxlen=MAX_PROFILES)
+_profiles_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """Profiler mode via ?profile=1 or [profiler] enabled = true."""
+    if st.query_params.get("profile") in ("1", "true"):
+        return True
+    try:
+        return bool(st.secrets.get("profiler", {}).get("enabled"))
+    except Exception:
+        return False
+
+
+def rerun_trigger(state=None):
+    """
+    Best guess at what caused this rerun: the keyed widgets and state values that
+    changed since the previous run (buttons only when clicked). `state` defaults
+    to st.session_state.
+    """
+    if state is None:
+        state = st.session_state
+    snapshot = {
+        key: value for key, value in state.items()
+        if isinstance(value, (bool, int, float, str)) and not key.startswith("_profiler")
+    }
+    previous = state.get("_profiler_snapshot", {})
+    changed = sorted(
+        key for key, value in snapshot.items()
+        if key in previous and previous[key] != value and value is not False
+    )
+    state["_profiler_snapshot"] = snapshot
+    if not previous:
+        return "Seitenaufruf"
+    return ", ".join(changed[:3]) or "Rerun"
+
+
+def _frame_label(frame, script_path):
+    code = frame.f_code
+    if code.co_filename == script_path:
+        # Most of the app runs at module level, so the line is what tells script frames apart
+        return f"{code.co_name} ({Path(script_path).name}:{frame.f_lineno})"
+    return f"{code.co_name} ({Path(code.co_filename).name})"
+
+
+def _stack_from(frame, root_frame):
+    """Labels from root_frame down to frame, or None once root_frame is no longer on the stack."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame, root_frame.f_code.co_filename))
+        if frame is root_frame:
+            return labels[::-1]
+        frame = frame.f_back
+    return None
+
+
+def _sample(profile, thread_id, root_frame, interval):
+    started = time.perf_counter()
+    while True:
+        time.sleep(interval)
+        frame = sys._current_frames().get(thread_id)
+        stack = _stack_from(frame, root_frame) if frame is not None else None
+        if stack is None:
+            break
+        profile["stacks"][";".join(stack)] += 1
+        profile["samples"] += 1
+    profile["seconds"] = time.perf_counter() - started
+    with _profiles_lock:
+        _profiles.append(profile)
+
+
+def start_rerun_profile(view_mode, trigger, interval=None):
+    """
+    Sample the calling script's stack until the script run ends (also through
+    st.rerun or st.stop). The finished profile is kept for the profiler page.
+    """
+    root_frame = sys._getframe(1)
+    interval = interval or st.secrets.get("profiler", {}).get("interval_ms", SAMPLE_INTERVAL * 1000) / 1000
+    profile = {
+        "id": uuid.uuid4().hex[:8],
+        "view_mode": view_mode,
+        "trigger": trigger,
+        "started_at": time.time(),
+        "seconds": None,
+        "samples": 0,
+        "interval": interval,
+        "stacks": Counter(),
+    }
+    threading.Thread(
+        target=_sample, args=(profile, threading.get_ident(), root_frame, interval), daemon=True
+    ).start()
+    return profile
+
+
+def get_profiles(view_mode=None, trigger=None):
+    """Finished profiles, newest first, optionally filtered by view mode and trigger."""
+    with _profiles_lock:
+        profiles = list(_profiles)
+    return [
+        profile for profile in reversed(profiles)
+        if (view_mode is None or profile["view_mode"] == view_mode)
+        and (trigger is None or profile["trigger"] == trigger)
+    ]
+
+
+def merge_stacks(profiles):
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(profile["stacks"])
+    return stacks
+
+
+def hotspots(stacks, interval, top=20):
+    """
+    Top frames by self time (leaf of the sample) and by total time (anywhere on
+    the stack), as rows with estimated milliseconds and share of samples.
+    """
+    total_samples = sum(stacks.values()) or 1
+    self_counts = Counter()
+    total_counts = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+
+    def rows(counts):
+        return [
+            {"Funktion": frame, "ms": round(count * interval * 1000, 1), "Anteil": f"{count / total_samples:.0%}"}
+            for frame, count in counts.most_common(top)
+        ]
+
+    return rows(self_counts), rows(total_counts)
+
+
+def folded_stacks(stacks):
+    """Stacks in the folded format of flamegraph.pl and speedscope."""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+def flamegraph_html(stacks, min_share=0.005):
+    """A self-contained icicle flamegraph (root on top) of the given stacks."""
+    tree = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = tree
+        node["count"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+            node["count"] += count
+    total = tree["count"] or 1
+
+    def render(parent, depth):
+        parts = []
+        shown = 0
+        for frame, node in sorted(parent["children"].items(), key=lambda item: -item[1]["count"]):
+            if node["count"] / total < min_share:
+                continue
+            shown += node["count"]
+            hue = 20 + zlib.crc32(frame.encode("utf-8")) % 40
+            label = html.escape(frame)
+            parts.append(
+                f'<div class="fg" style="flex: {node["count"]} 0 0">'
+                f'<div class="fg-frame" style="background: hsl({hue}, 85%, {62 + depth % 3 * 6}%)" '
+                f'title="{label} – {node["count"] / total:.1%}">{label}</div>'
+                f'<div class="fg-children">{render(node, depth + 1)}</div></div>'
+            )
+        if parts and parent["count"] > shown:
+            # Self time of the parent and hidden small frames keep their share of the width
+            parts.append(f'<div style="flex: {parent["count"] - shown} 0 0"></div>')
+        return "".join(parts)
+
+    return f"""
+<style>
+.fg-root {{ display: flex; font: 11px monospace; width: 100%; }}
+.fg {{ display: flex; flex-direction: column; min-width: 0; }}
+.fg-frame {{ height: 17px; line-height: 17px; overflow: hidden; white-space: nowrap; text-overflow: ellipsis;
+             padding: 0 3px; border: 1px solid white; box-sizing: border-box; cursor: default; }}
+.fg-children {{ display: flex; }}
+</style>
+<div class="fg-root">{render(tree, 0)}</div>
+"""
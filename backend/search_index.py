@@ -0,0 +1,201 @@
+# backend/search_index.py
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+import streamlit as st
+
+DEFAULT_PATH = "search_index.sqlite"
+
+# bm25 weights of the indexed columns: question, answer, upload
+COLUMN_WEIGHTS = (10.0, 4.0, 2.0)
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _to_storage_safe_component(value: str) -> str:
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = re.sub(r"\s+", "_", value)
+    value = re.sub(r"[^A-Za-z0-9._-]", "_", value)
+    return value.strip("._") or "file"
+
+
+def _settings():
+    try:
+        return st.secrets.get("search", {})
+    except Exception:
+        return {}
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(_settings().get("path", DEFAULT_PATH), check_same_thread=False)
+        _connection.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS card_text USING fts5(
+                question, answer, upload, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS cards (
+                fach TEXT, card_id TEXT, text_rowid INTEGER, digest TEXT,
+                upload TEXT, page INTEGER, question TEXT,
+                PRIMARY KEY (fach, card_id)
+            );
+            CREATE TABLE IF NOT EXISTS faecher (fach TEXT PRIMARY KEY, generation INTEGER);
+        """)
+    return _connection
+
+
+def fold(text):
+    """
+    Spell umlauts out (ä -> ae, ß -> ss) so "Übung" and "Uebung" index and match
+    the same. Other accents are dropped by the tokenizer.
+    """
+    text = text.lower()
+    for umlaut, replacement in (("ä", "ae"), ("ö", "oe"), ("ü", "ue"), ("ß", "ss")):
+        text = text.replace(umlaut, replacement)
+    return text
+
+
+def _card_text(card):
+    answer = card.get("answer", "")
+    if card.get("mindmap"):
+        # The answer of a mindmap card is a whole HTML page
+        answer = ""
+    elif isinstance(answer, list):
+        answer = "\n".join(str(line) for line in answer)
+    return fold(card.get("question", "")), fold(str(answer)), fold(card.get("upload", "Unbekannt"))
+
+
+def index_fach(fach_name, flashcards, generation):
+    """
+    Bring the index of a fach in line with its cards at `generation`. Only cards
+    that were added, changed or removed since the last call are written. Older
+    generations than the indexed one are ignored, so concurrent writers can
+    finish in any order.
+    """
+    fach = _to_storage_safe_component(fach_name)
+    wanted = {}
+    for card in flashcards:
+        if "id" not in card:
+            continue
+        text = _card_text(card)
+        digest = hashlib.sha1(json.dumps([text, card.get("page")], ensure_ascii=False).encode("utf-8")).hexdigest()
+        wanted[card["id"]] = (digest, text, card)
+
+    with _lock:
+        connection = _get_connection()
+        with connection:
+            row = connection.execute("SELECT generation FROM faecher WHERE fach = ?", (fach,)).fetchone()
+            if row and row[0] > generation:
+                return
+            indexed = dict(
+                (card_id, (text_rowid, digest)) for card_id, text_rowid, digest in connection.execute(
+                    "SELECT card_id, text_rowid, digest FROM cards WHERE fach = ?", (fach,)
+                )
+            )
+            for card_id, (text_rowid, digest) in indexed.items():
+                if wanted.get(card_id, (None,))[0] != digest:
+                    connection.execute("DELETE FROM card_text WHERE rowid = ?", (text_rowid,))
+                    connection.execute("DELETE FROM cards WHERE fach = ? AND card_id = ?", (fach, card_id))
+            for card_id, (digest, text, card) in wanted.items():
+                if indexed.get(card_id, (None, None))[1] == digest:
+                    continue
+                text_rowid = connection.execute(
+                    "INSERT INTO card_text (question, answer, upload) VALUES (?, ?, ?)", text
+                ).lastrowid
+                connection.execute(
+                    "INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (fach, card_id, text_rowid, digest, card.get("upload", "Unbekannt"),
+                     card.get("page"), card.get("question", "")),
+                )
+            connection.execute("INSERT OR REPLACE INTO faecher VALUES (?, ?)", (fach, generation))
+
+
+def remove_fach(fach_name):
+    """Drop all cards of a fach from the index."""
+    fach = _to_storage_safe_component(fach_name)
+    with _lock:
+        connection = _get_connection()
+        with connection:
+            connection.execute(
+                "DELETE FROM card_text WHERE rowid IN (SELECT text_rowid FROM cards WHERE fach = ?)", (fach,)
+            )
+            connection.execute("DELETE FROM cards WHERE fach = ?", (fach,))
+            connection.execute("DELETE FROM faecher WHERE fach = ?", (fach,))
+
+
+def indexed_generation(fach_name):
+    """Generation the index of a fach was built from, or None if it isn't indexed."""
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT generation FROM faecher WHERE fach = ?", (_to_storage_safe_component(fach_name),)
+        ).fetchone()
+    return row[0] if row else None
+
+
+def ensure_indexed(fach_name, generation=None, flashcards=None):
+    """
+    Reindex a fach if the index lags behind the stored generation, e.g. after
+    writes by another process, or rebuild it if it is ahead. Pass the generation and its cards if they are
+    already loaded.
+    """
+    from backend.flashcard_manager import current_generation, load_flashcards
+
+    if generation is None:
+        generation = current_generation(fach_name)
+    indexed = indexed_generation(fach_name)
+    if generation is None or indexed == generation:
+        return
+    if indexed is not None and generation < indexed:
+        # The fach was deleted (and maybe recreated) since it was indexed
+        remove_fach(fach_name)
+    if flashcards is None:
+        flashcards, generation = load_flashcards(fach_name)
+    index_fach(fach_name, flashcards, generation)
+
+
+def _match_expression(query):
+    """Every word of the query as a prefix; all of them must match."""
+    words = re.findall(r"\w+", fold(query))
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(query, fach_name=None, limit=20):
+    """
+    Best-ranked cards for a query, optionally within one fach, as dicts with
+    fach, card_id, upload, page and question. Words match as prefixes.
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+    sql = f"""
+        SELECT cards.fach, cards.card_id, cards.upload, cards.page, cards.question
+        FROM card_text JOIN cards ON cards.text_rowid = card_text.rowid
+        WHERE card_text MATCH ? {"AND cards.fach = ?" if fach_name else ""}
+        ORDER BY bm25(card_text, {", ".join(str(weight) for weight in COLUMN_WEIGHTS)})
+        LIMIT ?
+    """
+    params = [expression] + ([_to_storage_safe_component(fach_name)] if fach_name else []) + [limit]
+    with _lock:
+        cursor = _get_connection().execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def main(argv):
+    """Rebuild the index of the given fächer, or of all fächer: python -m backend.search_index [fach ...]"""
+    from backend.fach_manager import get_all_faecher
+
+    for fach in argv or get_all_faecher():
+        remove_fach(fach)
+        ensure_indexed(fach)
+        print(f"{fach}: generation {indexed_generation(fach)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,187 @@
+# backend/storage_backend.py
+import base64
+import mimetypes
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import streamlit as st
+
+from backend.storage_metrics import InstrumentedClient
+
+
+class LocalStorageError(Exception):
+    def __init__(self, message, status):
+        super().__init__(f"{{'statusCode': {status}, 'message': {message}}}")
+        self.message = message
+        self.status = status
+
+
+class LocalBucket:
+    """
+    A directory standing in for a Supabase storage bucket, with the same
+    list/download/upload/remove/create_signed_url calls the app uses.
+    Uploads without upsert fail on existing objects, like in Supabase.
+    Signed URLs are data URLs, so images still show in the browser.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def _path(self, path):
+        resolved = (self.root / path.strip("/")).resolve()
+        if self.root.resolve() not in resolved.parents and resolved != self.root.resolve():
+            raise LocalStorageError("Invalid key", 400)
+        return resolved
+
+    def list(self, path=None, options=None):
+        options = options or {}
+        folder = self._path(path or "")
+        if not folder.is_dir():
+            return []
+        entries = []
+        for child in folder.iterdir():
+            if options.get("search") and options["search"] not in child.name:
+                continue
+            if child.is_dir():
+                entries.append({"name": child.name, "id": None, "metadata": None})
+            else:
+                stat = child.stat()
+                timestamp = datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+                entries.append({
+                    "name": child.name,
+                    "id": str(stat.st_ino),
+                    "created_at": timestamp,
+                    "updated_at": timestamp,
+                    "metadata": {"size": stat.st_size, "mimetype": mimetypes.guess_type(child.name)[0]},
+                })
+        sort_by = options.get("sortBy", {"column": "name", "order": "asc"})
+        entries.sort(key=lambda e: e.get(sort_by.get("column", "name")) or "", reverse=sort_by.get("order") == "desc")
+        offset = options.get("offset", 0)
+        return entries[offset:offset + options.get("limit", 100)]
+
+    def download(self, path, options=None):
+        target = self._path(path)
+        if not target.is_file():
+            raise LocalStorageError("Object not found", 404)
+        data = target.read_bytes()
+        with self._lock:
+            self.bytes_read += len(data)
+        return data
+
+    def upload(self, path, file, file_options=None):
+        if isinstance(file, (str, Path)):
+            data = Path(file).read_bytes()
+        elif hasattr(file, "read"):
+            data = file.read()
+        else:
+            data = bytes(file)
+        target = self._path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+
+        # Write to a temporary file first, so readers never see a partial object
+        fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        try:
+            if upsert:
+                os.replace(tmp_name, target)
+            else:
+                try:
+                    os.link(tmp_name, target)  # Atomic create-only
+                except FileExistsError:
+                    raise LocalStorageError("Duplicate: The resource already exists", 409)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        with self._lock:
+            self.bytes_written += len(data)
+        return {"path": path, "Key": path}
+
+    def remove(self, paths):
+        removed = []
+        for path in paths:
+            target = self._path(path)
+            if target.is_file():
+                target.unlink()
+                removed.append({"name": path})
+                # Folders only exist through their objects in Supabase: drop them once empty
+                for folder in target.parents:
+                    if folder == self.root.resolve() or any(folder.iterdir()):
+                        break
+                    try:
+                        folder.rmdir()
+                    except OSError:
+                        # Written to concurrently
+                        break
+        return removed
+
+    def create_signed_url(self, path, expires_in, options=None):
+        data = self.download(path)
+        mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        data_url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        return {"signedURL": data_url, "signedUrl": data_url}
+
+
+class _LocalStorageApi:
+    def __init__(self, root):
+        self.root = Path(root)
+        self._buckets = {}
+
+    def from_(self, bucket_name):
+        if bucket_name not in self._buckets:
+            self._buckets[bucket_name] = LocalBucket(self.root / bucket_name)
+        return self._buckets[bucket_name]
+
+
+class LocalStorageClient:
+    """Client object with the .storage.from_(bucket) shape of the Supabase client."""
+
+    def __init__(self, root):
+        self.storage = _LocalStorageApi(root)
+
+
+_local_clients = {}
+_supabase_clients = {}
+_clients_lock = threading.Lock()
+
+
+def is_local_storage():
+    return st.secrets.get("storage", {}).get("backend", "supabase") == "local"
+
+
+def create_storage_client():
+    """
+    Client for the configured storage backend. Defaults to Supabase; with
+
+        [storage]
+        backend = "local"
+        path = "local_storage"
+
+    in the secrets, objects are kept in a local directory instead. Every bucket
+    operation is counted and timed by backend/storage_metrics.py.
+
+    Clients are created once per process and shared; the supabase package is
+    only imported when the first Supabase client is needed.
+    """
+    if is_local_storage():
+        root = st.secrets["storage"].get("path", "local_storage")
+        with _clients_lock:
+            if root not in _local_clients:
+                _local_clients[root] = InstrumentedClient(LocalStorageClient(root))
+            return _local_clients[root]
+
+    url, key = st.secrets["supabase"]["url"], st.secrets["supabase"]["key"]
+    with _clients_lock:
+        if (url, key) not in _supabase_clients:
+            from supabase import create_client
+
+            _supabase_clients[(url, key)] = InstrumentedClient(create_client(url, key))
+        return _supabase_clients[(url, key)]
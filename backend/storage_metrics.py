@@ -0,0 +1,214 @@
+# backend/storage_metrics.py
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+import streamlit as st
+
+# Reruns kept per session for the debug overlay
+RERUN_HISTORY = 20
+# Operations kept for work outside a rerun (prefetch threads, export jobs)
+BACKGROUND_OPERATIONS = 1000
+
+_current_rerun = ContextVar("storage_rerun", default=None)
+
+
+class RerunMetrics:
+    """Storage operations of one script run (or of background work)."""
+
+    def __init__(self, label, max_operations=None):
+        self.label = label
+        self.started_at = time.time()
+        self.operations = deque(maxlen=max_operations)
+        self._lock = threading.Lock()
+
+    def record(self, operation):
+        with self._lock:
+            self.operations.append(operation)
+
+    def summary(self):
+        """Calls, time and bytes per caller and operation, slowest first."""
+        groups = {}
+        with self._lock:
+            operations = list(self.operations)
+        for operation in operations:
+            key = (operation["caller"], operation["op"])
+            group = groups.setdefault(key, {
+                "Aufrufer": key[0], "Operation": key[1], "Aufrufe": 0, "Fehler": 0,
+                "Zeit (ms)": 0.0, "KB gelesen": 0.0, "KB geschrieben": 0.0,
+            })
+            group["Aufrufe"] += 1
+            group["Fehler"] += operation["error"] is not None
+            group["Zeit (ms)"] += operation["ms"]
+            group["KB gelesen"] += (operation["bytes_in"] or 0) / 1024
+            group["KB geschrieben"] += (operation["bytes_out"] or 0) / 1024
+        return sorted(groups.values(), key=lambda group: group["Zeit (ms)"], reverse=True)
+
+    def totals(self):
+        summary = self.summary()
+        return {
+            "Lauf": self.label,
+            "Aufrufe": sum(group["Aufrufe"] for group in summary),
+            "Zeit (ms)": round(sum(group["Zeit (ms)"] for group in summary), 1),
+            "KB gelesen": round(sum(group["KB gelesen"] for group in summary), 1),
+            "KB geschrieben": round(sum(group["KB geschrieben"] for group in summary), 1),
+        }
+
+    def slowest(self, count=5):
+        with self._lock:
+            operations = list(self.operations)
+        return sorted(operations, key=lambda operation: operation["ms"], reverse=True)[:count]
+
+
+background = RerunMetrics("background", max_operations=BACKGROUND_OPERATIONS)
+
+
+def _caller_name():
+    """Module that called into storage: 'app' for the Streamlit script, else the backend module name."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") in (__name__, "contextlib", "backend.async_storage"):
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    module = frame.f_globals.get("__name__", "unknown")
+    if module == "__main__":
+        return Path(frame.f_code.co_filename).stem
+    return module.rsplit(".", 1)[-1]
+
+
+def _size(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    if isinstance(data, str):
+        return Path(data).stat().st_size if Path(data).is_file() else len(data.encode("utf-8"))
+    if isinstance(data, Path):
+        return data.stat().st_size
+    return None
+
+
+@contextmanager
+def operation(op, path, caller=None):
+    """
+    Time one storage operation and record it with the current rerun. Yields the
+    record, so callers can fill in bytes_in (read) and bytes_out (written).
+    """
+    record = {"caller": caller or _caller_name(), "op": op, "path": path, "bytes_in": None, "bytes_out": None, "error": None}
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["ms"] = (time.perf_counter() - started) * 1000
+        (_current_rerun.get() or background).record(record)
+
+
+class InstrumentedBucket:
+    """Wraps a storage bucket and records every list/download/upload/remove/signed URL call."""
+
+    def __init__(self, bucket):
+        self._bucket = bucket
+
+    def list(self, path=None, options=None):
+        with operation("list", path, _caller_name()):
+            return self._bucket.list(path, options)
+
+    def download(self, path, *args, **kwargs):
+        with operation("download", path, _caller_name()) as record:
+            data = self._bucket.download(path, *args, **kwargs)
+            record["bytes_in"] = len(data)
+            return data
+
+    def upload(self, path, file, *args, **kwargs):
+        with operation("upload", path, _caller_name()) as record:
+            record["bytes_out"] = _size(file)
+            return self._bucket.upload(path, file, *args, **kwargs)
+
+    def remove(self, paths):
+        with operation("remove", ", ".join(paths), _caller_name()):
+            return self._bucket.remove(paths)
+
+    def create_signed_url(self, path, *args, **kwargs):
+        with operation("create_signed_url", path, _caller_name()):
+            return self._bucket.create_signed_url(path, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._bucket, name)
+
+
+class _InstrumentedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket_name):
+        return InstrumentedBucket(self._storage.from_(bucket_name))
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class InstrumentedClient:
+    """Client whose .storage.from_(bucket) buckets record their operations."""
+
+    def __init__(self, client):
+        self._client = client
+        self.storage = _InstrumentedStorage(client.storage)
+
+    @property
+    def wrapped(self):
+        """The client without instrumentation."""
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def debug_enabled():
+    """Storage debug overlay and rerun log via ?debug=storage or [debug] storage = true."""
+    if st.query_params.get("debug") == "storage":
+        return True
+    try:
+        return bool(st.secrets.get("debug", {}).get("storage"))
+    except Exception:
+        return False
+
+
+def begin_rerun(label, state=None):
+    """
+    Start collecting the storage operations of this script run. The previous
+    run of the session is closed: its totals go to state["storage_rerun_history"]
+    and, in debug mode, one summary line per caller and operation to stderr.
+    `state` defaults to st.session_state.
+    """
+    if state is None:
+        state = st.session_state
+    previous = state.get("storage_rerun")
+    if previous is not None:
+        history = state.setdefault("storage_rerun_history", deque(maxlen=RERUN_HISTORY))
+        history.append(previous.totals())
+        if debug_enabled():
+            totals = previous.totals()
+            print(
+                f"[storage] {totals['Lauf']}: {totals['Aufrufe']} calls, {totals['Zeit (ms)']} ms, "
+                f"{totals['KB gelesen']} KB read, {totals['KB geschrieben']} KB written",
+                file=sys.stderr,
+            )
+            for group in previous.summary():
+                print(
+                    f"[storage]   {group['Aufrufer']}.{group['Operation']}: {group['Aufrufe']}x "
+                    f"{group['Zeit (ms)']:.1f} ms {group['KB gelesen']:.1f} KB in {group['KB geschrieben']:.1f} KB out",
+                    file=sys.stderr,
+                )
+    metrics = RerunMetrics(label)
+    state["storage_rerun"] = metrics
+    _current_rerun.set(metrics)
+    return metrics
+
+
+def current_rerun():
+    return _current_rerun.get()
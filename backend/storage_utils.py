@@ -1,10 +1,23 @@
 # storage_utils.py
-import boto3
-from botocore.client import Config
 import streamlit as st
-import base64
+from backend.storage_backend import create_storage_client, is_local_storage
+from backend.storage_metrics import operation
 import re
+import threading
+import time
 import unicodedata
+from collections import OrderedDict
+
+# Signed image URLs are reused until half of their lifetime is left, so the card
+# HTML keeps pointing at the same URL and the browser can answer from its cache.
+SIGNED_URL_TTL = 3600
+IMAGE_CACHE_CONTROL = "86400"
+
+_supabase = None
+_bucket = None
+_signed_urls = {}
+_signed_urls_lock = threading.Lock()
+
 
 def _to_storage_safe_component(value: str) -> str:
     value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
@@ -13,7 +26,20 @@ def _to_storage_safe_component(value: str) -> str:
     return value.strip("._") or "file"
 
 
+def _is_conflict(error):
+    # Supabase (and the local backend) answer a create-only upload of an existing object with 409
+    status = getattr(error, "status", None)
+    return str(status) == "409" or "409" in str(error) or "Duplicate" in str(error) or "already exists" in str(error)
+
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
 def create_s3_client():
+    import boto3
+    from botocore.client import Config
+
     supabase_url = st.secrets["supabase"]["url"]
     aws_access_key_id = st.secrets["s3"]["aws_access_key_id"]
     aws_secret_access_key = st.secrets["s3"]["aws_secret_access_key"]
@@ -32,6 +58,15 @@ def create_s3_client():
     return s3
 
 
+def get_s3_client():
+    """Return a shared S3 client; boto3 clients are thread-safe and expensive to create."""
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = create_s3_client()
+        return _s3_client
+
+
 def fetch_image(selected_fach, image_filename):
     """
     Fetch an image from Supabase storage using the S3 protocol.
@@ -46,21 +81,110 @@ def fetch_image(selected_fach, image_filename):
     bucket_name = st.secrets["supabase"]["bucket"]
     safe_fach = _to_storage_safe_component(selected_fach)
     object_key = f"{safe_fach}/images/{image_filename}"
-    s3 = create_s3_client()
-    
+    if is_local_storage():
+        return _get_supabase().storage.from_(bucket_name).download(object_key)
+    s3 = get_s3_client()
+
     try:
-        response = s3.get_object(Bucket=bucket_name, Key=object_key)
-        image_bytes = response['Body'].read()
+        with operation("s3.get_object", object_key) as record:
+            response = s3.get_object(Bucket=bucket_name, Key=object_key)
+            image_bytes = response['Body'].read()
+            record["bytes_in"] = len(image_bytes)
         return image_bytes
     except Exception as e:
         raise Exception(f"Error fetching image from S3: {e}")
 
-def get_image_as_data_url(selected_fach, image_filename):
+class ImageCache:
     """
-    Convenience function that returns the image as a data URL for display.
+    Thread-safe LRU cache of image bytes, bounded by the total number of bytes held.
     """
-    image_bytes = fetch_image(selected_fach, image_filename)
-    base64_image = base64.b64encode(image_bytes).decode("utf-8")
-    # Adjust image/png if you expect another image type.
-    data_url = f"data:image/png;base64,{base64_image}"
-    return data_url
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+# Shared by all sessions of this process
+image_cache = ImageCache(max_bytes=64 * 1024 * 1024)
+
+
+def get_image_bytes(selected_fach, image_filename):
+    """
+    Like fetch_image, but served from the in-memory image cache when possible.
+    """
+    cache_key = (_to_storage_safe_component(selected_fach), image_filename)
+    image_bytes = image_cache.get(cache_key)
+    if image_bytes is None:
+        image_bytes = fetch_image(selected_fach, image_filename)
+        image_cache.put(cache_key, image_bytes)
+    return image_bytes
+
+
+def _get_supabase():
+    global _supabase
+    if _supabase is None:
+        _supabase = create_storage_client()
+    return _supabase
+
+
+def _get_bucket():
+    """The app's storage bucket, created on first use so the modules import without secrets."""
+    global _bucket
+    if _bucket is None:
+        _bucket = _get_supabase().storage.from_(st.secrets["supabase"]["bucket"])
+    return _bucket
+
+
+def page_image_filename(document_name, page_number):
+    """Storage filename of a rendered page, e.g. "Skript_page_3.png"."""
+    document_stem = _to_storage_safe_component(document_name).rsplit('.', 1)[0]
+    return f"{document_stem}_page_{page_number}.png"
+
+
+def get_image_url(selected_fach, image_filename):
+    """
+    Return a short-lived signed URL for an image in <fach>/images/.
+    The browser loads the image directly from storage, which answers with
+    Cache-Control and ETag headers, instead of receiving it inline on every rerun.
+    """
+    bucket_name = st.secrets["supabase"]["bucket"]
+    safe_fach = _to_storage_safe_component(selected_fach)
+    cache_key = (safe_fach, image_filename)
+    now = time.time()
+    with _signed_urls_lock:
+        cached = _signed_urls.get(cache_key)
+    if cached and cached[1] - now > SIGNED_URL_TTL / 2:
+        return cached[0]
+
+    try:
+        response = _get_supabase().storage.from_(bucket_name).create_signed_url(
+            f"{safe_fach}/images/{image_filename}", SIGNED_URL_TTL
+        )
+        signed_url = response.get("signedURL") or response.get("signedUrl")
+    except Exception as e:
+        raise Exception(f"Error creating signed image URL: {e}")
+
+    with _signed_urls_lock:
+        _signed_urls[cache_key] = (signed_url, now + SIGNED_URL_TTL)
+    return signed_url
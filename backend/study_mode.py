@@ -0,0 +1,86 @@
+# backend/study_mode.py
+from pathlib import Path
+
+import streamlit.components.v1 as components
+
+from backend import card_replica
+from backend.flashcard_manager import update_flashcards
+from backend.image_derivatives import smallest_image_file
+from backend.storage_utils import get_image_url
+
+# The study mode runs in the browser: the component gets a snapshot of one
+# upload's cards and flips, schedules and rates them without a rerun. Ratings
+# are kept in the browser's localStorage until the app has confirmed them, and
+# are sent back every RATING_BATCH_SIZE ratings (or when the learner saves).
+RATING_BATCH_SIZE = 10
+
+_component = components.declare_component(
+    "study_mode", path=str(Path(__file__).parent / "study_mode_frontend")
+)
+
+
+def snapshot(fach_name, upload):
+    """
+    The cards of an upload in a compact form for the browser: id, question,
+    answer, page, priority, and signed URLs of the thumbnail and display image.
+    Mindmap cards and inline legacy images are left out.
+    """
+    cards = []
+    for card in card_replica.upload_cards(fach_name, upload):
+        if card.get("mindmap") or not card.get("id"):
+            continue
+        answer = card.get("answer", [])
+        entry = {
+            "id": card["id"],
+            "q": card.get("question", ""),
+            "a": answer if isinstance(answer, list) else [str(answer)],
+            "page": card.get("page"),
+            "p": card.get("priority", 2),
+        }
+        images = card.get("images") or []
+        if images and smallest_image_file(images[0], "display"):
+            try:
+                entry["thumb"] = get_image_url(fach_name, smallest_image_file(images[0], "thumb"))
+                entry["img"] = get_image_url(fach_name, smallest_image_file(images[0], "display"))
+            except Exception:
+                pass
+        cards.append(entry)
+    return cards
+
+
+def study_component(fach_name, upload, acknowledged, key=None):
+    """
+    Show the study component for an upload. Returns the last batch it sent,
+    {"seq": int, "ratings": {card_id: priority}}, or None. Pass the seq of the
+    last applied batch as `acknowledged`, so the browser can drop it.
+    """
+    return _component(
+        fach=fach_name,
+        upload=upload,
+        cards=snapshot(fach_name, upload),
+        acknowledged=acknowledged,
+        batch_size=RATING_BATCH_SIZE,
+        key=key,
+        default=None,
+    )
+
+
+def apply_ratings(fach_name, ratings):
+    """
+    Write a batch of ratings from the study component ({card_id: priority})
+    with one update_flashcards, based on the freshly synced replica. Cards
+    deleted in the meantime are skipped.
+    Returns the written generation, or None if the write failed.
+    """
+    # The replica may be behind: merge against a generation that still exists
+    generation = card_replica.sync_fach(fach_name)
+    flashcards = card_replica.all_cards(fach_name)
+    changed = False
+    for card in flashcards:
+        priority = ratings.get(card.get("id"))
+        if priority in (1, 2, 3) and card.get("priority") != priority:
+            card["priority"] = priority
+            changed = True
+    if not changed:
+        return generation
+    return update_flashcards(fach_name, flashcards, base_generation=generation)
@@ -0,0 +1,199 @@
+# backend/telemetry.py
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import streamlit as st
+
+DEFAULT_PATH = "telemetry.sqlite"
+
+# USD per 1M tokens: (input, cached input, output). Override with [telemetry.prices] in secrets.
+MODEL_PRICES = {
+    "gpt-5.2-2025-12-11": (1.75, 0.175, 14.0),
+}
+
+SPAN_COLUMNS = (
+    "span_id", "run_id", "fach", "document", "name", "page", "model", "started_at", "duration_ms",
+    "input_tokens", "cached_tokens", "output_tokens", "retries", "image_bytes", "cost_usd", "error",
+)
+
+# Fach and document of the generation run the current code belongs to
+_current_run = ContextVar("telemetry_run", default=None)
+
+_lock = threading.Lock()
+_connection = None
+_tracer = None
+
+
+def _settings():
+    try:
+        return st.secrets.get("telemetry", {})
+    except Exception:
+        return {}
+
+
+def _enabled():
+    return _settings().get("enabled", True)
+
+
+def _get_connection():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(_settings().get("path", DEFAULT_PATH), check_same_thread=False)
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS spans (
+                span_id TEXT PRIMARY KEY, run_id TEXT, fach TEXT, document TEXT, name TEXT, page INTEGER,
+                model TEXT, started_at REAL, duration_ms REAL, input_tokens INTEGER, cached_tokens INTEGER,
+                output_tokens INTEGER, retries INTEGER, image_bytes INTEGER, cost_usd REAL, error TEXT
+            )
+        """)
+        _connection.execute("CREATE INDEX IF NOT EXISTS spans_document ON spans (fach, document, started_at)")
+    return _connection
+
+
+def _get_tracer():
+    """OpenTelemetry tracer if [telemetry] otel = true and the package is installed, else None."""
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if _settings().get("otel"):
+            try:
+                from opentelemetry import trace
+                _tracer = trace.get_tracer("merkwerk")
+            except ImportError:
+                pass
+    return _tracer or None
+
+
+def call_cost(model, input_tokens, cached_tokens, output_tokens):
+    """Cost of one model call in USD, or None for an unknown model."""
+    prices = _settings().get("prices", {}).get(model) or MODEL_PRICES.get(model)
+    if not prices:
+        return None
+    input_price, cached_price, output_price = prices
+    uncached = (input_tokens or 0) - (cached_tokens or 0)
+    return (uncached * input_price + (cached_tokens or 0) * cached_price + (output_tokens or 0) * output_price) / 1_000_000
+
+
+def _write(record):
+    if record.get("model") and record.get("cost_usd") is None:
+        record["cost_usd"] = call_cost(
+            record["model"], record.get("input_tokens"), record.get("cached_tokens"), record.get("output_tokens")
+        )
+    row = [record.get(column) for column in SPAN_COLUMNS]
+    # Telemetry must never break card generation
+    try:
+        with _lock:
+            connection = _get_connection()
+            connection.execute(f"INSERT INTO spans VALUES ({', '.join('?' * len(SPAN_COLUMNS))})", row)
+            connection.commit()
+            jsonl_path = _settings().get("jsonl")
+            if jsonl_path:
+                with open(jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(dict(zip(SPAN_COLUMNS, row)), ensure_ascii=False) + "\n")
+    except Exception:
+        pass
+
+    tracer = _get_tracer()
+    if tracer:
+        otel_span = tracer.start_span(
+            record["name"], start_time=int(record["started_at"] * 1e9),
+            attributes={f"merkwerk.{key}": value for key, value in record.items() if value is not None},
+        )
+        otel_span.end(end_time=int((record["started_at"] + record["duration_ms"] / 1000) * 1e9))
+
+
+@contextmanager
+def document_run(selected_fach, document_name):
+    """Groups all spans of one document's generation under a run id."""
+    run = {"run_id": uuid.uuid4().hex, "fach": selected_fach, "document": document_name}
+    token = _current_run.set(run)
+    try:
+        yield run["run_id"]
+    finally:
+        _current_run.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a stage and record it with the current run. Yields the record dict, so
+    callers can add model, token counts, retries or an error before it is written.
+    Exceptions are recorded by class name and re-raised.
+    """
+    record = {"span_id": uuid.uuid4().hex, "name": name, **(_current_run.get() or {}), **attributes}
+    record["started_at"] = time.time()
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = (time.perf_counter() - started) * 1000
+        if _enabled():
+            _write(record)
+
+
+def record_response(record, raw_response, response):
+    """Copy model, token usage and SDK retries of a Responses API call into a span record."""
+    usage = getattr(response, "usage", None)
+    record["model"] = getattr(response, "model", None) or record.get("model")
+    record["retries"] = getattr(raw_response, "retries_taken", None)
+    if usage is not None:
+        record["input_tokens"] = usage.input_tokens
+        record["output_tokens"] = usage.output_tokens
+        details = getattr(usage, "input_tokens_details", None)
+        record["cached_tokens"] = getattr(details, "cached_tokens", 0) or 0
+
+
+def _query(sql, params):
+    if not _enabled():
+        return []
+    try:
+        with _lock:
+            cursor = _get_connection().execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception:
+        return []
+
+
+def document_costs(selected_fach):
+    """Per document of a fach: runs, model calls, errors, tokens, cost and time, newest first."""
+    return _query("""
+        SELECT document AS Dokument,
+               COUNT(DISTINCT run_id) AS Durchläufe,
+               SUM(name LIKE 'model.%') AS Modellaufrufe,
+               SUM(error IS NOT NULL) AS Fehler,
+               SUM(input_tokens) AS "Tokens ein",
+               SUM(output_tokens) AS "Tokens aus",
+               ROUND(SUM(cost_usd), 4) AS "Kosten (USD)",
+               ROUND(SUM(CASE WHEN name LIKE 'model.%' THEN duration_ms ELSE 0 END) / 1000, 1) AS "Modellzeit (s)"
+        FROM spans WHERE fach = ?
+        GROUP BY document ORDER BY MAX(started_at) DESC
+    """, (selected_fach,))
+
+
+def last_run_breakdown(selected_fach, document_name):
+    """Time, tokens and cost per stage of the latest generation run of a document."""
+    return _query("""
+        SELECT name AS Schritt,
+               COUNT(*) AS Anzahl,
+               ROUND(SUM(duration_ms) / 1000, 1) AS "Zeit (s)",
+               ROUND(AVG(duration_ms)) AS "Ø ms",
+               SUM(error IS NOT NULL) AS Fehler,
+               SUM(retries) AS Wiederholungen,
+               SUM(image_bytes) AS Bildbytes,
+               SUM(input_tokens) AS "Tokens ein",
+               SUM(cached_tokens) AS "davon Cache",
+               SUM(output_tokens) AS "Tokens aus",
+               ROUND(SUM(cost_usd), 4) AS "Kosten (USD)"
+        FROM spans
+        WHERE run_id = (SELECT run_id FROM spans WHERE fach = ? AND document = ? ORDER BY started_at DESC LIMIT 1)
+        GROUP BY name ORDER BY SUM(duration_ms) DESC
+    """, (selected_fach, document_name))
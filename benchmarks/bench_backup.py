@@ -0,0 +1,137 @@
+# benchmarks/bench_backup.py
+"""
+Backup and restore of a whole fach through fach_backup, against copying its
+objects one by one (what rename_fach does).
+
+Builds a synthetic fach in the local storage backend: PDFs added through
+document_store, page images and cards. Every storage call waits --latency-ms
+to stand in for the round trip to Supabase. Reports the time of the copy, of
+the export into a temporary file and of the restore into a new fach, the peak
+Python allocation during the export, and checks that the restored fach has the
+same objects and cards.
+
+    python -m benchmarks.bench_backup --documents 5 --pages 20 --latency-ms 40 --output backup.json
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.bench_learning import synthetic_cards
+from benchmarks.common import bench_environment, peak_rss_mb, run_metadata, synthetic_pdf, write_result
+
+
+def _add_latency(seconds):
+    from backend.storage_backend import LocalBucket
+
+    for name in ("list", "download", "upload", "remove"):
+        call = getattr(LocalBucket, name)
+
+        def delayed(self, *args, _call=call, **kwargs):
+            time.sleep(seconds)
+            return _call(self, *args, **kwargs)
+
+        setattr(LocalBucket, name, delayed)
+
+
+def build_fach(fach, documents, pages, image_kb, seed=1):
+    from backend.document_store import add_document
+    from backend.fach_manager import create_fach
+    from backend.flashcard_manager import update_flashcards
+    from backend.storage_utils import _get_bucket
+
+    rng = random.Random(seed)
+    create_fach(fach)
+    cards = []
+    for number in range(documents):
+        name = f"Vorlesung_{number:03d}.pdf"
+        add_document(fach, name, synthetic_pdf(pages, seed_text=f"Vorlesung {number}"))
+        for page in range(1, pages + 1):
+            _get_bucket().upload(f"{fach}/images/Vorlesung_{number:03d}_page_{page}.png", rng.randbytes(image_kb * 1024))
+        for card in synthetic_cards(pages, 0, seed=seed + number):
+            card["id"] = f"{number:04d}{card['id'][4:]}"
+            card["upload"] = name
+            card["images"] = [{"page": card["page"], "file": f"Vorlesung_{number:03d}_page_{card['page']}.png"}]
+            cards.append(card)
+    update_flashcards(fach, cards)
+
+
+def copy_one_by_one(source, target):
+    from backend.fach_backup import _backed_up, list_objects
+    from backend.storage_utils import _get_bucket
+
+    for path, _ in list_objects(source):
+        if _backed_up(path):
+            _get_bucket().upload(f"{target}/{path}", _get_bucket().download(f"{source}/{path}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5, help="PDFs in the synthetic fach")
+    parser.add_argument("--pages", type=int, default=20, help="Pages (and images and cards) per PDF")
+    parser.add_argument("--image-kb", type=int, default=60, help="Size of each page image")
+    parser.add_argument("--latency-ms", type=float, default=40, help="Added to every storage call")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    with bench_environment():
+        from backend.fach_backup import _backed_up, export_fach, list_objects, restore_fach
+        from backend.flashcard_manager import get_flashcards
+
+        build_fach("Quelle", args.documents, args.pages, args.image_kb)
+        _add_latency(args.latency_ms / 1000)
+        objects = [(path, size) for path, size in list_objects("Quelle") if _backed_up(path)]
+        print(f"{len(objects)} objects …", file=sys.stderr)
+
+        started = time.perf_counter()
+        copy_one_by_one("Quelle", "Kopie")
+        copy_seconds = time.perf_counter() - started
+
+        with tempfile.TemporaryFile() as archive:
+            tracemalloc.start()
+            started = time.perf_counter()
+            exported = export_fach("Quelle", archive)
+            export_seconds = time.perf_counter() - started
+            _, export_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            archive_bytes = archive.tell()
+
+            archive.seek(0)
+            started = time.perf_counter()
+            restore_fach(archive, "Wiederhergestellt")
+            restore_seconds = time.perf_counter() - started
+
+        restored = [(path, size) for path, size in list_objects("Wiederhergestellt") if _backed_up(path)]
+        identical = restored == objects and get_flashcards("Wiederhergestellt") == get_flashcards("Quelle")
+
+    result = {
+        "benchmark": "backup",
+        "meta": run_metadata(),
+        "config": {
+            "documents": args.documents,
+            "pages": args.pages,
+            "image_kb": args.image_kb,
+            "latency_ms": args.latency_ms,
+        },
+        "objects": len(objects),
+        "object_bytes": sum(size for _, size in objects),
+        "cards": exported["cards"],
+        "archive_bytes": archive_bytes,
+        "copy_one_by_one_seconds": copy_seconds,
+        "export_seconds": export_seconds,
+        "restore_seconds": restore_seconds,
+        "export_peak_alloc_mb": export_peak / (1024 * 1024),
+        "restored_identical": identical,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    write_result(result, args.output, args.baseline)
+    if not identical:
+        print("The restored fach differs from the original", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmarks/bench_card_format.py
+"""
+Size and parse time of card documents in the storage formats of card_codec,
+compared with the pretty-printed JSON written before it.
+
+By default synthetic fächer are used (see bench_learning), with card images
+stored as references and inline as base64. With --faecher, the current card
+documents of real fächer are read from the storage configured in
+.streamlit/secrets.toml of the working directory.
+
+    python -m benchmarks.bench_card_format --sizes 1000,10000 --output format.json
+    python -m benchmarks.bench_card_format --faecher EAM,Mathe
+"""
+import argparse
+import base64
+import json
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.bench_learning import synthetic_cards
+from benchmarks.common import bench_environment, run_metadata, write_result
+
+
+def _distinct_images(cards, seed=2):
+    """
+    synthetic_cards shares one image between all cards, which compression
+    would fold into almost nothing. Real pages differ, so give each card its own.
+    """
+    rng = random.Random(seed)
+    for card in cards:
+        for image in card["images"]:
+            if "base64" in image:
+                image["base64"] = base64.b64encode(rng.randbytes(len(image["base64"]) * 3 // 4)).decode("ascii")
+    return cards
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench_cards(cards, repeat):
+    from backend import card_codec
+
+    legacy = json.dumps(cards, indent=2, ensure_ascii=False).encode("utf-8")
+    results = {
+        "cards": len(cards),
+        "legacy_pretty_json": {
+            "bytes": len(legacy),
+            "encode_ms": _median_ms(lambda: json.dumps(cards, indent=2, ensure_ascii=False).encode("utf-8"), repeat),
+            "decode_ms": _median_ms(lambda: json.loads(legacy.decode("utf-8")), repeat),
+        },
+    }
+    codecs = ["json", "gzip"] + (["zstd"] if card_codec.zstandard is not None else [])
+    for codec in codecs:
+        data, _ = card_codec.encode_cards(cards, codec)
+        results[codec] = {
+            "bytes": len(data),
+            "size_vs_legacy": len(data) / len(legacy),
+            "encode_ms": _median_ms(lambda: card_codec.encode_cards(cards, codec), repeat),
+            "decode_ms": _median_ms(lambda: card_codec.decode_cards(data), repeat),
+            # Same bytes through the stdlib parser, to separate parser and format gains
+            "decode_stdlib_json_ms": _median_ms(
+                lambda: json.loads(card_codec.decompress(data).decode("utf-8")), repeat
+            ),
+        }
+        results[codec]["decode_vs_legacy"] = results[codec]["decode_ms"] / results["legacy_pretty_json"]["decode_ms"]
+    return results
+
+
+def stored_cards(fach):
+    """The current cards of a real fach, straight from storage."""
+    from backend.flashcard_manager import load_flashcards
+
+    return load_flashcards(fach)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated card counts of the synthetic fächer")
+    parser.add_argument("--image-kb", type=int, default=20, help="Size of each inline image for the 'images' variant")
+    parser.add_argument("--faecher", help="Comma-separated real fächer to read from the configured storage instead")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    from backend import card_codec
+
+    results = {}
+    if args.faecher:
+        for fach in args.faecher.split(","):
+            print(f"{fach} …", file=sys.stderr)
+            results[fach] = bench_cards(stored_cards(fach), args.repeat)
+    else:
+        with bench_environment():
+            for size in [int(size) for size in args.sizes.split(",")]:
+                for variant, image_kb in (("refs", 0), ("images", args.image_kb)):
+                    name = f"{size}_{variant}"
+                    print(f"{name} …", file=sys.stderr)
+                    results[name] = bench_cards(_distinct_images(synthetic_cards(size, image_kb)), args.repeat)
+
+    result = {
+        "benchmark": "card_format",
+        "meta": run_metadata(),
+        "config": {
+            "repeat": args.repeat,
+            "orjson": card_codec.orjson is not None,
+            "zstandard": card_codec.zstandard is not None,
+        },
+        "faecher": results,
+    }
+    write_result(result, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
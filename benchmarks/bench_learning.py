@@ -0,0 +1,171 @@
+# benchmarks/bench_learning.py
+"""
+Microbenchmarks for the Learning Studio rerun hot path.
+
+Builds synthetic fächer of different sizes, with and without inline base64
+page images, in the local storage backend and times what a Learning Studio
+interaction does against the local card replica (backend/card_replica.py):
+syncing it (current, after another session wrote, and from scratch),
+opening an upload (upload list, its cards, priority counts), the sidebar
+entries, picking the next card, locating a card and saving a rating.
+"rerun" is what a flip costs (replica generation, the upload's cards,
+sidebar, next card).
+
+    python -m benchmarks.bench_learning --sizes 100,1000,10000 --output learning.json
+    python -m benchmarks.bench_learning --budget-ms 150   # exit code 1 if a rerun p95 exceeds the budget
+"""
+import argparse
+import base64
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import bench_environment, peak_rss_mb, run_metadata, write_result
+
+CARDS_PER_UPLOAD = 50
+
+
+def synthetic_cards(count, image_kb, seed=1):
+    rng = random.Random(seed)
+    image = base64.b64encode(rng.randbytes(image_kb * 1024)).decode("ascii") if image_kb else None
+    cards = []
+    for i in range(count):
+        upload = f"Vorlesung_{i // CARDS_PER_UPLOAD:03d}.pdf"
+        page = i % CARDS_PER_UPLOAD + 1
+        card = {
+            "id": f"{i:016x}",
+            "upload": upload,
+            "question": f"Was beschreibt Begriff {i} und wie hängt er mit Kapitel {page} zusammen?",
+            "answer": [f"• Stichpunkt {j}: eine kurze, einfache Erklärung mit Fachbegriff {i}-{j}" for j in range(5)],
+            "page": page,
+            "priority": rng.choice([1, 2, 3]),
+        }
+        if image:
+            card["images"] = [{"page": page, "base64": image}]
+        else:
+            card["images"] = [{"page": page, "file": f"Vorlesung_{i // CARDS_PER_UPLOAD:03d}_page_{page}.png"}]
+        cards.append(card)
+    rng.shuffle(cards)
+    return cards
+
+
+def _stats(samples):
+    ordered = sorted(samples)
+    return {
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "runs": len(ordered),
+    }
+
+
+def _time(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_fach(fach, cards, repeat, rate_repeat):
+    from backend import card_replica
+    from backend.flashcard_manager import load_flashcards, update_flashcards
+    from backend.learning import find_card_index, select_next_card, sidebar_entries
+
+    update_flashcards(fach, cards)
+    state = {}
+
+    upload = card_replica.uploads(fach)[len(card_replica.uploads(fach)) // 2]
+    learn = card_replica.upload_cards(fach, upload)
+    flashcards = card_replica.all_cards(fach)
+
+    def fall_behind():
+        # Another session rated a card: the replica is one generation behind
+        previous, generation = load_flashcards(fach)
+        changed = [dict(card) for card in previous]
+        changed[0]["priority"] = changed[0].get("priority", 2) % 3 + 1
+        update_flashcards(fach, changed, base_generation=generation)
+        card_replica.remove_fach(fach)
+        card_replica.apply(fach, previous, generation)
+
+    tracemalloc.start()
+    card_replica.remove_fach(fach)
+    card_replica.sync_fach(fach)
+    _, sync_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    def rerun():
+        card_replica.replica_generation(fach)
+        cards = card_replica.upload_cards(fach, upload)
+        sidebar_entries(cards)
+        select_next_card(cards, state)
+
+    def rate():
+        generation = card_replica.replica_generation(fach)
+        all_cards = card_replica.all_cards(fach)
+        idx = find_card_index(all_cards, learn[select_next_card(learn, state)]["id"])
+        all_cards[idx] = {**all_cards[idx], "priority": random.choice([1, 2, 3])}
+        update_flashcards(fach, all_cards, base_generation=generation)
+
+    return {
+        "cards": len(cards),
+        "sync_current": _stats(_time(lambda: card_replica.sync_fach(fach), repeat)),
+        "sync_changed": _stats(_time(lambda: card_replica.sync_fach(fach), rate_repeat, setup=fall_behind)),
+        "sync_cold": _stats(_time(lambda: card_replica.sync_fach(fach), rate_repeat,
+                                  setup=lambda: card_replica.remove_fach(fach))),
+        "open_upload": _stats(_time(lambda: (
+            card_replica.uploads(fach), card_replica.upload_cards(fach, upload),
+            card_replica.priority_counts(fach, upload),
+        ), repeat)),
+        "sidebar": _stats(_time(lambda: sidebar_entries(learn), repeat)),
+        "next_card": _stats(_time(lambda: select_next_card(learn, state), repeat)),
+        "locate_card": _stats(_time(lambda: find_card_index(flashcards, learn[-1]["id"]), repeat)),
+        "rerun": _stats(_time(rerun, repeat)),
+        "rate": _stats(_time(rate, rate_repeat)),
+        "sync_cold_peak_alloc_mb": sync_peak / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated card counts per fach")
+    parser.add_argument("--image-kb", type=int, default=20, help="Size of each inline image for the 'images' variant")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--rate-repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="Fail if the p95 of a rerun exceeds this")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = {}
+    with bench_environment():
+        for size in sizes:
+            for variant, image_kb in (("refs", 0), ("images", args.image_kb)):
+                name = f"{size}_{variant}"
+                print(f"{name} …", file=sys.stderr)
+                results[name] = bench_fach(f"bench_{name}", synthetic_cards(size, image_kb), args.repeat, args.rate_repeat)
+
+    result = {
+        "benchmark": "learning",
+        "meta": run_metadata(),
+        "config": {"sizes": sizes, "image_kb": args.image_kb, "repeat": args.repeat},
+        "faecher": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    write_result(result, args.output, args.baseline)
+
+    if args.budget_ms is not None:
+        over = {name: r["rerun"]["p95_ms"] for name, r in results.items() if r["rerun"]["p95_ms"] > args.budget_ms}
+        if over:
+            print(f"Rerun budget of {args.budget_ms} ms exceeded: {over}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end benchmark of the Creator Studio generation pipeline.
+
+Runs the same backend steps as "Lernkarten und Mindmap erstellen", headlessly:
+PDF upload, page rendering and text extraction, one flashcard request per
+page (or per pack of pages with --pack-pages; streamed with --stream), page
+image storage, mindmap generation, saving the cards and the Anki export. The model is served by benchmarks/fake_openai.py and storage is the
+local backend, so runs are repeatable and free.
+
+    python -m benchmarks.bench_pipeline --pages 30 --latency-ms 800 --rate-limit-rate 0.05 --output run.json
+    python -m benchmarks.bench_pipeline --pages 30 --baseline run.json
+    python -m benchmarks.bench_pipeline --pages 30 --pack-pages 8 --baseline run.json
+    python -m benchmarks.bench_pipeline --pages 30 --stream --baseline run.json
+
+Prints (or writes) JSON with per-stage wall time, pages/min, time to the
+first visible card, peak RSS and bytes transferred to the model and to storage.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from benchmarks.common import (
+    UNLIMITED_REQUESTS_PER_MINUTE, StageTimer, bench_environment, peak_rss_mb, run_metadata, synthetic_pdf, write_result
+)
+from benchmarks.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+FACH = "Benchmark"
+
+
+def run_pipeline(pdf_bytes, file_name, deck_name, timer, pack_limits=(1, 0), stream=False):
+    """
+    The Creator Studio generation path, stage by stage. Returns counts of
+    produced and failed cards and the seconds until the first card text was
+    visible: a streamed partial card, or else the first finished card.
+    """
+    import fitz  # PyMuPDF
+    import streamlit as st
+
+    from backend import generation
+    from backend.anki_export import export_anki_package
+    from backend.document_store import add_document
+    from backend.fach_manager import create_fach
+    from backend.storage_backend import create_storage_client
+
+    bucket = create_storage_client().storage.from_(st.secrets["supabase"]["bucket"])
+
+    with timer.stage("upload"):
+        create_fach(FACH)
+        storage_path = add_document(FACH, file_name, pdf_bytes)["path"]
+
+    with timer.stage("render"):
+        doc = fitz.open(stream=bucket.download(storage_path), filetype="pdf")
+
+    flashcards = []
+    failed_pages = 0
+    started = time.perf_counter()
+    first_card = []
+
+    def on_partial(page_number, card):
+        if not first_card and card.get("question"):
+            first_card.append(time.perf_counter() - started)
+
+    rendered = []
+    for page_num in range(doc.page_count):
+        with timer.stage("render"):
+            rendered.append((page_num + 1, *generation.render_page(doc[page_num])))
+    images = {page_number: image_bytes for page_number, image_bytes, _ in rendered}
+
+    for pack in generation.page_packs(rendered, pack_limits):
+        with timer.stage("cards"):
+            results = generation.request_page_cards(pack, file_name, on_partial if stream else None)
+        if not first_card:
+            first_card.append(time.perf_counter() - started)
+        for page_number, flashcard in results:
+            if isinstance(flashcard, Exception):
+                failed_pages += 1
+                continue
+            if flashcard["question"].startswith("Error processing page"):
+                failed_pages += 1
+            with timer.stage("images"):
+                flashcards.append(
+                    generation.attach_page_images(flashcard, FACH, file_name, page_number, images[page_number])
+                )
+
+    with timer.stage("mindmap"):
+        flashcards.append(generation.generate_mindmap_card(doc, file_name, []))
+
+    with timer.stage("save"):
+        generation.save_document_cards(FACH, file_name, flashcards)
+
+    with timer.stage("export"):
+        export = export_anki_package(FACH, deck_name, flashcards)
+
+    storage_stats = {"bytes_read": bucket.bytes_read, "bytes_written": bucket.bytes_written}
+    return {
+        "pages": doc.page_count,
+        "cards": len(flashcards),
+        "failed_pages": failed_pages,
+        "export_bytes": export["size"],
+        "first_card_seconds": first_card[0] if first_card else None,
+    }, storage_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF to process (default: synthetic lecture slides)")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the synthetic PDF")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean model latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--pause", type=float, default=0.0,
+                        help="Minimum seconds between model call starts (the app uses PAGE_PAUSE_SECONDS)")
+    parser.add_argument("--pack-pages", type=int, default=1, help="Max pages per packed model request (1: no packing)")
+    parser.add_argument("--pack-token-budget", type=int, default=6000, help="Estimated input tokens per packed request")
+    parser.add_argument("--stream", action="store_true", help="Stream the flashcard responses")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON result here instead of printing it")
+    parser.add_argument("--baseline", help="Earlier result to compare against")
+    args = parser.parse_args()
+
+    if args.pdf:
+        pdf_bytes = Path(args.pdf).read_bytes()
+        file_name = Path(args.pdf).name
+    else:
+        pdf_bytes = synthetic_pdf(args.pages)
+        file_name = f"synthetic_{args.pages}.pdf"
+
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, seed=args.seed)
+    timer = StageTimer()
+    requests_per_minute = 60 / args.pause if args.pause else UNLIMITED_REQUESTS_PER_MINUTE
+    with FakeOpenAIServer(config) as server, bench_environment(server.base_url, requests_per_minute):
+        started = time.perf_counter()
+        counts, storage_stats = run_pipeline(
+            pdf_bytes, file_name, "Benchmark Deck", timer, (args.pack_pages, args.pack_token_budget),
+            args.stream,
+        )
+        total = time.perf_counter() - started
+
+    result = {
+        "benchmark": "pipeline",
+        "meta": run_metadata(),
+        "config": {
+            "pdf": file_name,
+            "pdf_bytes": len(pdf_bytes),
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate,
+            "pause": args.pause,
+            "pack_pages": args.pack_pages,
+            "pack_token_budget": args.pack_token_budget,
+            "stream": args.stream,
+        },
+        "counts": counts,
+        "stages_seconds": timer.seconds,
+        "total_seconds": total,
+        "pages_per_minute": counts["pages"] / total * 60 if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "model": server.stats.as_dict(),
+        "storage": storage_stats,
+    }
+    write_result(result, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start benchmark: import time of the backend modules and of the heavy
+third-party packages, and the first run of app.py.
+
+Every measurement runs in a fresh interpreter, so nothing is cached between
+runs. The first app run uses Streamlit's AppTest with the local storage
+backend. Modules are also imported once without any secrets, to show which
+of them still need secrets at import time.
+
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import REPO_ROOT, bench_environment, run_metadata, write_result
+
+BACKEND_MODULES = [
+    "backend.fach_manager",
+    "backend.flashcard_manager",
+    "backend.storage_utils",
+    "backend.image_derivatives",
+    "backend.generation",
+    "backend.anki_export",
+    "backend.export_jobs",
+    "backend.learning",
+    "backend.gpt_interface",
+]
+
+THIRD_PARTY_MODULES = ["fitz", "genanki", "pyvis.network", "openai", "supabase", "boto3", "PIL.Image"]
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+FIRST_RUN_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+testing_import = time.perf_counter() - started
+started = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=300).run()
+print(json.dumps({{"seconds": time.perf_counter() - started, "testing_import": testing_import,
+                  "exception": bool(at.exception), "modules": len(sys.modules)}}))
+"""
+
+
+def _python(code, cwd, *flags):
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=cwd, capture_output=True, text=True)
+
+
+def import_seconds(module, cwd, repeat):
+    samples = []
+    for _ in range(repeat):
+        result = _python(IMPORT_SNIPPET.format(root=str(REPO_ROOT), module=module), cwd)
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return {"median_ms": statistics.median(samples) * 1000, "min_ms": min(samples) * 1000}
+
+
+def heaviest_imports(cwd, top):
+    """Top-level packages imported during the first app run, by cumulative import time (-X importtime)."""
+    result = _python(FIRST_RUN_SNIPPET.format(root=str(REPO_ROOT), app=str(REPO_ROOT / "app.py")), cwd, "-X", "importtime")
+    packages = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  ") and name.strip() != "streamlit.testing.v1":
+            packages.append({"package": name.strip(), "ms": int(cumulative) / 1000})
+    return sorted(packages, key=lambda package: package["ms"], reverse=True)[:top]
+
+
+def first_app_run(cwd):
+    result = _python(FIRST_RUN_SNIPPET.format(root=str(REPO_ROOT), app=str(REPO_ROOT / "app.py")), cwd)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr else "failed"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="Heaviest packages imported by the first app run")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="merkwerk-nosecrets-") as bare_dir:
+        without_secrets = {module: _python(IMPORT_SNIPPET.format(root=str(REPO_ROOT), module=module), bare_dir).returncode == 0
+                           for module in BACKEND_MODULES}
+
+    with bench_environment() as workdir:
+        backend = {module: import_seconds(module, workdir, args.repeat) for module in BACKEND_MODULES}
+        third_party = {module: import_seconds(module, workdir, args.repeat) for module in THIRD_PARTY_MODULES}
+        heaviest = heaviest_imports(workdir, args.top)
+        first_run = [first_app_run(workdir) for _ in range(max(1, args.repeat // 2))]
+
+    runs = [run["seconds"] for run in first_run if "seconds" in run]
+    result = {
+        "benchmark": "startup",
+        "meta": run_metadata(),
+        "config": {"repeat": args.repeat},
+        "backend_import": backend,
+        "third_party_import": third_party,
+        "heaviest_packages": heaviest,
+        "importable_without_secrets": without_secrets,
+        "app_first_run": {
+            "median_s": statistics.median(runs) if runs else None,
+            "modules_loaded": first_run[0].get("modules"),
+            "runs": first_run,
+        },
+    }
+    write_result(result, args.output, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
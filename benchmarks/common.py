@@ -0,0 +1,146 @@
+# benchmarks/common.py
+"""Shared setup and reporting for the benchmark scripts."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+SECRETS_TEMPLATE = """
+[supabase]
+url = "http://127.0.0.1:9"
+key = "benchmark"
+bucket = "benchmark"
+
+[s3]
+aws_access_key_id = "benchmark"
+aws_secret_access_key = "benchmark"
+
+[storage]
+backend = "local"
+path = "{storage_path}"
+
+[openai]
+api_key = "benchmark"
+
+[generation]
+requests_per_minute = {requests_per_minute}
+"""
+
+# Model calls are not spaced out unless a benchmark asks for it
+UNLIMITED_REQUESTS_PER_MINUTE = 1_000_000
+
+
+@contextmanager
+def bench_environment(openai_base_url=None, requests_per_minute=UNLIMITED_REQUESTS_PER_MINUTE):
+    """
+    Run the app's backend headlessly: a temporary working directory with
+    secrets that select the local storage backend (and, optionally, a fake
+    OpenAI endpoint). requests_per_minute sets the model limiter of
+    backend/generation.py. Import backend modules only inside this block.
+    """
+    previous_cwd = os.getcwd()
+    previous_base_url = os.environ.get("OPENAI_BASE_URL")
+    with tempfile.TemporaryDirectory(prefix="merkwerk-bench-") as workdir:
+        secrets_dir = Path(workdir) / ".streamlit"
+        secrets_dir.mkdir()
+        storage_path = Path(workdir) / "storage"
+        (secrets_dir / "secrets.toml").write_text(SECRETS_TEMPLATE.format(
+            storage_path=storage_path.as_posix(), requests_per_minute=requests_per_minute
+        ))
+        if openai_base_url:
+            os.environ["OPENAI_BASE_URL"] = openai_base_url
+        if str(REPO_ROOT) not in sys.path:
+            sys.path.insert(0, str(REPO_ROOT))
+        os.chdir(workdir)
+        try:
+            yield Path(workdir)
+        finally:
+            os.chdir(previous_cwd)
+            if previous_base_url is None:
+                os.environ.pop("OPENAI_BASE_URL", None)
+            else:
+                os.environ["OPENAI_BASE_URL"] = previous_base_url
+
+
+class StageTimer:
+    """Accumulates wall time per named stage."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(), "timestamp": time.time()}
+
+
+def synthetic_pdf(pages, seed_text="Merkwerk Benchmark"):
+    """A text-heavy lecture-like PDF with the given number of pages."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 80), f"{seed_text} – Kapitel {number}", fontsize=20)
+        body = " ".join(f"Begriff{number}_{i} wird hier mit einfachen Worten erklärt." for i in range(40))
+        page.insert_textbox(fitz.Rect(72, 110, 520, 700), body, fontsize=11)
+        page.draw_rect(fitz.Rect(72, 710, 300, 780), color=(0.2, 0.3, 0.8), fill=(0.8, 0.85, 1.0))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _flatten(result, prefix=""):
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def write_result(result, output=None, baseline=None):
+    """Print or write the result as JSON; with a baseline file, also print the change per metric."""
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if output:
+        Path(output).write_text(text)
+    else:
+        print(text)
+
+    if baseline:
+        old = _flatten(json.loads(Path(baseline).read_text()))
+        new = _flatten(result)
+        print(f"\n{'metric':50} {'baseline':>14} {'current':>14} {'change':>9}", file=sys.stderr)
+        for key in sorted(set(old) & set(new)):
+            if key.startswith(("config.", "meta.")):
+                continue
+            change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+            print(f"{key:50} {old[key]:>14.4g} {new[key]:>14.4g} {change:>9}", file=sys.stderr)
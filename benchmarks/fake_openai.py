@@ -0,0 +1,271 @@
+# benchmarks/fake_openai.py
+"""
+Local stand-in for the OpenAI Responses API, for benchmarks.
+
+Answers POST /v1/responses with schema-conforming Flashcard, FlashcardBatch
+or Mindmap output after a configurable latency, and injects 429s and 500s at
+configurable rates. Requests with "stream": true get the output as server-sent
+events, its text in small deltas spread over the latency. Point the OpenAI client at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+    python -m benchmarks.fake_openai --port 8765 --latency-ms 800 --rate-limit-rate 0.05
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIConfig:
+    def __init__(self, latency_ms=500, jitter_ms=100, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+
+
+class FakeOpenAIStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.status_counts = {}
+
+    def record(self, status, bytes_in, bytes_out):
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.status_counts[str(status)] = self.status_counts.get(str(status), 0) + 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "status_counts": dict(self.status_counts),
+            }
+
+
+def _input_text(body):
+    """All input_text parts of a request, or the plain string input."""
+    if isinstance(body.get("input"), str):
+        return body["input"]
+    parts = []
+    for message in body.get("input", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "input_text":
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+def _image_tokens(body):
+    """Rough input tokens of the request's images: 85 in low detail, 765 for a page otherwise."""
+    if isinstance(body.get("input"), str):
+        return 0
+    return sum(
+        85 if part.get("detail") == "low" else 765
+        for message in body.get("input", []) if isinstance(message.get("content"), list)
+        for part in message["content"] if part.get("type") == "input_image"
+    )
+
+
+def _fake_output(schema_name, prompt):
+    if schema_name == "Mindmap":
+        topic = re.search(r'zentrale Thema heißt "([^"]*)"', prompt)
+        root = topic.group(1) if topic else "Dokument"
+        nodes = [root] + [f"Thema {i}" for i in range(1, 6)]
+        return {"nodes": nodes, "edges": [[root, node] for node in nodes[1:]]}
+
+    document = re.search(r"- Dokument: (.*)", prompt)
+    upload = document.group(1).strip() if document else ""
+    if schema_name == "FlashcardBatch":
+        pages = re.search(r"- Seiten: ([\d, ]+)", prompt)
+        numbers = [int(number) for number in re.findall(r"\d+", pages.group(1))] if pages else []
+        return {"cards": [_fake_card(upload, number) for number in numbers]}
+
+    page = re.search(r"- Seite: (\d+)", prompt)
+    return _fake_card(upload, int(page.group(1)) if page else 0)
+
+
+def _fake_card(upload, page_number):
+    return {
+        "upload": upload,
+        "question": f"Worum geht es auf Seite {page_number or '?'}?",
+        "answer": [f"• Stichpunkt {i}, kurz erklärt" for i in range(1, 5)],
+        "page": page_number,
+    }
+
+
+def _message(text, status="completed", message_id=None):
+    return {
+        "type": "message",
+        "id": message_id or f"msg_{uuid.uuid4().hex}",
+        "status": status,
+        "role": "assistant",
+        "content": [{"type": "output_text", "text": text, "annotations": []}] if text is not None else [],
+    }
+
+
+def _response_body(body, output):
+    prompt_tokens = len(_input_text(body)) // 4 + _image_tokens(body)
+    text = json.dumps(output, ensure_ascii=False)
+    output_tokens = len(text) // 4
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": body.get("model", "fake-model"),
+        "output": [_message(text)],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "temperature": body.get("temperature"),
+        "top_p": 1.0,
+        "error": None,
+        "incomplete_details": None,
+        "instructions": None,
+        "metadata": {},
+        "usage": {
+            "input_tokens": prompt_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": prompt_tokens + output_tokens,
+        },
+    }
+
+
+def _stream_events(response, chunk_chars=24):
+    """The server-sent events of a streamed response, as (event type, payload) pairs."""
+    message = response["output"][0]
+    text = message["content"][0]["text"]
+    part = {"type": "output_text", "text": "", "annotations": []}
+    location = {"item_id": message["id"], "output_index": 0, "content_index": 0}
+
+    yield "response.created", {"response": {**response, "status": "in_progress", "output": [], "usage": None}}
+    yield "response.output_item.added", {
+        "output_index": 0, "item": _message(None, "in_progress", message["id"]),
+    }
+    yield "response.content_part.added", {**location, "part": part}
+    for start in range(0, len(text), chunk_chars):
+        yield "response.output_text.delta", {**location, "delta": text[start:start + chunk_chars], "logprobs": []}
+    yield "response.output_text.done", {**location, "text": text, "logprobs": []}
+    yield "response.content_part.done", {**location, "part": {**part, "text": text}}
+    yield "response.output_item.done", {"output_index": 0, "item": message}
+    yield "response.completed", {"response": response}
+
+
+def make_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, payload, bytes_in, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+            stats.record(status, bytes_in, len(data))
+
+        def _send_stream(self, response, latency, bytes_in):
+            events = list(_stream_events(response))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            sent = 0
+            for sequence_number, (event_type, payload) in enumerate(events):
+                data = json.dumps({"type": event_type, "sequence_number": sequence_number, **payload})
+                chunk = f"event: {event_type}\ndata: {data}\n\n".encode("utf-8")
+                self.wfile.write(chunk)
+                self.wfile.flush()
+                sent += len(chunk)
+                time.sleep(latency / len(events))
+            stats.record(200, bytes_in, sent)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            body = json.loads(raw or b"{}")
+
+            latency = max(0.0, config.latency_ms + config.random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+            # A streamed response starts early and spreads the rest of the latency over its events
+            time.sleep(latency * 0.2 if body.get("stream") else latency)
+
+            roll = config.random.random()
+            if roll < config.rate_limit_rate:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                           len(raw), {"retry-after-ms": "200"})
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                self._send(500, {"error": {"message": "Injected server error", "type": "server_error", "code": None}}, len(raw))
+                return
+
+            schema_name = ((body.get("text") or {}).get("format") or {}).get("name", "Flashcard")
+            output = _fake_output(schema_name, _input_text(body))
+            if body.get("stream"):
+                self._send_stream(_response_body(body, output), latency * 0.8, len(raw))
+            else:
+                self._send(200, _response_body(body, output), len(raw))
+
+    return Handler
+
+
+class FakeOpenAIServer:
+    """Runs the fake API on a background thread: `with FakeOpenAIServer(config) as server: server.base_url`."""
+
+    def __init__(self, config=None, port=0):
+        self.config = config or FakeOpenAIConfig()
+        self.stats = FakeOpenAIStats()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self.config, self.stats))
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate)
+    with FakeOpenAIServer(config, port=args.port) as server:
+        print(f"Fake OpenAI API on {server.base_url}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# tests/conftest.py
+import itertools
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+SECRETS = """
+[supabase]
+url = "http://127.0.0.1:9"
+key = "test"
+bucket = "test"
+
+[storage]
+backend = "local"
+path = "{storage_path}"
+"""
+
+_fach_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def local_storage(tmp_path_factory):
+    """
+    Run the backend against the local storage backend in a temporary working
+    directory, which also holds the card replica and search index.
+    st.secrets is read once per process, so all tests share it; use `fach`
+    for a fresh fach per test.
+    """
+    workdir = tmp_path_factory.mktemp("merkwerk")
+    (workdir / ".streamlit").mkdir()
+    (workdir / ".streamlit" / "secrets.toml").write_text(
+        SECRETS.format(storage_path=(workdir / "storage").as_posix())
+    )
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    yield workdir
+    os.chdir(previous_cwd)
+
+
+@pytest.fixture
+def fach():
+    return f"Fach_{next(_fach_numbers)}"
@@ -0,0 +1,56 @@
+# tests/test_anki_export.py
+import base64
+import io
+import sqlite3
+import zipfile
+
+from backend.anki_export import export_anki_package
+from backend.fach_backup import list_objects
+
+
+def _card(card_id, question):
+    return {"id": card_id, "upload": "Skript.pdf", "question": question, "answer": ["• a"], "page": 1, "priority": 2}
+
+
+def _questions(export, tmp_path):
+    """Questions of the notes in an exported package (the local backend signs URLs as data URLs)."""
+    package = base64.b64decode(export["url"].split(",", 1)[1])
+    with zipfile.ZipFile(io.BytesIO(package)) as archive:
+        (tmp_path / "collection.anki2").write_bytes(archive.read("collection.anki2"))
+    with sqlite3.connect(tmp_path / "collection.anki2") as connection:
+        fields = [row[0] for row in connection.execute("SELECT flds FROM notes")]
+    return sorted(field.split("\x1f")[0] for field in fields)
+
+
+def _packages(fach):
+    return sorted(path for path, _ in list_objects(fach) if path.endswith(".apkg"))
+
+
+def test_second_export_contains_only_changed_cards(fach, tmp_path):
+    cards = [_card("a", "Mitose"), _card("b", "Meiose"), _card("c", "Enzym")]
+    first = export_anki_package(fach, "Bio", cards, only_changed=True)
+    assert first["cards"] == 3 and not first["cached"]
+
+    cards[1] = {**cards[1], "question": "Meiose II"}
+    cards[2] = {**cards[2], "priority": 1}  # Learning state only, not exported
+    delta = export_anki_package(fach, "Bio", cards + [_card("d", "Osmose")], only_changed=True)
+
+    assert delta["cards"] == 2
+    assert _questions(delta, tmp_path) == ["Meiose II", "Osmose"]
+    assert len(_packages(fach)) == 1
+    unchanged = export_anki_package(fach, "Bio", cards + [_card("d", "Osmose")], only_changed=True)
+    assert unchanged["url"] is None and unchanged["cards"] == 0
+
+
+def test_unchanged_export_is_reused_and_stale_packages_are_removed(fach, tmp_path):
+    cards = [_card("a", "Mitose"), _card("b", "Meiose")]
+    export_anki_package(fach, "Bio", cards)
+    assert export_anki_package(fach, "Bio", cards)["cached"]
+    first_packages = _packages(fach)
+    assert len(first_packages) == 1
+
+    changed = export_anki_package(fach, "Bio", cards + [_card("c", "Enzym")])
+
+    assert not changed["cached"]
+    assert _questions(changed, tmp_path) == ["Enzym", "Meiose", "Mitose"]
+    assert len(_packages(fach)) == 1 and _packages(fach) != first_packages
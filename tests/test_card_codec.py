@@ -0,0 +1,53 @@
+# tests/test_card_codec.py
+import base64
+import json
+import os
+
+import pytest
+
+from backend import card_codec
+
+CARDS = [
+    {"id": "a", "upload": "Übung 1.pdf", "question": "Was ist Mitose?", "answer": ["• Zellteilung", "• ß"], "page": 1},
+    {"id": "b", "upload": "Übung 1.pdf", "question": "Mindmap", "answer": "<html></html>", "mindmap": True},
+]
+
+CODECS = ["json", "gzip", pytest.param("zstd", marks=pytest.mark.skipif(
+    card_codec.zstandard is None, reason="zstandard is not installed"
+))]
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip(codec):
+    data, content_type = card_codec.encode_cards(CARDS, codec)
+
+    assert content_type == card_codec.CONTENT_TYPES[codec]
+    assert card_codec.sniff(data) == codec
+    assert card_codec.decode_cards(data) == CARDS
+
+
+def test_legacy_pretty_json_is_decoded():
+    legacy = json.dumps(CARDS, indent=4).encode("utf-8")
+    assert card_codec.decode_cards(legacy) == CARDS
+
+
+def test_codec_is_sniffed_from_the_magic_bytes():
+    assert card_codec.sniff(card_codec.GZIP_MAGIC + b"rest") == "gzip"
+    assert card_codec.sniff(card_codec.ZSTD_MAGIC + b"rest") == "zstd"
+    assert card_codec.sniff(b"[]") == "json"
+    assert card_codec.sniff(b"") == "json"
+
+
+def test_incompressible_documents_are_stored_as_json():
+    cards = [{"id": "a", "question": "Bild", "image_base64": base64.b64encode(os.urandom(512 * 1024)).decode("ascii")}]
+
+    data, content_type = card_codec.encode_cards(cards, "gzip")
+
+    assert content_type == card_codec.CONTENT_TYPES["json"]
+    assert card_codec.decode_cards(data) == cards
+
+
+@pytest.mark.skipif(card_codec.zstandard is not None, reason="zstandard is installed")
+def test_zstd_without_the_package_fails_clearly():
+    with pytest.raises(RuntimeError, match="zstandard"):
+        card_codec.decode_cards(card_codec.ZSTD_MAGIC + b"rest")
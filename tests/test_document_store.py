@@ -0,0 +1,31 @@
+# tests/test_document_store.py
+from backend import document_store
+from backend.document_store import add_document, forget_document, load_manifest
+
+
+def test_manifest_change_is_reapplied_after_a_concurrent_write(fach):
+    safe_fach = document_store._to_storage_safe_component(fach)
+    add_document(fach, "A.pdf", b"%PDF a")
+    attempts = []
+
+    def add_entry(documents):
+        attempts.append(dict(documents))
+        if len(attempts) == 1:
+            # Another process writes the next generation in the meantime
+            add_document(fach, "B.pdf", b"%PDF b")
+        documents["C.pdf"] = {"blob": "c", "size": 1, "added_at": 0}
+
+    document_store._update_manifest(safe_fach, add_entry)
+
+    assert len(attempts) == 2
+    assert set(load_manifest(fach)) == {"A.pdf", "B.pdf", "C.pdf"}
+
+
+def test_shared_blob_is_kept_until_the_last_document_is_forgotten(fach):
+    first = add_document(fach, "Skript.pdf", b"%PDF same")
+    second = add_document(fach, "Skript Kopie.pdf", b"%PDF same")
+    assert second["duplicate_of"] == "Skript.pdf"
+
+    assert first["path"] not in forget_document(fach, "Skript.pdf")
+    assert first["path"] in forget_document(fach, "Skript Kopie.pdf")
+    assert load_manifest(fach) == {}
@@ -0,0 +1,20 @@
+# tests/test_export_jobs.py
+import time
+
+from backend.export_jobs import get_job, start_bulk_export
+from backend.flashcard_manager import update_flashcards
+
+
+def test_bulk_export_returns_image_warnings_with_the_result(fach):
+    update_flashcards(fach, [
+        {"id": "a", "upload": "Skript.pdf", "question": "Frage", "answer": ["• a"], "page": 1,
+         "images": [{"page": 1, "file": "Fehlt_page_1.png"}]},
+    ])
+
+    job_id = start_bulk_export([fach])
+    while not get_job(job_id)["finished"]:
+        time.sleep(0.01)
+
+    entry = get_job(job_id)["faecher"][fach]
+    assert entry["status"] == "fertig" and entry["url"]
+    assert len(entry["warnings"]) == 1 and "Frage" in entry["warnings"][0]
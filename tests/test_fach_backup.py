@@ -0,0 +1,50 @@
+# tests/test_fach_backup.py
+import base64
+import io
+
+from backend.document_store import add_document
+from backend.fach_backup import _backed_up, export_fach, list_objects, read_backup_info, restore_fach, upload_backup
+from backend.flashcard_manager import load_flashcards, update_flashcards
+from backend.storage_utils import _get_bucket
+
+
+def _build_fach(fach):
+    add_document(fach, "Skript.pdf", b"%PDF skript")
+    _get_bucket().upload(f"{fach}/images/Skript_page_1.png", b"\x89PNG seite 1")
+    update_flashcards(fach, [
+        {"id": "a", "upload": "Skript.pdf", "question": "Frage", "answer": ["• Antwort"], "page": 1, "priority": 1,
+         "images": [{"page": 1, "file": "Skript_page_1.png"}]},
+    ])
+
+
+def _objects(fach):
+    return [
+        (path, _get_bucket().download(f"{fach}/{path}"))
+        for path, _ in list_objects(fach) if _backed_up(path)
+    ]
+
+
+def test_export_and_restore_round_trip(fach):
+    _build_fach(fach)
+    archive = io.BytesIO()
+    stats = export_fach(fach, archive)
+    assert stats["cards"] == 1
+
+    archive.seek(0)
+    assert read_backup_info(archive)["fach"] == fach
+    restored = f"{fach}_restored"
+    restore_fach(archive, restored)
+
+    assert _objects(restored) == _objects(fach)
+    assert load_flashcards(restored)[0] == load_flashcards(fach)[0]
+
+
+def test_uploaded_backup_is_left_out_of_the_next_backup(fach):
+    _build_fach(fach)
+    first = upload_backup(fach)
+    second = upload_backup(fach)
+    assert second["objects"] == first["objects"]
+
+    # The local backend signs URLs as data URLs
+    archive = io.BytesIO(base64.b64decode(second["url"].split(",", 1)[1]))
+    assert read_backup_info(archive)["objects"] == second["objects"]
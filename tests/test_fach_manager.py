@@ -0,0 +1,16 @@
+# tests/test_fach_manager.py
+from backend.fach_backup import list_objects
+from backend.fach_manager import create_fach, delete_fach, get_all_faecher
+from backend.flashcard_manager import load_flashcards, update_flashcards
+
+
+def test_delete_fach_removes_card_generations(fach):
+    assert create_fach(fach) is True
+    update_flashcards(fach, [{"id": "a", "upload": "Skript.pdf", "question": "Frage", "answer": [], "page": 1}])
+    assert load_flashcards(fach)[1] == 1
+
+    delete_fach(fach)
+
+    assert list_objects(fach, hidden=True) == []
+    assert load_flashcards(fach) == ([], 0)
+    assert fach not in get_all_faecher()
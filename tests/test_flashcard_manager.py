@@ -0,0 +1,66 @@
+# tests/test_flashcard_manager.py
+import json
+
+from backend.flashcard_manager import KEEP_GENERATIONS, load_flashcards, update_flashcards
+from backend.storage_utils import _get_bucket
+
+
+def _card(card_id, priority=2):
+    return {"id": card_id, "upload": "Skript.pdf", "question": f"Frage {card_id}", "answer": ["• a"], "page": 1,
+            "priority": priority}
+
+
+def test_concurrent_writes_are_merged(fach):
+    update_flashcards(fach, [_card("a"), _card("b")])
+    mine, base = load_flashcards(fach)
+
+    theirs, _ = load_flashcards(fach)
+    theirs[1]["priority"] = 1
+    update_flashcards(fach, theirs + [_card("c")])
+
+    mine[0]["priority"] = 3
+    assert update_flashcards(fach, mine, base_generation=base) is not None
+    cards = {card["id"]: card for card in load_flashcards(fach)[0]}
+    assert set(cards) == {"a", "b", "c"}
+    assert cards["a"]["priority"] == 3
+    assert cards["b"]["priority"] == 1
+
+
+def test_write_against_pruned_base_fails_without_losing_changes(fach):
+    update_flashcards(fach, [_card("a"), _card("b")])
+    mine, base = load_flashcards(fach)
+
+    # Other sessions add a card, rate one, and write until the base is pruned
+    theirs, _ = load_flashcards(fach)
+    theirs[1]["priority"] = 1
+    update_flashcards(fach, theirs + [_card("c")])
+    for _ in range(KEEP_GENERATIONS):
+        update_flashcards(fach, load_flashcards(fach)[0])
+
+    mine[0]["priority"] = 3
+    assert update_flashcards(fach, mine, base_generation=base) is None
+    cards = {card["id"]: card for card in load_flashcards(fach)[0]}
+    assert set(cards) == {"a", "b", "c"}
+    assert cards["b"]["priority"] == 1
+
+
+def test_pruned_generation_zero_is_not_read_from_flashcards_json(fach):
+    # The first write freezes the (empty) generation 0; enough writes prune it
+    for number in range(KEEP_GENERATIONS + 1):
+        update_flashcards(fach, load_flashcards(fach)[0] + [_card(f"n{number}")])
+
+    assert update_flashcards(fach, [_card("mine")], base_generation=0) is None
+    assert len(load_flashcards(fach)[0]) == KEEP_GENERATIONS + 1
+
+
+def test_legacy_flashcards_json_is_migrated_once_and_left_alone(fach):
+    legacy = json.dumps([_card("alt")]).encode("utf-8")
+    _get_bucket().upload(f"{fach}/flashcards.json", legacy)
+    assert [card["id"] for card in load_flashcards(fach)[0]] == ["alt"]
+
+    cards, generation = load_flashcards(fach)
+    update_flashcards(fach, cards + [_card("neu")], base_generation=generation)
+    update_flashcards(fach, load_flashcards(fach)[0])
+
+    assert _get_bucket().download(f"{fach}/flashcards.json") == legacy
+    assert [card["id"] for card in load_flashcards(fach)[0]] == ["alt", "neu"]
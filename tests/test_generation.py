@@ -0,0 +1,99 @@
+# tests/test_generation.py
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend import generation, gpt_interface
+from backend.generation import PACK_MIN_TEXT_CHARS, ModelLimiter, fits_pack, page_packs, request_page_cards
+from backend.gpt_interface import Flashcard, FlashcardBatch
+
+LIMITS = (3, 2000)
+TEXT = "Mitose " * (PACK_MIN_TEXT_CHARS // 7 + 1)
+
+
+def _page(page_number, text=TEXT):
+    return (page_number, b"png", text)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """
+    Stub the model: a packed request answers with the cards for the pages in
+    `packed_pages` (the requested ones unless set), a single-page request with
+    one card. Records the pages of every request.
+    """
+    calls = {"packed": [], "single": [], "packed_pages": None}
+    monkeypatch.setattr(generation, "_model_limiter", ModelLimiter(4, 0))
+
+    def parse(call, on_text=None, **request):
+        texts = [part["text"] for part in request["input"][0]["content"] if part["type"] == "input_text"][1:]
+        requested = [int(text.split()[1]) for text in texts]
+        calls["packed"].append(requested)
+        pages = calls["packed_pages"] or requested
+        cards = [Flashcard(upload="x", question=f"Gepackt {page}", answer=["• a"], page=page) for page in pages]
+        return SimpleNamespace(output_parsed=FlashcardBatch(cards=cards))
+
+    def analyze_image(base64_image, upload_name, page_number, page_text, on_partial=None):
+        calls["single"].append(page_number)
+        return json.dumps({"upload": upload_name, "question": f"Einzeln {page_number}", "answer": ["• a"]})
+
+    monkeypatch.setattr(gpt_interface, "_parse", parse)
+    monkeypatch.setattr(gpt_interface, "analyze_image_for_flashcard_base64", analyze_image)
+    return calls
+
+
+def test_packs_end_at_the_page_limit():
+    packs = list(page_packs([_page(number) for number in range(1, 8)], LIMITS))
+    assert [[page[0] for page in pack] for pack in packs] == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_packs_end_at_the_token_budget():
+    long_text = "Wort " * 1500  # about 2500 estimated tokens, more than the budget alone
+    packs = list(page_packs([_page(1), _page(2, long_text), _page(3)], LIMITS))
+    assert [[page[0] for page in pack] for pack in packs] == [[1], [2], [3]]
+
+
+def test_pages_with_little_text_go_alone():
+    assert not fits_pack([_page(1), _page(2, "Nur ein Bild")], LIMITS)
+    assert fits_pack([_page(1, "Nur ein Bild")], LIMITS)
+    packs = list(page_packs([_page(1), _page(2, "Nur ein Bild"), _page(3), _page(4)], LIMITS))
+    assert [[page[0] for page in pack] for pack in packs] == [[1], [2], [3, 4]]
+
+
+def test_packing_is_off_by_default():
+    assert generation.pack_limits() == (1, 0)
+    assert len(list(page_packs([_page(1), _page(2)]))) == 2
+
+
+def test_pack_is_one_request(model):
+    results = request_page_cards([_page(1), _page(2), _page(3)], "Skript.pdf")
+
+    assert model["packed"] == [[1, 2, 3]] and model["single"] == []
+    assert [(page, card["question"], card["page"]) for page, card in results] == [
+        (1, "Gepackt 1", 1), (2, "Gepackt 2", 2), (3, "Gepackt 3", 3),
+    ]
+    assert len({card["id"] for _, card in results}) == 3
+
+
+@pytest.mark.parametrize("returned", [[1, 2], [1, 2, 2], [1, 2, 4]], ids=["missing", "duplicate", "foreign"])
+def test_page_mismatch_falls_back_to_single_pages(model, returned):
+    model["packed_pages"] = returned
+
+    results = request_page_cards([_page(1), _page(2), _page(3)], "Skript.pdf")
+
+    assert model["single"] == [1, 2, 3]
+    assert [(page, card["question"], card["page"]) for page, card in results] == [
+        (1, "Einzeln 1", 1), (2, "Einzeln 2", 2), (3, "Einzeln 3", 3),
+    ]
+
+
+def test_failed_single_page_is_returned_as_error(model, monkeypatch):
+    model["packed_pages"] = [1]
+    monkeypatch.setattr(gpt_interface, "analyze_image_for_flashcard_base64",
+                        lambda page_number, **kwargs: "kein JSON" if page_number == 2 else json.dumps({"question": "q"}))
+
+    results = dict(request_page_cards([_page(1), _page(2)], "Skript.pdf"))
+
+    assert results[1]["question"] == "q"
+    assert isinstance(results[2], json.JSONDecodeError)
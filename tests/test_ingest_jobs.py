@@ -0,0 +1,68 @@
+# tests/test_ingest_jobs.py
+import time
+
+import fitz
+import pytest
+
+from backend import ingest_jobs
+from backend.flashcard_manager import load_flashcards
+
+
+def _pdf(text):
+    with fitz.open() as doc:
+        doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+def _card(file_name, page_number):
+    return {"upload": file_name, "question": f"Seite {page_number}", "answer": ["• a"], "page": page_number}
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """Stub the model: every page gets a card, unless `fail` is set."""
+    calls = {"pages": 0, "fail": False}
+
+    def pack_cards(selected_fach, file_name, pack, warn=None, on_partial=None):
+        calls["pages"] += len(pack)
+        if calls["fail"]:
+            raise RuntimeError("Modell nicht erreichbar")
+        return [(page_number, _card(file_name, page_number)) for page_number, _, _ in pack]
+
+    def mindmap_card_from_text(text, file_name):
+        raise RuntimeError("Keine Mindmap")
+
+    monkeypatch.setattr(ingest_jobs, "pack_cards", pack_cards)
+    monkeypatch.setattr(ingest_jobs, "mindmap_card_from_text", mindmap_card_from_text)
+    return calls
+
+
+def _ingest(fach, files):
+    job_id = ingest_jobs.start_ingest(fach, files)
+    while not ingest_jobs.get_ingest_job(job_id)["finished"]:
+        time.sleep(0.01)
+    return ingest_jobs.get_ingest_job(job_id)["documents"]
+
+
+def test_reupload_without_cards_is_generated_again(fach, model_calls):
+    pdf = _pdf("Skript")
+    model_calls["fail"] = True
+    assert _ingest(fach, [("Skript.pdf", pdf)])["Skript.pdf"]["cards"] == 0
+
+    model_calls["fail"] = False
+    entry = _ingest(fach, [("Skript.pdf", pdf)])["Skript.pdf"]
+
+    assert entry["status"] == "fertig" and entry["cards"] == 1
+    assert "duplicate_of" not in entry
+    assert [card["upload"] for card in load_flashcards(fach)[0]] == ["Skript.pdf"]
+
+
+def test_copy_of_a_document_with_cards_reuses_them(fach, model_calls):
+    pdf = _pdf("Skript")
+    _ingest(fach, [("Skript.pdf", pdf)])
+    pages = model_calls["pages"]
+
+    entry = _ingest(fach, [("Skript Kopie.pdf", pdf)])["Skript Kopie.pdf"]
+
+    assert entry["duplicate_of"] == "Skript.pdf" and entry["cards"] == 1
+    assert model_calls["pages"] == pages
@@ -0,0 +1,30 @@
+# tests/test_job_registry.py
+import time
+
+from backend import job_registry
+from backend.job_registry import JobRegistry
+
+
+def test_job_finishes_with_its_last_item():
+    jobs = JobRegistry("documents")
+    job_id = jobs.create({"A.pdf": {"status": "wartend", "errors": []}, "B.pdf": {"status": "wartend", "errors": []}})
+
+    jobs.update(job_id, "A.pdf", status="fertig")
+    with jobs.item(job_id, "B.pdf") as entry:
+        entry["errors"].append("Seite 1: Fehler")
+    snapshot = jobs.snapshot(job_id)
+    assert snapshot["finished"] is None
+
+    jobs.update(job_id, "B.pdf", status="fehler")
+    assert jobs.snapshot(job_id)["finished"] is not None
+    assert snapshot["documents"]["B.pdf"]["errors"] == ["Seite 1: Fehler"]
+
+
+def test_old_finished_jobs_are_forgotten(monkeypatch):
+    jobs = JobRegistry("faecher")
+    old = jobs.create({})
+    monkeypatch.setattr(time, "time", lambda: job_registry.JOB_RETENTION + 1e10)
+
+    jobs.create({"Bio": {"status": "wartend"}})
+
+    assert jobs.snapshot(old) is None
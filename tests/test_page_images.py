@@ -0,0 +1,50 @@
+# tests/test_page_images.py
+import base64
+import io
+
+from PIL import Image
+
+from backend.fach_backup import list_objects
+from backend.flashcard_manager import delete_document, update_flashcards
+from backend.image_derivatives import upload_page_images
+
+
+def _png():
+    out = io.BytesIO()
+    Image.new("RGB", (40, 60), "white").save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_documents_with_dotted_names_keep_separate_images(fach):
+    cards = []
+    for number, name in enumerate(["VL 1.1 Einführung.pdf", "VL 1.2 Vertiefung.pdf"]):
+        images = upload_page_images(fach, name, 1, _png())
+        cards.append({"id": str(number), "upload": name, "question": name, "answer": [], "page": 1,
+                      "images": [images]})
+    assert cards[0]["images"][0]["file"] != cards[1]["images"][0]["file"]
+    update_flashcards(fach, cards)
+
+    delete_document(fach, "VL 1.1 Einführung.pdf")
+
+    images = {path.removeprefix("images/") for path, _ in list_objects(fach) if path.startswith("images/")}
+    assert images == {cards[1]["images"][0][kind] for kind in ("file", "display", "thumb")}
+
+
+def test_backfill_moves_inline_images_to_storage(fach):
+    from backend.flashcard_manager import load_flashcards
+    from backend.image_derivatives import backfill_fach
+
+    inline = base64.b64encode(_png()).decode("ascii")
+    update_flashcards(fach, [
+        {"id": "a", "upload": "Skript.pdf", "question": "A", "answer": [], "page": 1,
+         "images": [{"page": 1, "base64": inline}], "image_base64": inline},
+        {"id": "b", "upload": "Skript.pdf", "question": "B", "answer": [], "page": 2, "image_base64": inline},
+    ])
+
+    assert backfill_fach(fach) == 2
+
+    cards, _ = load_flashcards(fach)
+    for card in cards:
+        assert "image_base64" not in card
+        assert "base64" not in card["images"][0]
+        assert f"images/{card['images'][0]['thumb']}" in {path for path, _ in list_objects(fach)}
@@ -0,0 +1,70 @@
+# tests/test_search_index.py
+from backend import search_index
+from backend.document_store import add_document
+from backend.flashcard_manager import delete_document, load_flashcards, update_flashcards
+from backend.search_index import fold, index_fach, indexed_generation, search
+
+
+def _card(card_id, question, upload="Skript.pdf", answer=("• a",)):
+    return {"id": card_id, "upload": upload, "question": question, "answer": list(answer), "page": 1}
+
+
+def _text_rowids(fach):
+    with search_index._lock:
+        return dict(search_index._get_connection().execute(
+            "SELECT card_id, text_rowid FROM cards WHERE fach = ?", (search_index._to_storage_safe_component(fach),)
+        ).fetchall())
+
+
+def _hits(query, fach):
+    return sorted(hit["card_id"] for hit in search(query, fach))
+
+
+def test_umlauts_and_sharp_s_are_folded():
+    assert fold("Übung") == fold("uebung") == "uebung"
+    assert fold("Straße") == fold("STRASSE") == "strasse"
+
+
+def test_spelled_out_umlauts_find_each_other(fach):
+    update_flashcards(fach, [_card("a", "Übung zur Straße"), _card("b", "Uebung zur Strasse"), _card("c", "Anderes")])
+
+    assert _hits("uebung", fach) == ["a", "b"]
+    assert _hits("Übung", fach) == ["a", "b"]
+    assert _hits("strasse", fach) == ["a", "b"]
+    assert _hits("Straße", fach) == ["a", "b"]
+
+
+def test_update_flashcards_reindexes_only_changed_cards(fach):
+    update_flashcards(fach, [_card("a", "Mitose"), _card("b", "Meiose")])
+    before = _text_rowids(fach)
+
+    cards, generation = load_flashcards(fach)
+    cards[1]["question"] = "Zellteilung"
+    update_flashcards(fach, cards + [_card("c", "Photosynthese")], base_generation=generation)
+    after = _text_rowids(fach)
+
+    assert after["a"] == before["a"]
+    assert _hits("Meiose", fach) == []
+    assert _hits("Zellteilung", fach) == ["b"]
+    assert _hits("Photosynthese", fach) == ["c"]
+    assert indexed_generation(fach) == load_flashcards(fach)[1]
+
+
+def test_delete_document_removes_its_cards(fach):
+    add_document(fach, "Skript.pdf", b"%PDF skript")
+    add_document(fach, "Folien.pdf", b"%PDF folien")
+    update_flashcards(fach, [_card("a", "Enzym", "Skript.pdf"), _card("b", "Enzym", "Folien.pdf")])
+
+    delete_document(fach, "Skript.pdf")
+
+    assert _hits("Enzym", fach) == ["b"]
+    assert set(_text_rowids(fach)) == {"b"}
+
+
+def test_older_generation_is_ignored(fach):
+    index_fach(fach, [_card("a", "Neu")], 5)
+    index_fach(fach, [_card("a", "Alt")], 4)
+
+    assert indexed_generation(fach) == 5
+    assert _hits("Neu", fach) == ["a"]
+    assert _hits("Alt", fach) == []
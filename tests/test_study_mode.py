@@ -0,0 +1,49 @@
+# tests/test_study_mode.py
+from backend import card_replica, search_index
+from backend.fach_manager import delete_fach
+from backend.flashcard_manager import KEEP_GENERATIONS, load_flashcards, update_flashcards
+from backend.study_mode import apply_ratings
+
+
+def test_ratings_from_a_stale_replica_keep_other_changes(fach):
+    update_flashcards(fach, [
+        {"id": "a", "upload": "Skript.pdf", "question": "A", "answer": [], "page": 1, "priority": 2},
+        {"id": "b", "upload": "Skript.pdf", "question": "B", "answer": [], "page": 2, "priority": 2},
+    ])
+    stale_cards, stale_generation = load_flashcards(fach)
+
+    # Another process rates card b and adds card c until this replica's generation is pruned
+    cards, _ = load_flashcards(fach)
+    cards[1]["priority"] = 1
+    update_flashcards(fach, cards + [{"id": "c", "upload": "Skript.pdf", "question": "C", "answer": [], "page": 3}])
+    for _ in range(KEEP_GENERATIONS):
+        update_flashcards(fach, load_flashcards(fach)[0])
+    card_replica.remove_fach(fach)
+    card_replica.apply(fach, stale_cards, stale_generation)
+
+    assert apply_ratings(fach, {"a": 3}) is not None
+
+    cards = {card["id"]: card["priority"] for card in load_flashcards(fach)[0] if "priority" in card}
+    assert cards == {"a": 3, "b": 1}
+    assert {card["id"] for card in load_flashcards(fach)[0]} == {"a", "b", "c"}
+
+
+def test_ratings_after_the_fach_was_recreated_elsewhere(fach):
+    old_cards = [{"id": f"old{number}", "upload": "Alt.pdf", "question": "Alt", "answer": [], "page": 1}
+                 for number in range(3)]
+    for _ in range(3):
+        update_flashcards(fach, old_cards)
+    old_generation = card_replica.replica_generation(fach)
+
+    # Another process deletes the fach and creates it again; this replica and index still hold the old one
+    delete_fach(fach)
+    update_flashcards(fach, [{"id": "new", "upload": "Neu.pdf", "question": "Neu", "answer": [], "page": 1}])
+    card_replica.apply(fach, old_cards, old_generation)
+    search_index.index_fach(fach, old_cards, old_generation)
+
+    apply_ratings(fach, {"old0": 1})
+
+    assert [card["id"] for card in load_flashcards(fach)[0]] == ["new"]
+    assert [card["id"] for card in card_replica.all_cards(fach)] == ["new"]
+    assert search_index.search("Alt", fach) == []
+    assert update_flashcards(fach, old_cards, base_generation=old_generation) is None